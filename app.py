@@ -14,10 +14,15 @@ sys.path.append("./backend")
 
 # Import the Flask application factory
 from backend import create_app
+from utils.storage_janitor import storage_janitor
 
 # Create the app instance
 app = create_app()
 
+# Periodically delete orphaned try-on results and leftover scratch files. Started here, not in
+# create_app(), so one-shot scripts that build the app never sweep storage as a side effect.
+storage_janitor.start(app)
+
 # Register exit hook for graceful shutdow
 @atexit.register
 def goodbye():
@@ -66,6 +66,5 @@ def create_app():
                 print("The database connection is successful:", rs.fetchone())  # (1,)
         except Exception as e:
             print("DB Connection Error:", e)
-    
 
     return app
@@ -32,3 +32,48 @@ class Config:
     SECRET_KEY = os.getenv("SECRET_KEY")
     CORS_HEADERS = "Content-Type"
     CORS_RESOURCES = {r"/*": {"origins": "*"}}
+
+    # Recommendation result cache (per worker)
+    RECOMMEND_CACHE_SIZE = int(os.getenv("RECOMMEND_CACHE_SIZE", 2048))
+    RECOMMEND_CACHE_TTL = int(os.getenv("RECOMMEND_CACHE_TTL", 300))  # seconds
+
+    # Hybrid recommender blend weights (content / collaborative / popularity)
+    HYBRID_WEIGHTS = {
+        "content": float(os.getenv("HYBRID_WEIGHT_CONTENT", 0.5)),
+        "collaborative": float(os.getenv("HYBRID_WEIGHT_COLLABORATIVE", 0.3)),
+        "popularity": float(os.getenv("HYBRID_WEIGHT_POPULARITY", 0.2)),
+    }
+
+    # Persistent try-on worker (scripts/run_tryon_worker.py); unset = spawn app.py per request.
+    # The protocol exchanges pickles, so the worker is only used with an explicit secret authkey.
+    TRYON_WORKER_ADDRESS = os.getenv("TRYON_WORKER_ADDRESS")  # e.g. "127.0.0.1:6001"
+    TRYON_WORKER_AUTHKEY = os.getenv("TRYON_WORKER_AUTHKEY", "").encode()  # required, no default
+    TRYON_WORKER_TIMEOUT = int(os.getenv("TRYON_WORKER_TIMEOUT", 600))  # seconds without progress
+
+    # Try-on job scheduler (utils/tryon_jobs.py), shared by /process_image and /tryon/jobs
+    TRYON_MAX_CONCURRENT = int(os.getenv("TRYON_MAX_CONCURRENT", 1))  # jobs rendering at once
+    TRYON_MAX_QUEUE = int(os.getenv("TRYON_MAX_QUEUE", 16))           # jobs waiting for a slot
+    TRYON_MAX_PER_USER = int(os.getenv("TRYON_MAX_PER_USER", 2))      # jobs queued or running per user
+    TRYON_JOB_TTL = int(os.getenv("TRYON_JOB_TTL", 3600))             # seconds finished jobs are kept
+    TRYON_MAX_BATCH = int(os.getenv("TRYON_MAX_BATCH", 10))           # garments per batch try-on job
+    TRYON_SLOW_JOB_SECONDS = float(os.getenv("TRYON_SLOW_JOB_SECONDS", 60))  # log stage timings above, 0 = off
+
+    # Speculative try-ons after a photo upload (utils/tryon_speculation.py); needs the persistent worker
+    TRYON_SPECULATIVE_ITEMS = int(os.getenv("TRYON_SPECULATIVE_ITEMS", 6))         # garments per upload, 0 = off
+    TRYON_SPECULATIVE_PER_HOUR = int(os.getenv("TRYON_SPECULATIVE_PER_HOUR", 30))  # renders per hour, all users
+    TRYON_SPECULATIVE_IDLE_SECONDS = float(os.getenv("TRYON_SPECULATIVE_IDLE_SECONDS", 5))  # idle before starting
+
+    # Try-on result cache (utils/tryon_cache.py); bump the version when the model or its settings change
+    TRYON_CACHE_MAX_BYTES = int(os.getenv("TRYON_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+    TRYON_MODEL_VERSION = os.getenv("TRYON_MODEL_VERSION", "stableviton-eternal_1024-20steps")
+
+    # Downloaded external garment images (utils/download_utils.py); catalog garments are read in place
+    GARMENT_CACHE_MAX_BYTES = int(os.getenv("GARMENT_CACHE_MAX_BYTES", 256 * 1024 ** 2))
+
+    # Storage janitor (utils/storage_janitor.py): try-on results, scratch and legacy output files
+    STORAGE_USER_QUOTA_BYTES = int(os.getenv("STORAGE_USER_QUOTA_BYTES", 500 * 1024 ** 2))  # unsaved results per user
+    STORAGE_MAX_BYTES = int(os.getenv("STORAGE_MAX_BYTES", 20 * 1024 ** 3))       # everything the janitor manages
+    STORAGE_ORPHAN_TTL = int(os.getenv("STORAGE_ORPHAN_TTL", 86400))             # seconds an unsaved result is kept
+    STORAGE_TEMP_TTL = int(os.getenv("STORAGE_TEMP_TTL", 3600))                  # seconds for scratch/legacy files
+    STORAGE_DELETE_BATCH = int(os.getenv("STORAGE_DELETE_BATCH", 200))           # files deleted per batch
+    STORAGE_SWEEP_INTERVAL = int(os.getenv("STORAGE_SWEEP_INTERVAL", 3600))      # seconds between sweeps, 0 = off
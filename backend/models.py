@@ -10,6 +10,7 @@ These include:
 - Closet: Maps user's favorite clothing items
 - Combination: Represents a saved outfit look created by the user
 - History: Tracks user browsing behavior for personalization
+- UserTaste: Stores each user's decayed taste vector built from browsing history
 
 ORM (Object-Relational Mapping) via SQLAlchemy allows us to treat DB tables as Python classes.
 """
@@ -129,4 +130,15 @@ class History(db.Model):
     created_at = db.Column(db.TIMESTAMP, server_default=db.text('CURRENT_TIMESTAMP'))
 
     def __repr__(self):
-        return f"<History {self.id}, User {self.user_id}, Clothing {self.clothing_id}, {self.created_at}>"
\ No newline at end of file
+        return f"<History {self.id}, User {self.user_id}, Clothing {self.clothing_id}, {self.created_at}>"
+
+# Taste vector (decayed running mean of viewed-item embeddings, stored as float16 bytes)
+class UserTaste(db.Model):
+    __tablename__ = "user_taste"
+    user_id = db.Column(db.Integer, db.ForeignKey('user.user_id', ondelete="CASCADE"), primary_key=True)
+    vector = db.Column(db.LargeBinary, nullable=False)
+    event_count = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.TIMESTAMP, server_default=db.text('CURRENT_TIMESTAMP'), onupdate=db.func.now())
+
+    def __repr__(self):
+        return f"<UserTaste User {self.user_id}, events {self.event_count}>"
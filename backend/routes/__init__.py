@@ -8,6 +8,7 @@ def register_blueprints(app):
     from routes.combination import combinations_bp
     from routes.search import search_bp
     from routes.recommend import recommend_bp
+    from routes.tryon import tryon_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(user_image_bp)
@@ -17,4 +18,5 @@ def register_blueprints(app):
     app.register_blueprint(email_bp)
     app.register_blueprint(combinations_bp)
     app.register_blueprint(search_bp)
-    app.register_blueprint(recommend_bp)
\ No newline at end of file
+    app.register_blueprint(recommend_bp)
+    app.register_blueprint(tryon_bp)
\ No newline at end of file
@@ -20,6 +20,7 @@ from exts import db
 from utils.caption_utils import generate_title
 from utils.helpers import format_image_url
 from utils.static_serve import serve_clothing_image
+from utils.recommend_cache import recommendation_cache
 from flask import Blueprint, request, jsonify
 from models import Clothing, Closet  # Import SQLAlchemy models
 
@@ -170,6 +171,9 @@ def add_to_closet():
         clothing_item.closet_users += 1
         db.session.commit()
 
+        # 5. Cached recommendations for this user are now stale
+        recommendation_cache.invalidate_user(user_id)
+
         return jsonify({"message": "Item added to closet successfully!"}), 201
 
     except Exception as e:
@@ -247,6 +251,7 @@ def remove_from_closet():
                 clothing_item.closet_users -= 1
 
             db.session.commit()
+            recommendation_cache.invalidate_user(user_id)
         
         return jsonify({"message": "Item removed from closet successfully."}), 200
 
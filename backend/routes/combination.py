@@ -9,7 +9,7 @@
 ##     - Saving new outfit combinations (top/bottom/dress + try-on image)
 ##         - Prevents storing duplicate combinations per user
 ##     - Retrieving all combinations saved by a user
-##     - Deleting existing combinations by ID
+##     - Deleting existing combinations by ID (and their try-on image)
 ##     - Serving local try-on result images to frontend
 
 import os
@@ -17,6 +17,7 @@ from flask import send_from_directory
 from flask import Blueprint, request, jsonify
 from exts import db
 from models import Combination
+from utils.storage_janitor import storage_janitor
 from urllib.parse import unquote
 combinations_bp = Blueprint("combinations", __name__)
 
@@ -115,11 +116,13 @@ def delete_combination():
     """
     Delete a saved outfit combination.
 
+    The try-on image is deleted too, unless another saved combination of the user uses it.
+
     Request JSON:
         - id (int): ID of the combination to delete
 
     Returns:
-        JSON: Success or error message
+        JSON: Success or error message, with the bytes reclaimed on disk
     """
     data = request.get_json()
     combination_id = data.get("id")
@@ -132,9 +135,10 @@ def delete_combination():
         if not combination:
             return jsonify({"error": "Combination not found"}), 404
 
+        reclaimed = storage_janitor.remove_outfit(combination)
         db.session.delete(combination)
         db.session.commit()
-        return jsonify({"message": "Combination deleted successfully."}), 200
+        return jsonify({"message": "Combination deleted successfully.", "reclaimed_bytes": reclaimed}), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
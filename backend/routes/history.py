@@ -7,15 +7,20 @@ This module provides RESTful API endpoints for managing user browsing history in
 Features:
     - Add a clothing item to browsing history.
     - Maintain only the latest 20 records per user.
+    - Fold each view into the user's taste vector for content-based recommendation.
     - Retrieve history with clothing details (title, image, timestamp, etc.).
 """
 
 import json
 from exts import db
-from models import History, Clothing
+from models import History, Clothing, UserTaste
 from flask import Blueprint, request, jsonify
 from utils.caption_utils import generate_title
 from utils.helpers import format_image_url
+from utils.minhash_lsh import user_history_index
+from utils.catalog_index import get_catalog_index
+from utils.taste_vectors import pack_vector, unpack_vector, update_taste
+from utils.recommend_cache import recommendation_cache
 from sqlalchemy import desc
 
 # Create a blueprint for history-related operations
@@ -62,10 +67,20 @@ def add_history():
             .offset(20)
             .all()
         )
+        evicted_ids = [record.clothing_id for record in history_to_delete]
         for record in history_to_delete:
             db.session.delete(record)
 
         db.session.commit()
+
+        # Step 4: Keep the similar-user LSH index in step with the new history set
+        user_history_index.record_view(user_id, clothing_id, evicted_ids)
+
+        # Step 5: Move the user's taste vector towards the viewed item
+        update_user_taste(user_id, clothing_id)
+
+        # Step 6: Cached recommendations for this user are now stale
+        recommendation_cache.invalidate_user(user_id)
         return jsonify({"message": "History recorded successfully."}), 201
 
     except Exception as e:
@@ -73,6 +88,35 @@ def add_history():
         print("Error in add_history:", e)
         return jsonify({"error": str(e)}), 500
 
+def update_user_taste(user_id, clothing_id):
+    """
+    Fold the embedding of a viewed item into the user's persisted taste vector.
+
+    Items without an embedding are skipped; failures are logged and never fail the
+    history write itself.
+    """
+    try:
+        index = get_catalog_index(db.session)
+        row = index.row_for_cid(clothing_id) if index is not None else None
+        if row is None:
+            return
+
+        taste = UserTaste.query.get(user_id)
+        if taste is None:
+            taste = UserTaste(user_id=user_id, event_count=0)
+            db.session.add(taste)
+            vector = None
+        else:
+            vector = unpack_vector(taste.vector)
+
+        taste.vector = pack_vector(update_taste(vector, taste.event_count, index.normalized[row]))
+        taste.event_count += 1
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print("Error in update_user_taste:", e)
+
+
 @history_bp.route("/get-history", methods=["GET"])
 def get_history():
     """
@@ -24,16 +24,14 @@
 # modified by Zixin Ding
 import sys
 from flask import Blueprint, request, jsonify, current_app
-import os
-import time
-import shutil
 from backend.utils.static_serve import serve_user_image
 from exts import db
-from models import User, Clothing, Closet
 from pathlib import Path
-from utils.download_utils import download_cloth_image
-from utils.image_utils import delete_user_image_if_exists, get_user_image_path, save_user_image, rename_output_image
-from utils.stableviton_runner import run_stableviton
+from utils.tryon_jobs import FAILED, QueueFullError, job_store, tryon_scheduler
+from utils.tryon_metrics import StageTimings, recording
+from utils.tryon_pipeline import (
+    TryOnError, cached_tryon, garment_cache_key, resolve_garment_url, resolve_user_image, run_tryon
+)
 
 # Define the path to the StableVITON model directory
 stableviton_path = Path(__file__).resolve().parent.parent / "models" / "StableVITON"
@@ -77,60 +75,39 @@ def process_image():
     user_id = data.get("user_id")
     cloth_url = data.get("cloth_url")
     item_category = data.get("item_category")
-    
-    # Lookup user and image path
-    user = User.query.get(user_id)
-    if not user or not user.image_path:
-        return jsonify({"error": "User image not found"}), 404
-
-    # Load the full path to the user's image
-    image_url = get_user_image_path(user)
-    if not os.path.exists(image_url):
-        return jsonify({"error": "Image file not found on disk"}), 404
-
-    print(f"Using image for processing: {image_url}")
-    
-
-    # Prepare directory to save downloaded clothing
-    closet = Closet.query.get(item_id)
-    if closet:
-        cloth = Clothing.query.get(closet.clothing_id)
-        if cloth:
-            cloth_url = cloth.cloth_path
-            print(f"clothing from closet: {cloth_url}")
-    
-    input_cloth_path = "./store_data/input_clothes/"+str(user_id)
-    os.makedirs(input_cloth_path, exist_ok=True) #create the input directory
-    cloth_name = str(user_id)+str(time.time())+".jpg"
-    save_path = os.path.join(input_cloth_path, cloth_name)
-    download_cloth_image(cloth_url, save_path)
-    
-    # Download clothing image from Clothing DB query
-    cloth_url = f"./store_data/input_clothes/{str(user_id)}/{cloth_name}"
-    print(f"Cloth path saved to: {cloth_url}")
-
-
-    # Call StableVITON model for try-on generation
+
+    # Lookup user image and clothing, download the clothing and run StableVITON
+    # (the same steps as the asynchronous /tryon/jobs API, see utils/tryon_pipeline.py)
+    # A previous result for the same photo and garment is returned from the try-on cache
+    # Every step is timed; the response reports the seconds spent per stage
+    timings = StageTimings()
+    try:
+        with recording(timings):
+            image_url = resolve_user_image(user_id)
+            cloth_url, clothing_id = resolve_garment_url(item_id, cloth_url)
+            if clothing_id is not None:
+                new_name = cached_tryon(user_id, image_url, garment_cache_key(clothing_id), item_category)
+                if new_name:
+                    return jsonify({"message": "success", "image_path": new_name, "cached": True,
+                                    "timings": timings.to_dict()})
+    except TryOnError as e:
+        return jsonify({"error": str(e)}), e.status
+
+    def run(job):
+        new_name, cached = run_tryon(user_id, image_url, cloth_url, clothing_id, item_category)
+        return {"image_path": new_name, "cached": cached}
+
+    # The model run takes a scheduler slot like any try-on job; when the queue is full
+    # the request is refused at once instead of piling another model run onto the GPU
     try:
-        run_stableviton(image_url, cloth_url, item_category)
-    except RuntimeError as e:
-        return jsonify({"error": str(e)}), 500
-
-    # Prepare output image
-    gene_image_path = stableviton_path / "output_images"
-    output_dir = f"./data/combinations/user_{user_id}"
-    os.makedirs(output_dir, exist_ok=True)
-    
-    print(f"Gene image path: {gene_image_path}")
-    print(f"Output directory: {output_dir}")
-    
-    files = [f for f in os.listdir(gene_image_path) if f.endswith('.jpg')]
-    if not files:
-        return jsonify({"error": "No image found"}), 500
-
-    new_name = rename_output_image(gene_image_path)
-    last = sorted(files)[-1]
-    shutil.copy(os.path.join(gene_image_path, last), os.path.join(output_dir, new_name))
+        job = tryon_scheduler.submit(user_id, run, timings=timings)
+    except QueueFullError as e:
+        return (jsonify({"error": str(e), "retry_after": e.retry_after}), 429,
+                {"Retry-After": str(e.retry_after)})
+    job_store.wait_finished(job)
+    if job.status == FAILED:
+        return jsonify({"error": job.error}), job.error_status
+    new_name, cached = job.image_path, job.cached
 
     # #TODO: add the top_id/bottom_id/dress_id to the database---> in future work
     # new_combination = Combination(
@@ -140,13 +117,11 @@ def process_image():
     # db.session.add(new_combination)
     # db.session.commit()
 
-    # Compose final output path
-    relative_output_path = f"./data/combinations/user_{user_id}/{new_name}"
-    print(f"Final output path: {relative_output_path}")
-
     return jsonify({
         "message": "success",
         "image_path": new_name,
+        "cached": cached,
+        "timings": job.timings.to_dict(),
     })
 
 
@@ -1,29 +1,25 @@
 # Author: Jinghao Liu, Zihan Zhou
 import os
 import numpy as np
-import pandas as pd
 from flask import Blueprint, request, jsonify, send_from_directory
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import func
-from models import Clothing, History
+from models import Clothing, Closet, History, UserTaste
 from exts import db
 from utils.helpers import format_image_url
+from utils.minhash_lsh import user_history_index
+from utils.catalog_index import add_reload_listener, get_catalog_index
+from utils.taste_vectors import unpack_vector
+from utils.recommend_cache import recommendation_cache
+from utils.hybrid_recommender import blend_top_rows, collaborative_scores, content_scores, popularity_signal
+from utils.diversity import MMR_LAMBDA, mmr_pool_size, mmr_rerank, parse_mmr_lambda
+from utils.complete_look import COMPLEMENTARY_CATEGORY, complete_look_lists
+from config import Config
 
 recommend_bp = Blueprint("recommend", __name__)
 
-# Set base directory for consistent file paths
-BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-
-# Load similarity matrix
-try:
-    image_embeddings = np.load(os.path.join(BASE_DIR, "image_embeddings.npy"))
-    similarity_matrix = np.load(os.path.join(BASE_DIR, "similarity_matrix.npy"))
-    image_names = [f"{i:06d}_top.jpg" for i in range(1, 301)] + \
-                  [f"{i:06d}_bottom.jpg" for i in range(1, 301)] + \
-                  [f"{i:06d}_dress.jpg" for i in range(1, 301)]
-    image_similarity_df = pd.DataFrame(similarity_matrix, index=image_names, columns=image_names)
-except Exception as e:
-    image_similarity_df = pd.DataFrame()
+# Cached results refer to catalog rows, so drop them whenever a new index is swapped in
+add_reload_listener(recommendation_cache.clear)
 
 # 1. Similarity-based recommendation
 @recommend_bp.route('/recommend/<int:clothing_id>', methods=['GET'])
@@ -36,11 +32,27 @@ def recommend_images(clothing_id):
 
         Query Parameters:
             top_n (int, optional): Number of top similar items to return (default=3).
+            diversify (str, optional): "mmr" to re-rank a larger neighbour pool for diversity.
+            mmr_lambda (float, optional): Relevance/diversity trade-off for MMR (default=0.7),
+                clamped to [0, 1].
 
         Returns:
             JSON: A list of recommended clothing items with ID and image URL.
         """
-    top_n = int(request.args.get("top_n", 3))
+    diversify = request.args.get("diversify")
+    try:
+        top_n = int(request.args.get("top_n", 3))
+        mmr_lambda = parse_mmr_lambda(request.args.get("mmr_lambda", MMR_LAMBDA))
+    except (TypeError, ValueError):
+        return jsonify({"error": "top_n must be an integer and mmr_lambda a number"}), 400
+    if diversify == "mmr":
+        return recommend_diverse(clothing_id, top_n, mmr_lambda)
+
+    cache_key = ("similar", clothing_id, top_n)
+    cached = recommendation_cache.get(cache_key)
+    if cached is not None:
+        return jsonify(cached), 200
+
     Session = sessionmaker(bind=db.engine)
     session = Session()
     try:
@@ -51,29 +63,154 @@ def recommend_images(clothing_id):
         if not clothing:
             return jsonify({"error": "Clothing item not found"}), 404
 
-        image_name = os.path.basename(clothing.cloth_path)
-        if image_name not in image_similarity_df.index:
+        # Rows come from the live catalog index, so newly ingested items are found too
+        index = get_catalog_index(session)
+        row = index.row_for_cid(clothing_id) if index is not None else None
+        if row is None:
             return jsonify({"error": "Image not found in similarity matrix"}), 404
 
-        similar_image_names = image_similarity_df[image_name].nlargest(top_n + 1).iloc[1:].index.tolist()
-
-        # fix cloth_path here using same logic as stored in DB
-        similar_images = [
-            os.path.join(os.path.dirname(clothing.cloth_path), name).replace("\\", "/")
-            for name in similar_image_names
-        ]
-        print(f"Resolved similar image full paths: {similar_images}")
+        neighbours, _ = index.nearest_rows([row], top_n)
+        similar_ids = [int(index.cid_of_row[r]) for r in neighbours[0] if r >= 0]
 
-        recommended_items = session.query(Clothing).filter(Clothing.cloth_path.in_(similar_images)).all()
+        items = session.query(Clothing).filter(Clothing.cid.in_(similar_ids)).all()
+        clothing_dict = {item.cid: item for item in items}
+        recommended_items = [clothing_dict[cid] for cid in similar_ids if cid in clothing_dict]
         print(f"Recommended clothing items: {[item.cid for item in recommended_items]}")
 
         # edit by peinishe: add clothing img url for frontend display
-        return jsonify({
+        payload = {
             # "recommended_clothing_ids": [item.cid for item in recommended_items]
             "recommendations": [
                 {"id": item.cid, "url": format_image_url(item.cloth_path)}
                 for item in recommended_items
             ]
+        }
+        recommendation_cache.set(cache_key, payload)
+        return jsonify(payload), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        session.close()
+
+def recommend_diverse(clothing_id, top_n, mmr_lambda):
+    """
+    MMR variant of `recommend_images`: fetch a wider neighbour pool from the similarity
+    matrix and greedily pick items that are similar to the seed but not to each other.
+    """
+    cache_key = ("similar-mmr", clothing_id, top_n, mmr_lambda)
+    cached = recommendation_cache.get(cache_key)
+    if cached is not None:
+        return jsonify(cached), 200
+
+    Session = sessionmaker(bind=db.engine)
+    session = Session()
+    try:
+        index = get_catalog_index(session)
+        if index is None:
+            return jsonify({"error": "Embeddings are not loaded"}), 500
+        row = index.row_for_cid(clothing_id)
+        if row is None:
+            return jsonify({"error": "Image not found in similarity matrix"}), 404
+
+        neighbours, scores = index.nearest_rows([row], mmr_pool_size(top_n))
+        valid = neighbours[0] >= 0
+        pool_rows, pool_scores = neighbours[0][valid], scores[0][valid]
+        order = mmr_rerank(pool_scores, index.normalized[pool_rows], top_n, mmr_lambda)
+        ranked_ids = [int(index.cid_of_row[r]) for r in pool_rows[order]]
+
+        items = session.query(Clothing).filter(Clothing.cid.in_(ranked_ids)).all()
+        clothing_dict = {item.cid: item for item in items}
+        payload = {
+            "recommendations": [
+                {"id": cid, "url": format_image_url(clothing_dict[cid].cloth_path)}
+                for cid in ranked_ids if cid in clothing_dict
+            ]
+        }
+        recommendation_cache.set(cache_key, payload)
+        return jsonify(payload), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        session.close()
+
+# 1b. Batch similarity-based recommendation for many seed items
+MAX_BATCH_SEEDS = 100
+
+@recommend_bp.route('/recommend/batch', methods=['POST'])
+def recommend_batch():
+    """
+        Recommend similar clothing items for several seed items in one request.
+
+        Neighbours for all seeds come from one vectorized lookup on the similarity matrix
+        and are hydrated with a single Clothing query.
+
+        Request Body (JSON):
+            clothing_ids (list[int]): Seed clothing IDs (at most MAX_BATCH_SEEDS).
+            top_n (int, optional): Number of similar items per seed (default=3).
+            dedupe (bool, optional): If true, never recommend a seed item or the same item
+                                     under two seeds; earlier seeds win (default=false).
+
+        Returns:
+            JSON: One entry per seed with its recommendations, plus the seeds that are
+                  not in the similarity matrix.
+        """
+    data = request.get_json(silent=True) or {}
+    clothing_ids = data.get("clothing_ids")
+    if not isinstance(clothing_ids, list) or not clothing_ids:
+        return jsonify({"error": "clothing_ids must be a non-empty list"}), 400
+    if len(clothing_ids) > MAX_BATCH_SEEDS:
+        return jsonify({"error": f"At most {MAX_BATCH_SEEDS} clothing_ids per request"}), 400
+    try:
+        seed_ids = list(dict.fromkeys(int(c) for c in clothing_ids))
+        top_n = int(data.get("top_n", 3))
+    except (TypeError, ValueError):
+        return jsonify({"error": "clothing_ids and top_n must be integers"}), 400
+    dedupe = bool(data.get("dedupe", False))
+
+    Session = sessionmaker(bind=db.engine)
+    session = Session()
+    try:
+        index = get_catalog_index(session)
+        if index is None:
+            return jsonify({"error": "Embeddings are not loaded"}), 500
+
+        seed_cids, missing = [], []
+        for cid in seed_ids:
+            (seed_cids if index.row_for_cid(cid) is not None else missing).append(cid)
+        seed_rows = index.rows_for_cids(seed_cids)
+
+        # Deduplication may skip up to top_n items per earlier seed, so widen the pool
+        pool = top_n * len(seed_rows) if dedupe else top_n
+        neighbours, _ = index.nearest_rows(seed_rows, pool, exclude_rows=seed_rows if dedupe else ())
+
+        picked_by_seed, taken = [], set()
+        for row_neighbours in neighbours.tolist():
+            picked = []
+            for row in row_neighbours:
+                if row < 0 or len(picked) == top_n:
+                    break
+                if dedupe and row in taken:
+                    continue
+                picked.append(row)
+            if dedupe:
+                taken.update(picked)
+            picked_by_seed.append([int(index.cid_of_row[row]) for row in picked])
+
+        all_ids = {cid for picked in picked_by_seed for cid in picked}
+        items = session.query(Clothing).filter(Clothing.cid.in_(all_ids)).all() if all_ids else []
+        clothing_dict = {item.cid: item for item in items}
+
+        return jsonify({
+            "results": [
+                {
+                    "clothing_id": seed_cid,
+                    "recommendations": [
+                        {"id": cid, "url": format_image_url(clothing_dict[cid].cloth_path)}
+                        for cid in picked if cid in clothing_dict
+                    ]
+                } for seed_cid, picked in zip(seed_cids, picked_by_seed)
+            ],
+            "not_found": missing
         }), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -121,6 +258,14 @@ def recommend_popular():
     finally:
         session.close()
 
+def sync_user_history_index(session, user_id, clicked_ids):
+    """
+    Make sure the similar-user LSH index is built and holds the user's current history set.
+    """
+    user_history_index.refresh(lambda: session.query(History.user_id, History.clothing_id))
+    if user_history_index.items_of(user_id) != set(clicked_ids):
+        user_history_index.update_user(user_id, clicked_ids)
+
 # 3. User-based collaborative filtering
 @recommend_bp.route('/recommend/user/<int:user_id>', methods=['GET'])
 def recommend_by_user(user_id):
@@ -137,6 +282,11 @@ def recommend_by_user(user_id):
             JSON: A list of personalized recommendations including ID, category, and image URL.
         """
     top_n = int(request.args.get("top_n", 5))
+    cache_key = ("user", user_id, top_n)
+    cached = recommendation_cache.get(cache_key)
+    if cached is not None:
+        return jsonify(cached), 200
+
     Session = sessionmaker(bind=db.engine)
     session = Session()
     try:
@@ -144,13 +294,9 @@ def recommend_by_user(user_id):
         user_clicked_ids = [row.clothing_id for row in user_history]
         if not user_clicked_ids:
             return jsonify({"error": "No history found for this user."}), 404
-        similar_users = (
-            session.query(History.user_id)
-            .filter(History.clothing_id.in_(user_clicked_ids), History.user_id != user_id)
-            .distinct()
-            .all()
-        )
-        similar_user_ids = [u.user_id for u in similar_users]
+        # Neighbour users come from the MinHash LSH index instead of an exact overlap scan
+        sync_user_history_index(session, user_id, user_clicked_ids)
+        similar_user_ids = user_history_index.similar_users(user_id)
         if not similar_user_ids:
             return jsonify({"message": "No similar users found."}), 200
         candidate_items = (
@@ -163,7 +309,7 @@ def recommend_by_user(user_id):
         )
         candidate_ids = [c.clothing_id for c in candidate_items]
         recommended_items = session.query(Clothing).filter(Clothing.cid.in_(candidate_ids)).all()
-        return jsonify({
+        payload = {
             "personalized_recommendations": [
                 {
                     "id": item.cid,
@@ -171,6 +317,203 @@ def recommend_by_user(user_id):
                     "url": format_image_url(item.cloth_path)
                 } for item in recommended_items
             ]
+        }
+        recommendation_cache.set(cache_key, payload, user_id=user_id)
+        return jsonify(payload), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        session.close()
+
+# 4. Content-based recommendation from the user's taste vector
+@recommend_bp.route('/recommend/for-you/<int:user_id>', methods=['GET'])
+def recommend_for_you(user_id):
+    """
+        Recommend clothing items close to the user's taste vector (decayed mean of viewed-item embeddings).
+
+        Path Parameters:
+            user_id (int): The ID of the current user.
+
+        Query Parameters:
+            top_n (int, optional): Number of recommended items to return (default=5).
+
+        Returns:
+            JSON: A list of recommended items with ID, category, image URL and score,
+                  excluding items already in the user's history.
+        """
+    top_n = int(request.args.get("top_n", 5))
+    cache_key = ("for-you", user_id, top_n)
+    cached = recommendation_cache.get(cache_key)
+    if cached is not None:
+        return jsonify(cached), 200
+
+    Session = sessionmaker(bind=db.engine)
+    session = Session()
+    try:
+        taste = session.query(UserTaste).filter(UserTaste.user_id == user_id).first()
+        if not taste:
+            return jsonify({"error": "No taste profile found for this user."}), 404
+
+        index = get_catalog_index(session)
+        if index is None:
+            return jsonify({"error": "Embeddings are not loaded"}), 500
+        vector = unpack_vector(taste.vector)
+        if vector.shape[0] != index.dim:
+            return jsonify({"error": "Taste profile does not match the embedding index"}), 500
+
+        # One matvec ranks the whole catalog; recently viewed items are masked out
+        seen_ids = [row.clothing_id for row in session.query(History.clothing_id).filter(History.user_id == user_id)]
+        scores = index.normalized @ vector
+        top_rows = index.top_rows(scores, top_n, exclude_rows=index.rows_for_cids(seen_ids))
+        ranked = [(int(index.cid_of_row[row]), float(scores[row])) for row in top_rows]
+
+        items = session.query(Clothing).filter(Clothing.cid.in_([cid for cid, _ in ranked])).all()
+        clothing_dict = {item.cid: item for item in items}
+        payload = {
+            "for_you_recommendations": [
+                {
+                    "id": cid,
+                    "category": clothing_dict[cid].category,
+                    "url": format_image_url(clothing_dict[cid].cloth_path),
+                    "score": round(score, 4)
+                } for cid, score in ranked if cid in clothing_dict
+            ]
+        }
+        recommendation_cache.set(cache_key, payload, user_id=user_id)
+        return jsonify(payload), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        session.close()
+
+# 5. Hybrid recommendation blending content, collaborative and popularity signals
+@recommend_bp.route('/recommend/hybrid/<int:user_id>', methods=['GET'])
+def recommend_hybrid(user_id):
+    """
+        Recommend clothing items by blending content, collaborative and popularity scores.
+
+        Each signal is a dense score vector over the catalog, scaled to [0, 1] and blended
+        with configurable weights; items already viewed or in the user's closet are masked out.
+
+        Path Parameters:
+            user_id (int): The ID of the current user.
+
+        Query Parameters:
+            top_n (int, optional): Number of recommended items to return (default=5).
+            w_content (float, optional): Weight of the taste-vector signal.
+            w_collaborative (float, optional): Weight of the similar-users signal.
+            w_popularity (float, optional): Weight of the global popularity signal.
+            (Weights default to Config.HYBRID_WEIGHTS.)
+
+        Returns:
+            JSON: A list of recommended items with ID, category, image URL and blended score.
+        """
+    top_n = int(request.args.get("top_n", 5))
+    weights = {
+        name: float(request.args.get(f"w_{name}", default))
+        for name, default in Config.HYBRID_WEIGHTS.items()
+    }
+    cache_key = ("hybrid", user_id, top_n, tuple(sorted(weights.items())))
+    cached = recommendation_cache.get(cache_key)
+    if cached is not None:
+        return jsonify(cached), 200
+
+    Session = sessionmaker(bind=db.engine)
+    session = Session()
+    try:
+        index = get_catalog_index(session)
+        if index is None:
+            return jsonify({"error": "Embeddings are not loaded"}), 500
+
+        seen_ids = [row.clothing_id for row in session.query(History.clothing_id).filter(History.user_id == user_id)]
+        closet_ids = [row.clothing_id for row in session.query(Closet.clothing_id).filter(Closet.user_id == user_id)]
+        seen_rows = index.rows_for_cids(seen_ids)
+
+        signals = {}
+        if weights["content"]:
+            taste = session.query(UserTaste).filter(UserTaste.user_id == user_id).first()
+            taste_vector = unpack_vector(taste.vector) if taste else None
+            signals["content"] = content_scores(index, taste_vector, seed_rows=seen_rows)
+        if weights["collaborative"] and seen_ids:
+            sync_user_history_index(session, user_id, seen_ids)
+            signals["collaborative"] = collaborative_scores(index, user_history_index.neighbour_histories(user_id))
+        if weights["popularity"]:
+            signals["popularity"] = popularity_signal.get(index, lambda: (
+                session.query(History.clothing_id, func.count(History.clothing_id))
+                .group_by(History.clothing_id)
+                .all()
+            ))
+
+        exclude_rows = np.union1d(seen_rows, index.rows_for_cids(closet_ids))
+        top_rows, top_scores = blend_top_rows(index, signals, weights, exclude_rows, top_n)
+        ranked = [(int(index.cid_of_row[row]), float(score)) for row, score in zip(top_rows, top_scores)]
+
+        items = session.query(Clothing).filter(Clothing.cid.in_([cid for cid, _ in ranked])).all()
+        clothing_dict = {item.cid: item for item in items}
+        payload = {
+            "hybrid_recommendations": [
+                {
+                    "id": cid,
+                    "category": clothing_dict[cid].category,
+                    "url": format_image_url(clothing_dict[cid].cloth_path),
+                    "score": round(score, 4)
+                } for cid, score in ranked if cid in clothing_dict
+            ]
+        }
+        recommendation_cache.set(cache_key, payload, user_id=user_id)
+        return jsonify(payload), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        session.close()
+
+# 6. "Complete the look" cross-category recommendation
+@recommend_bp.route('/recommend/complete/<int:clothing_id>', methods=['GET'])
+def recommend_complete_look(clothing_id):
+    """
+        Recommend items from the complementary category (bottoms for a top, tops for a bottom).
+
+        Lists are precomputed by `scripts/precompute_complete_look.py` from the outfits users
+        saved in the Combination table, backed off to CLIP embedding similarity.
+
+        Path Parameters:
+            clothing_id (int): The ID of the top or bottom to complete.
+
+        Query Parameters:
+            top_n (int, optional): Number of items to return (default=5).
+
+        Returns:
+            JSON: The target category and a list of items with ID, category, image URL and score.
+        """
+    top_n = int(request.args.get("top_n", 5))
+    Session = sessionmaker(bind=db.engine)
+    session = Session()
+    try:
+        clothing = session.query(Clothing).filter(Clothing.cid == clothing_id).first()
+        if not clothing:
+            return jsonify({"error": "Clothing item not found"}), 404
+        target_category = COMPLEMENTARY_CATEGORY.get(clothing.category)
+        if target_category is None:
+            return jsonify({"message": f"No complementary category for {clothing.category}.",
+                            "complete_the_look": []}), 200
+
+        lists = complete_look_lists.get(clothing_id, top_n)
+        if lists is None:
+            return jsonify({"error": "No complete-the-look data for this item"}), 404
+        ids, scores = lists
+
+        items = session.query(Clothing).filter(Clothing.cid.in_(ids)).all()
+        clothing_dict = {item.cid: item for item in items}
+        return jsonify({
+            "category": target_category,
+            "complete_the_look": [
+                {
+                    "id": cid,
+                    "category": clothing_dict[cid].category,
+                    "url": format_image_url(clothing_dict[cid].cloth_path),
+                    "score": round(score, 4)
+                } for cid, score in zip(ids, scores) if cid in clothing_dict
+            ]
         }), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -11,6 +11,8 @@ from transformers import CLIPProcessor, CLIPModel
 from backend.utils.helpers import format_image_url
 from backend.utils.caption_utils import generate_title
 from backend.utils.static_serve import serve_clothing_image
+from backend.utils.diversity import MMR_LAMBDA, mmr_pool_size, mmr_rerank, parse_mmr_lambda
+from backend.utils.catalog_index import get_catalog_index
 from models import Clothing
 from exts import db
 
@@ -19,13 +21,8 @@ search_bp = Blueprint("search", __name__)
 
 # Set base directory for consistent file paths
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-# Load precomputed embeddings and similarity matrix
-try:
-    image_embeddings = np.load(os.path.join(BASE_DIR, "image_embeddings.npy"))
-    similarity_matrix = np.load(os.path.join(BASE_DIR, "similarity_matrix.npy"))
-except Exception as e:
-    print(f"[SearchBP] Error loading embeddings: {str(e)}")
-    image_embeddings, similarity_matrix = None, None
+# Precomputed embeddings come from the shared catalog index (utils/catalog_index.py),
+# which also picks up newly ingested items without a restart.
 
 # Load CLIP model
 local_model_path = os.path.join(BASE_DIR, "models", "clip-vit-large-patch14")
@@ -56,15 +53,23 @@ def text_embedding(text):
     text_cache[text] = embedding.cpu().numpy()
     return text_cache[text]
 
-def calculate_similarity(query):
+def calculate_similarity(query, index):
     query_embedding = text_embedding(query).squeeze()
-    image_norms = np.linalg.norm(image_embeddings, axis=1)
     query_norm = np.linalg.norm(query_embedding)
-    denom = image_norms * query_norm
-    denom[denom == 0] = 1e-6  # Prevent division by zero
-    similarity_scores = np.dot(image_embeddings, query_embedding) / denom
+    if query_norm == 0:
+        query_norm = 1e-6  # Prevent division by zero
+    similarity_scores = index.normalized @ (query_embedding / query_norm).astype(np.float32)
     return similarity_scores
 
+def diverse_top_rows(index, similarity_scores, top_n, mmr_lambda):
+    """
+    Take a plain top-k pool of the query scores and re-rank it with MMR over the
+    normalized image embeddings.
+    """
+    pool = index.top_rows(similarity_scores, mmr_pool_size(top_n))
+    order = mmr_rerank(similarity_scores[pool], index.normalized[pool], top_n, mmr_lambda)
+    return pool[order]
+
 
 @search_bp.route('/data/clothes/<path:filename>')
 def get_clothing_image(filename):
@@ -88,44 +93,61 @@ def search():
     Query Parameters:
         query (str): Required search query text
         top_n (int): Number of results to return (default: 20)
+        diversify (str): "mmr" to re-rank a larger candidate pool for diversity (optional)
+        mmr_lambda (float): Relevance/diversity trade-off for MMR (default: 0.7)
     
     Returns:
         JSON: A list of matched clothing items with metadata
 
     Errors:
-        400: If the query is missing.
+        400: If the query is missing or top_n / mmr_lambda are not numbers.
         500: If there is an error in similarity computation or database query.
 
     """
 
     query = request.args.get('query')
-    top_n = int(request.args.get('top_n', 20))
+    diversify = request.args.get('diversify')
 
     if not query:
         return jsonify({"error": "Query parameter is required"}), 400
-
     try:
-        similarity_scores = calculate_similarity(query)
-        top_indices = similarity_scores.argsort()[-top_n:][::-1]
-    except Exception as e:
-        return abort(500, description=f"Error processing query: {str(e)}")
+        top_n = int(request.args.get('top_n', 20))
+        mmr_lambda = parse_mmr_lambda(request.args.get('mmr_lambda', MMR_LAMBDA))
+    except (TypeError, ValueError):
+        return jsonify({"error": "top_n must be an integer and mmr_lambda a number"}), 400
 
     Session = sessionmaker(bind=db.engine)
     session = Session()
 
     try:
-        # Get matched items from database
-        items = []
-        for idx in top_indices:
-            clothing = session.query(Clothing).filter(Clothing.cid == idx + 1).first()
-            if clothing:
-                items.append({
-                    "id": clothing.cid,
-                    "title": generate_title(clothing.caption),
-                    "category": clothing.category,
-                    "image_path": format_image_url(clothing.cloth_path),
-                    "closet_users": clothing.closet_users
-                })
+        try:
+            index = get_catalog_index(session)
+            if index is None:
+                raise RuntimeError("Embeddings are not loaded.")
+            similarity_scores = calculate_similarity(query, index)
+            if diversify == "mmr":
+                top_rows = diverse_top_rows(index, similarity_scores, top_n, mmr_lambda)
+            else:
+                top_rows = index.top_rows(similarity_scores, top_n)
+        except Exception as e:
+            return abort(500, description=f"Error processing query: {str(e)}")
+
+        # Get matched items from database in one query, keeping the ranking order
+        ranked_ids = [int(index.cid_of_row[row]) for row in top_rows]
+        clothing_dict = {
+            clothing.cid: clothing
+            for clothing in session.query(Clothing).filter(Clothing.cid.in_(ranked_ids)).all()
+        }
+        items = [
+            {
+                "id": clothing.cid,
+                "title": generate_title(clothing.caption),
+                "category": clothing.category,
+                "image_path": format_image_url(clothing.cloth_path),
+                "closet_users": clothing.closet_users
+            }
+            for clothing in (clothing_dict.get(cid) for cid in ranked_ids) if clothing
+        ]
         if not items:
             return jsonify({"message": "No matching items found", "items": []})
     finally:
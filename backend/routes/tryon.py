@@ -0,0 +1,356 @@
+###############################################
+# Module: tryon.py
+# Author: OVDR Team
+# Description:
+#   Asynchronous virtual try-on jobs. Instead of holding a request open for the whole
+#   StableVITON run (as /process_image does), a job is queued and the client polls for it.
+#
+# Usage:
+#   POST /tryon/jobs with {user_id, item_id, cloth_url, item_category, quality}
+#       -> 202 {"job_id": ..., "status": "queued", "preview_url": ...}
+#          preview_url is the catalog's model try-on image, to show until the job is done
+#   POST /tryon/jobs/batch with {user_id, cids: [...]}
+#       -> 202 {"job_id": ..., "status": "queued"}; one result per garment when done
+#   POST /tryon/jobs/outfit with {user_id, top_id, bottom_id}
+#       -> 202 {"job_id": ..., "status": "queued"}; one image wearing both garments when done
+#   GET  /tryon/jobs/<job_id>
+#       -> {"status": "queued" | "running" | "done" | "failed", "image_path": ..., ...}
+#   GET  /tryon/jobs/stream?ids=<id>,<id>
+#       -> text/event-stream of job updates for several jobs over one connection
+#   GET  /tryon/metrics[?format=prometheus]
+#       -> duration histograms of the pipeline stages, scheduler, cache and storage state
+#
+# The cheap lookups (user image, closet item) run in the request; the download and the
+# model run happen on the scheduler threads in utils/tryon_jobs.py.
+###############################################
+
+import json
+import time
+
+from flask import Blueprint, Response, request, jsonify
+from utils.tryon_jobs import QueueFullError, job_store, tryon_scheduler
+from config import Config
+from models import Clothing
+from utils.tryon_backends import QUALITY_TIERS
+from utils.storage_janitor import storage_janitor
+from utils.tryon_cache import tryon_result_cache
+from utils.tryon_metrics import StageTimings, recording, tryon_metrics
+from utils.tryon_pipeline import (
+    TryOnError, cached_outfit, cached_tryon, catalog_preview_url, find_cached_tryon, garment_cache_key,
+    publish_result, resolve_garment_url, resolve_user_image, run_outfit, run_tryon, run_tryon_batch
+)
+
+tryon_bp = Blueprint("tryon", __name__)
+
+MAX_STREAM_JOBS = 20      # jobs one stream connection may follow
+HEARTBEAT_INTERVAL = 15   # seconds between keep-alive comments on an idle stream
+STREAM_TIMEOUT = 600      # seconds before the server closes a stream (EventSource reconnects)
+
+
+def busy_response(error):
+    """
+    429 answer for a job the scheduler refused, telling the client when to retry.
+    """
+    return (jsonify({"error": str(error), "retry_after": error.retry_after}), 429,
+            {"Retry-After": str(error.retry_after)})
+
+
+def progress_reporter(job):
+    """
+    Progress callback that records worker progress on the job (and so on its SSE stream).
+    """
+    def on_progress(stage, step=None, total=None):
+        if stage == "item":
+            job_store.update(job, current_item=step, total_items=total)
+        else:
+            job_store.update(job, stage=stage, step=step, total_steps=total)
+    return on_progress
+
+
+@tryon_bp.route("/tryon/jobs", methods=["POST"])
+def create_tryon_job():
+    """
+    Queue a virtual try-on and return its job ID immediately.
+
+    Request JSON:
+        user_id (int): ID of the user whose uploaded photo is used.
+        item_id (int): Closet item ID (optional if cloth_url is given).
+        cloth_url (str): Clothing image URL, used when item_id is not a closet item.
+        item_category (str): "tops", "bottoms" or "dresses".
+        quality (str): "full" (default) or "preview", a quick low-resolution draft;
+                       request "full" afterwards for the final image.
+
+    Returns:
+        202: {"job_id": str, "status": "queued", "preview_url": str or None}
+             preview_url is the catalog's model try-on image of the garment, to display
+             until the personalized image is ready (None for non-catalog garments).
+        200: The full job record with status "done" when the result was already cached.
+        400/404: Invalid input, missing user image or clothing.
+        429: The try-on queue is full or the user has too many try-ons in flight (Retry-After set).
+    """
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+
+    user_id = data.get("user_id")
+    item_category = data.get("item_category")
+    quality = data.get("quality", "full")
+    if quality not in QUALITY_TIERS:
+        return jsonify({"error": f"Unknown quality: {quality}"}), 400
+
+    timings = StageTimings()
+    try:
+        with recording(timings):
+            image_path = resolve_user_image(user_id)
+            cloth_url, clothing_id = resolve_garment_url(data.get("item_id"), data.get("cloth_url"))
+            # A cached catalog try-on is answered here, without waiting behind queued model runs
+            if clothing_id is not None:
+                new_name = cached_tryon(user_id, image_path, garment_cache_key(clothing_id), item_category,
+                                        quality)
+                if new_name:
+                    job = job_store.add_done(user_id, image_path=new_name, cached=True, quality=quality,
+                                             timings=timings)
+                    return jsonify(job.to_dict()), 200
+        preview_url = catalog_preview_url(clothing_id)
+    except TryOnError as e:
+        return jsonify({"error": str(e)}), e.status
+
+    def run(job):
+        job_store.update(job, stage="download")
+        new_name, cached = run_tryon(user_id, image_path, cloth_url, clothing_id, item_category,
+                                     progress_reporter(job), quality)
+        return {"image_path": new_name, "cached": cached}
+
+    try:
+        job = tryon_scheduler.submit(user_id, run, preview_url=preview_url, quality=quality, timings=timings)
+    except QueueFullError as e:
+        return busy_response(e)
+
+    return jsonify({"job_id": job.job_id, "status": job.status, "preview_url": preview_url}), 202
+
+
+@tryon_bp.route("/tryon/jobs/batch", methods=["POST"])
+def create_tryon_batch_job():
+    """
+    Queue try-ons of several catalog garments on the user's photo as one job.
+
+    The person preprocessing runs once for the whole batch and the garments are rendered
+    back-to-back; already cached garments are served from the try-on cache.
+
+    Request JSON:
+        user_id (int): ID of the user whose uploaded photo is used.
+        cids (list[int]): Clothing IDs to try on (at most TRYON_MAX_BATCH).
+        quality (str): "full" (default) or "preview".
+
+    Returns:
+        202: {"job_id": str, "status": "queued", "not_found": [...],
+              "previews": [{"clothing_id", "preview_url"}, ...]}
+        200: The finished job record when every garment was already cached.
+        400/404: Invalid input or missing user image.
+        429: The try-on queue is full or the user has too many try-ons in flight (Retry-After set).
+    """
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+
+    user_id = data.get("user_id")
+    cids = data.get("cids")
+    quality = data.get("quality", "full")
+    if quality not in QUALITY_TIERS:
+        return jsonify({"error": f"Unknown quality: {quality}"}), 400
+    if not isinstance(cids, list) or not cids:
+        return jsonify({"error": "cids must be a non-empty list"}), 400
+    if not all(isinstance(cid, int) and not isinstance(cid, bool) for cid in cids):
+        return jsonify({"error": "cids must be integers"}), 400
+    if len(cids) > Config.TRYON_MAX_BATCH:
+        return jsonify({"error": f"At most {Config.TRYON_MAX_BATCH} garments per batch"}), 400
+
+    try:
+        image_path = resolve_user_image(user_id)
+    except TryOnError as e:
+        return jsonify({"error": str(e)}), e.status
+
+    clothes = {c.cid: c for c in Clothing.query.filter(Clothing.cid.in_(cids)).all()}
+    garments, not_found = [], []
+    for cid in dict.fromkeys(cids):  # keep request order, drop duplicates
+        cloth = clothes.get(cid)
+        if cloth is None:
+            not_found.append(cid)
+        else:
+            garments.append({"clothing_id": cloth.cid, "cloth_url": cloth.cloth_path, "category": cloth.category})
+    previews = [{"clothing_id": g["clothing_id"], "preview_url": catalog_preview_url(g["clothing_id"])}
+                for g in garments]
+    if not garments:
+        return jsonify({"error": "Clothing not found", "not_found": not_found}), 404
+
+    # Answer at once if every garment is already in the try-on cache. Probe first and publish
+    # only on a full hit; on a partial hit run_tryon_batch publishes the cached garments itself
+    cached = [find_cached_tryon(image_path, garment_cache_key(g["clothing_id"]), g["category"], quality)
+              for g in garments]
+    if all(cached):
+        results = [{"clothing_id": g["clothing_id"], "category": g["category"],
+                    "image_path": publish_result(user_id, path), "cached": True, "error": None}
+                   for g, path in zip(garments, cached)]
+        job = job_store.add_done(user_id, results=results, cached=True, quality=quality)
+        return jsonify(dict(job.to_dict(), not_found=not_found)), 200
+
+    def run(job):
+        job_store.update(job, total_items=len(garments))
+        return {"results": run_tryon_batch(user_id, image_path, garments, progress_reporter(job), quality)}
+
+    try:
+        job = tryon_scheduler.submit(user_id, run, quality=quality)
+    except QueueFullError as e:
+        return busy_response(e)
+
+    return jsonify({"job_id": job.job_id, "status": job.status, "not_found": not_found,
+                    "previews": previews}), 202
+
+
+@tryon_bp.route("/tryon/jobs/outfit", methods=["POST"])
+def create_outfit_job():
+    """
+    Queue a try-on of a top and a bottom worn together.
+
+    The top is applied to the user's photo first and the bottom to that result. Each stage
+    is cached, so trying another bottom with the same top only renders the bottom.
+
+    Request JSON:
+        user_id (int): ID of the user whose uploaded photo is used.
+        top_id (int): Clothing ID of the top (optional if bottom_id is given).
+        bottom_id (int): Clothing ID of the bottom (optional if top_id is given).
+        quality (str): "full" (default) or "preview".
+
+    Returns:
+        202: {"job_id": str, "status": "queued", "preview_url": str or None}
+             When done, results lists each stage as {"clothing_id", "category", "cached"}.
+        200: The finished job record when the whole outfit was already cached.
+        400/404: Invalid input, missing user image or clothing.
+        429: The try-on queue is full or the user has too many try-ons in flight (Retry-After set).
+    """
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+
+    user_id = data.get("user_id")
+    quality = data.get("quality", "full")
+    if quality not in QUALITY_TIERS:
+        return jsonify({"error": f"Unknown quality: {quality}"}), 400
+
+    # Put on the top first, then the bottom over it
+    garments = []
+    for field, category in (("top_id", "tops"), ("bottom_id", "bottoms")):
+        cid = data.get(field)
+        if cid is None:
+            continue
+        cloth = Clothing.query.get(cid)
+        if not cloth or not cloth.cloth_path:
+            return jsonify({"error": f"Clothing {cid} not found"}), 404
+        if cloth.category != category:
+            return jsonify({"error": f"{field} must be a {category} item"}), 400
+        garments.append({"clothing_id": cloth.cid, "cloth_url": cloth.cloth_path, "category": category})
+    if not garments:
+        return jsonify({"error": "Missing top_id or bottom_id"}), 400
+
+    try:
+        image_path = resolve_user_image(user_id)
+    except TryOnError as e:
+        return jsonify({"error": str(e)}), e.status
+
+    new_name = cached_outfit(user_id, image_path, garments, quality)
+    if new_name:
+        results = [{"clothing_id": g["clothing_id"], "category": g["category"], "cached": True} for g in garments]
+        job = job_store.add_done(user_id, image_path=new_name, results=results, cached=True, quality=quality)
+        return jsonify(job.to_dict()), 200
+    preview_url = catalog_preview_url(garments[-1]["clothing_id"])
+
+    def run(job):
+        job_store.update(job, total_items=len(garments))
+        new_name, stages = run_outfit(user_id, image_path, garments, progress_reporter(job), quality)
+        return {"image_path": new_name, "results": stages, "cached": all(stage["cached"] for stage in stages)}
+
+    try:
+        job = tryon_scheduler.submit(user_id, run, preview_url=preview_url, quality=quality)
+    except QueueFullError as e:
+        return busy_response(e)
+
+    return jsonify({"job_id": job.job_id, "status": job.status, "preview_url": preview_url}), 202
+
+
+@tryon_bp.route("/tryon/jobs/<job_id>", methods=["GET"])
+def get_tryon_job(job_id):
+    """
+    Report the state of a try-on job.
+
+    Returns:
+        JSON: job_id, status, stage, step, total_steps, image_path (when done),
+              error (when failed), timings (seconds per pipeline stage) and timestamps.
+        404: Unknown or expired job.
+    """
+    job = job_store.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+
+@tryon_bp.route("/tryon/jobs/stream", methods=["GET"])
+def stream_tryon_jobs():
+    """
+    Stream updates of one or more try-on jobs as server-sent events.
+
+    Query Parameters:
+        ids (str): Comma-separated job IDs (at most 20).
+
+    Events:
+        job: A job snapshot (same fields as GET /tryon/jobs/<job_id>), sent once for the
+             current state and then on every status, stage or step change.
+        end: All followed jobs are finished; the server closes the stream.
+
+    Returns:
+        text/event-stream, or 400 if no job IDs are given.
+    """
+    job_ids = [job_id for job_id in request.args.get("ids", "").split(",") if job_id][:MAX_STREAM_JOBS]
+    if not job_ids:
+        return jsonify({"error": "Missing ids"}), 400
+
+    def events():
+        seen = {}
+        deadline = time.monotonic() + STREAM_TIMEOUT
+        while time.monotonic() < deadline:
+            changed = job_store.wait_for_changes(job_ids, seen, HEARTBEAT_INTERVAL)
+            for snapshot in changed:
+                yield f"event: job\ndata: {json.dumps(snapshot)}\n\n"
+            if not changed:
+                yield ": keep-alive\n\n"
+            if job_store.all_finished(job_ids):
+                yield "event: end\ndata: {}\n\n"
+                return
+
+    return Response(events(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # Disable proxy buffering so events arrive as they happen
+    })
+
+
+@tryon_bp.route("/tryon/metrics", methods=["GET"])
+def tryon_metrics_report():
+    """
+    Report where try-on time goes: a duration histogram per pipeline stage (see
+    utils/tryon_metrics.py), plus the scheduler queue, the result cache and the storage
+    janitor (bytes reclaimed, last sweep).
+
+    Query Parameters:
+        format (str): "prometheus" for the Prometheus text format (histograms only).
+
+    Returns:
+        JSON: {"stages": {stage: {"count", "sum", "buckets": [[upper bound, cumulative count], ...]}},
+               "scheduler": {...}, "cache": {...}, "storage": {...}}
+    """
+    if request.args.get("format") == "prometheus":
+        return Response(tryon_metrics.prometheus_text(), mimetype="text/plain; version=0.0.4")
+    return jsonify({
+        "stages": tryon_metrics.snapshot(),
+        "scheduler": tryon_scheduler.stats(),
+        "cache": tryon_result_cache.stats(),
+        "storage": storage_janitor.stats(),
+    })
@@ -7,10 +7,13 @@ It also serves static user image files from the /data/users/image directory.
 """
 
 # routes/user_image.py
+import os
 from flask import Blueprint, request, jsonify
 from exts import db
 from models import User
 from utils.image_utils import save_user_image, get_user_image_path, delete_user_image_if_exists
+from utils.tryon_pipeline import refresh_person_artifacts, user_image_digest
+from utils.tryon_speculation import likely_garments, speculative_tryons
 from backend.utils.static_serve import serve_user_image
 
 # Blueprint for user image-related endpoints
@@ -43,6 +46,7 @@ def upload_image():
         return jsonify({"error": "User not found"}), 404
 
     # Delete old image before saving new one
+    old_digest = user_image_digest(get_user_image_path(user))
     delete_user_image_if_exists(user.image_path)
 
     # Save new image to disk
@@ -53,6 +57,17 @@ def upload_image():
     user.image_path = relative_path
     db.session.commit()
 
+    # Drop the old photo's try-on preprocessing and start on the new one in the background
+    refresh_person_artifacts(user.user_id, old_digest, os.path.abspath(filepath))
+    # Pre-render the garments the user is likely to try first, while the GPU is idle
+    if speculative_tryons.enabled:
+        try:
+            speculative_tryons.plan(user.user_id, os.path.abspath(filepath),
+                                    likely_garments(user.user_id, speculative_tryons.max_items))
+        except Exception as e:
+            # Only an optimisation: the upload itself has succeeded
+            print(f"[Speculative] Could not plan try-ons for user {user.user_id}: {str(e)}")
+
     return jsonify({
         "message": "Image uploaded and path updated successfully",
         "image_path": relative_path
@@ -0,0 +1,273 @@
+# Author: OVDR Team
+# Description: Offline evaluation and latency benchmark for the recommenders in routes/recommend.py.
+#
+# A History/Closet snapshot is split by time: events before the cut are "train", and each user's
+# items viewed after the cut (and not seen before) are the holdout. The train events are loaded
+# into an in-memory SQLite database behind the real recommend blueprint, and every strategy is
+# a request to its route in routes/recommend.py, scored with recall@k and NDCG@k. The harness
+# also reports p50/p99 per-request latency. That latency includes the Flask and SQLite overhead
+# and runs with the result cache cleared.
+#
+# Usage (from the project root or backend/):
+#   # Evaluate directly against the configured MySQL database
+#   python backend/scripts/evaluate_recommenders.py --k 10
+#   # Export a snapshot once, then evaluate offline from the file
+#   python backend/scripts/evaluate_recommenders.py --export snapshot.json
+#   python backend/scripts/evaluate_recommenders.py --snapshot snapshot.json --split 0.8
+#
+# Snapshot format (JSON):
+#   {"history": [[user_id, clothing_id, "2025-03-28 10:00:00"], ...],
+#    "closet":  [[user_id, clothing_id, "2025-03-28 10:00:00"], ...],
+#    "catalog": [[cid, cloth_path], ...]}    (optional, maps embedding rows to cids)
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BACKEND_DIR)  # ahead of scripts/, whose models.py would shadow backend/models.py
+sys.path.append(os.path.dirname(BACKEND_DIR))
+
+from utils.catalog_index import get_catalog_index
+from utils.recommend_cache import recommendation_cache
+from config import Config
+
+
+# ---------- Snapshot loading ----------
+
+def load_snapshot_from_db():
+    from backend import create_app
+    from exts import db
+    from models import Closet, Clothing, History
+
+    app = create_app()
+    with app.app_context():
+        history = db.session.query(History.user_id, History.clothing_id, History.created_at).all()
+        closet = db.session.query(Closet.user_id, Closet.clothing_id, Closet.added_at).all()
+        catalog = db.session.query(Clothing.cid, Clothing.cloth_path).all()
+    return {
+        "history": [[u, c, str(t)] for u, c, t in history],
+        "closet": [[u, c, str(t)] for u, c, t in closet],
+        "catalog": [[cid, path] for cid, path in catalog],
+    }
+
+
+def load_snapshot_from_file(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def parse_time(value):
+    return datetime.fromisoformat(str(value))
+
+
+def time_split(history, split):
+    """
+    Split history events at the `split` quantile of their timestamps.
+
+    Returns:
+        tuple: (train_events, holdout, cut_time) where train_events is a time-ordered list of
+               (user_id, clothing_id, timestamp), holdout maps user_id -> set of unseen
+               clothing IDs and cut_time is the timestamp of the first holdout event.
+    """
+    events = sorted(history, key=lambda e: e[2])
+    cut = int(len(events) * split)
+    train = [(int(u), int(c), t) for u, c, t in events[:cut]]
+    seen = defaultdict(set)
+    for user_id, clothing_id, _ in train:
+        seen[user_id].add(clothing_id)
+
+    holdout = defaultdict(set)
+    for user_id, clothing_id, _ in events[cut:]:
+        user_id, clothing_id = int(user_id), int(clothing_id)
+        if user_id in seen and clothing_id not in seen[user_id]:
+            holdout[user_id].add(clothing_id)
+    cut_time = parse_time(events[cut][2]) if cut < len(events) else None
+    return train, dict(holdout), cut_time
+
+
+def closet_before(closet, cut_time):
+    """
+    Closet rows added before the split: later ones would leak holdout-period data into the
+    closet-based signals.
+    """
+    return [row for row in closet if cut_time is None or parse_time(row[2]) < cut_time]
+
+
+# ---------- Replay through the routes ----------
+
+# Strategy -> (route URL, key of the recommendation list in its JSON response).
+# {seed} is the user's most recent train view, as on the detail page.
+STRATEGIES = {
+    "popular": ("/recommend/popular?top_n={k}", "recommended_popular"),
+    "similar": ("/recommend/{seed}?top_n={k}", "recommendations"),
+    "similar_mmr": ("/recommend/{seed}?top_n={k}&diversify=mmr", "recommendations"),
+    "user_cf": ("/recommend/user/{user_id}?top_n={k}", "personalized_recommendations"),
+    "for_you": ("/recommend/for-you/{user_id}?top_n={k}", "for_you_recommendations"),
+    "hybrid": ("/recommend/hybrid/{user_id}?top_n={k}", "hybrid_recommendations"),
+}
+
+
+def catalog_category(cloth_path):
+    name = os.path.basename(cloth_path or "")
+    if "_bottom" in name:
+        return "bottoms"
+    if "_dress" in name:
+        return "dresses"
+    return "tops"
+
+
+def build_replay_app(catalog, train, closet):
+    """
+    Load the train snapshot into an in-memory SQLite database behind the real recommend
+    blueprint, so every strategy runs exactly the code the API serves.
+
+    Taste vectors are rebuilt by replaying the train views through `update_user_taste`,
+    the same function `/add-history` calls.
+    """
+    from flask import Flask
+    from sqlalchemy.pool import StaticPool
+    from exts import db
+    from models import Closet, Clothing, History, User
+    from routes.history import update_user_taste
+    from routes.recommend import recommend_bp
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "connect_args": {"check_same_thread": False},
+        "poolclass": StaticPool,
+    }
+    db.init_app(app)
+    app.register_blueprint(recommend_bp)
+
+    with app.app_context():
+        db.create_all()
+        user_ids = {int(u) for u, _, _ in train} | {int(u) for u, _, _ in closet}
+        db.session.add_all(User(user_id=u, username=f"eval-{u}", password="") for u in sorted(user_ids))
+        db.session.add_all(
+            Clothing(cid=int(cid), cloth_path=path, category=catalog_category(path)) for cid, path in catalog
+        )
+        db.session.add_all(
+            History(user_id=int(u), clothing_id=int(c), created_at=parse_time(t)) for u, c, t in train
+        )
+        db.session.add_all(
+            Closet(user_id=int(u), clothing_id=int(c), added_at=parse_time(t)) for u, c, t in closet
+        )
+        db.session.commit()
+
+        for user_id, clothing_id, _ in train:
+            update_user_taste(int(user_id), int(clothing_id))
+    return app
+
+
+def request_strategy(client, name, user_id, seed, k):
+    """
+    Call the route of strategy `name` for one user and return the recommended clothing IDs.
+    """
+    url, key = STRATEGIES[name]
+    # Every call must do the full work, not return a result cached by an earlier user
+    recommendation_cache.clear()
+    response = client.get(url.format(user_id=user_id, seed=seed, k=k))
+    if response.status_code != 200:
+        return []
+    return [item["id"] for item in (response.get_json() or {}).get(key, [])]
+
+
+# ---------- Metrics ----------
+
+def recall_at_k(recommended, relevant):
+    return len(set(recommended) & relevant) / len(relevant)
+
+
+def ndcg_at_k(recommended, relevant, k):
+    dcg = sum(1.0 / math.log2(i + 2) for i, cid in enumerate(recommended[:k]) if cid in relevant)
+    idcg = sum(1.0 / math.log2(i + 2) for i in range(min(len(relevant), k)))
+    return dcg / idcg
+
+
+def evaluate(client, train, holdout, k, strategies):
+    last_view = {int(u): int(c) for u, c, _ in train}  # train is time-ordered
+    results = {}
+    for name in strategies:
+        # One untimed call builds the per-worker state (LSH index, popularity vector)
+        if holdout:
+            user_id = next(iter(holdout))
+            request_strategy(client, name, user_id, last_view[user_id], k)
+        recalls, ndcgs, latencies = [], [], []
+        for user_id, relevant in holdout.items():
+            start = time.perf_counter()
+            recommended = request_strategy(client, name, user_id, last_view[user_id], k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(recall_at_k(recommended, relevant))
+            ndcgs.append(ndcg_at_k(recommended, relevant, k))
+        results[name] = {
+            "users": len(holdout),
+            f"recall@{k}": float(np.mean(recalls)) if recalls else 0.0,
+            f"ndcg@{k}": float(np.mean(ndcgs)) if ndcgs else 0.0,
+            "p50_ms": float(np.percentile(latencies, 50)) if latencies else 0.0,
+            "p99_ms": float(np.percentile(latencies, 99)) if latencies else 0.0,
+        }
+    return results
+
+
+def print_report(results, k):
+    header = f"{'strategy':<15}{'users':>7}{f'recall@{k}':>12}{f'ndcg@{k}':>10}{'p50 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, row in results.items():
+        print(f"{name:<15}{row['users']:>7}{row[f'recall@{k}']:>12.4f}{row[f'ndcg@{k}']:>10.4f}"
+              f"{row['p50_ms']:>10.3f}{row['p99_ms']:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate recommenders on a time-split holdout")
+    parser.add_argument("--snapshot", help="JSON snapshot file (default: read from MySQL)")
+    parser.add_argument("--export", help="Write the MySQL snapshot to this JSON file and exit")
+    parser.add_argument("--split", type=float, default=0.8, help="Fraction of events used for training")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--strategies", default=",".join(STRATEGIES),
+                        help="Comma-separated subset of: " + ", ".join(STRATEGIES))
+    parser.add_argument("--output", help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    if args.export:
+        with open(args.export, "w", encoding="utf-8") as f:
+            json.dump(load_snapshot_from_db(), f)
+        print(f"Snapshot written to {args.export}")
+        return
+
+    snapshot = load_snapshot_from_file(args.snapshot) if args.snapshot else load_snapshot_from_db()
+    train, holdout, cut_time = time_split(snapshot["history"], args.split)
+    if not holdout:
+        print("No users with both train and holdout events; try a different --split.")
+        return
+
+    index = get_catalog_index()
+    if index is None:
+        raise RuntimeError("Embedding index could not be loaded")
+    # Snapshots without a catalog fall back to the baseline cid = row + 1 layout
+    catalog = snapshot.get("catalog") or [[row + 1, name] for row, name in enumerate(index.image_names)]
+
+    app = build_replay_app(catalog, train, closet_before(snapshot.get("closet", []), cut_time))
+    strategies = [s.strip() for s in args.strategies.split(",") if s.strip()]
+    with app.app_context():
+        results = evaluate(app.test_client(), train, holdout, args.k, strategies)
+    print(f"{len(train)} train events, {len(holdout)} holdout users, split={args.split}")
+    print_report(results, args.k)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
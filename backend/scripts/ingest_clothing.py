@@ -0,0 +1,92 @@
+# Author: OVDR Team
+# Description: Onboard newly inserted Clothing rows into the live search and recommendation index.
+#
+# For each new item this script embeds its `cloth_path` image with CLIP, appends the embedding
+# to the current index and publishes it as a new index version. Only the similarity rows of the
+# new items are computed and written (a delta file); the existing N x N matrix is hard-linked
+# from the previous version, not copied. Running workers swap the new version in within a few
+# seconds without restarting (see utils/catalog_index.py),
+# so `/search` and `/recommend/<id>` can serve the item straight away.
+# Pass all new items in one run: every run adds one delta, and after MAX_SIMILARITY_DELTAS of
+# them the next publish compacts the matrix (O(N^2), like a `precompute_similarity.py` rebuild).
+#
+# Usage (from the project root or backend/):
+#   python backend/scripts/ingest_clothing.py --cid 901 --cid 902
+#   python backend/scripts/ingest_clothing.py --all-missing
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import torch
+from PIL import Image
+from transformers import CLIPModel, CLIPProcessor
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+ROOT_DIR = os.path.dirname(BACKEND_DIR)
+sys.path.append(BACKEND_DIR)
+sys.path.append(ROOT_DIR)
+
+from utils.catalog_index import load_catalog_index, publish_catalog_index
+
+CLIP_PATH = os.path.join(BACKEND_DIR, "models", "clip-vit-large-patch14")
+BATCH_SIZE = 32
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def embed_images(image_paths):
+    """
+    Compute CLIP image embeddings for a list of image files, shape (k, 768).
+    """
+    model = CLIPModel.from_pretrained(CLIP_PATH, local_files_only=True).to(device)
+    processor = CLIPProcessor.from_pretrained(CLIP_PATH, local_files_only=True)
+    embeddings = []
+    for start in range(0, len(image_paths), BATCH_SIZE):
+        images = [Image.open(path).convert("RGB") for path in image_paths[start:start + BATCH_SIZE]]
+        inputs = processor(images=images, return_tensors="pt").to(device)
+        with torch.no_grad():
+            embeddings.append(model.get_image_features(**inputs).cpu().numpy())
+    return np.vstack(embeddings).astype(np.float32)
+
+
+def ingest_clothing(cids=None, all_missing=False):
+    from backend import create_app
+    from exts import db
+    from models import Clothing
+
+    index = load_catalog_index()
+    if index is None:
+        raise RuntimeError("Current embedding index could not be loaded")
+
+    app = create_app()
+    with app.app_context():
+        query = db.session.query(Clothing.cid, Clothing.cloth_path)
+        if not all_missing:
+            query = query.filter(Clothing.cid.in_(cids))
+        rows = [(cid, path) for cid, path in query if path and index.row_for_path(path) is None]
+
+    if not rows:
+        print("Nothing to ingest: all requested items are already in the index.")
+        return
+
+    names = [os.path.basename(path.replace("\\", "/")) for _, path in rows]
+    image_paths = [os.path.join(ROOT_DIR, path) for _, path in rows]
+    missing_files = [path for path in image_paths if not os.path.exists(path)]
+    if missing_files:
+        raise FileNotFoundError(f"Clothing images not found: {missing_files}")
+
+    new_index = index.append(names, embed_images(image_paths))
+    version = publish_catalog_index(new_index)
+    print(f"Ingested {len(rows)} items (cids {[cid for cid, _ in rows]}); "
+          f"index {version} now has {len(new_index)} rows.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add new clothing items to the live embedding index")
+    parser.add_argument("--cid", type=int, action="append", default=[], help="Clothing ID to ingest (repeatable)")
+    parser.add_argument("--all-missing", action="store_true", help="Ingest every Clothing row not yet indexed")
+    args = parser.parse_args()
+    if not args.cid and not args.all_missing:
+        parser.error("give at least one --cid or --all-missing")
+    ingest_clothing(args.cid, args.all_missing)
@@ -0,0 +1,133 @@
+# Author: OVDR Team
+# Description: Precompute "complete the look" lists (bottoms for each top, tops for each bottom)
+#              from the outfits saved in the Combination table, backed off to CLIP similarity.
+#
+# Usage (from the project root or backend/):
+#   python backend/scripts/precompute_complete_look.py [--list-size 50]
+#
+# Output: backend/complete_look.npz, served by GET /recommend/complete/<clothing_id>.
+# Workers pick up a new file automatically (it is reloaded when its mtime changes).
+
+import argparse
+import os
+import sys
+from collections import Counter
+
+import numpy as np
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(BACKEND_DIR)
+sys.path.append(os.path.dirname(BACKEND_DIR))
+
+from utils.complete_look import COMPLETE_LOOK_PATH, COMPLEMENTARY_CATEGORY
+
+LIST_SIZE = 50     # compatible items kept per clothing item
+CHUNK_ROWS = 1024  # source items scored per matrix product
+
+
+def count_pairs(combinations):
+    """
+    Count how often each (top_id, bottom_id) pair was saved together, in both directions.
+    """
+    counts = Counter()
+    for top_id, bottom_id in combinations:
+        if top_id is not None and bottom_id is not None:
+            counts[(top_id, bottom_id)] += 1
+            counts[(bottom_id, top_id)] += 1
+    return counts
+
+
+def build_complete_look(index, categories, pair_counts, list_size=LIST_SIZE):
+    """
+    Rank complementary-category items for every top and bottom.
+
+    score = co-occurrence count + (cosine similarity + 1) / 2
+
+    The similarity term lies in [0, 1], so items worn together in saved outfits always
+    come first and embedding similarity orders the rest (and breaks ties).
+
+    Args:
+        index (CatalogIndex): Bound catalog index.
+        categories (dict): cid -> category.
+        pair_counts (Counter): (cid, cid) -> number of saved outfits containing both.
+        list_size (int): Items kept per list.
+
+    Returns:
+        tuple: (cids, neighbours, scores) arrays for complete_look.npz.
+    """
+    by_category = {}
+    for cid, category in categories.items():
+        if index.row_for_cid(cid) is not None:
+            by_category.setdefault(category, []).append(cid)
+
+    counts_by_source = {}
+    for (source, target), count in pair_counts.items():
+        counts_by_source.setdefault(source, []).append((target, count))
+
+    all_cids, all_neighbours, all_scores = [], [], []
+    for category, target_category in COMPLEMENTARY_CATEGORY.items():
+        sources = np.asarray(by_category.get(category, []), dtype=np.int64)
+        targets = np.asarray(by_category.get(target_category, []), dtype=np.int64)
+        if len(sources) == 0 or len(targets) == 0:
+            continue
+        target_rows = index.rows_for_cids(targets)
+        column_of_target = {int(cid): col for col, cid in enumerate(targets)}
+        k = min(list_size, len(targets))
+
+        for start in range(0, len(sources), CHUNK_ROWS):
+            chunk = sources[start:start + CHUNK_ROWS]
+            scores = index.normalized[index.rows_for_cids(chunk)] @ index.normalized[target_rows].T
+            scores = (scores + 1.0) / 2.0
+            for i, cid in enumerate(chunk.tolist()):
+                for target, count in counts_by_source.get(cid, ()):
+                    col = column_of_target.get(target)
+                    if col is not None:
+                        scores[i, col] += count
+
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind="stable")
+            neighbours = np.full((len(chunk), list_size), -1, dtype=np.int64)
+            padded_scores = np.zeros((len(chunk), list_size), dtype=np.float32)
+            neighbours[:, :k] = targets[np.take_along_axis(top, order, axis=1)]
+            padded_scores[:, :k] = np.take_along_axis(top_scores, order, axis=1)
+
+            all_cids.append(chunk)
+            all_neighbours.append(neighbours)
+            all_scores.append(padded_scores)
+
+    if not all_cids:
+        return (np.empty(0, dtype=np.int64), np.empty((0, list_size), dtype=np.int64),
+                np.empty((0, list_size), dtype=np.float32))
+    return np.concatenate(all_cids), np.vstack(all_neighbours), np.vstack(all_scores)
+
+
+def precompute_complete_look(list_size=LIST_SIZE, output_path=COMPLETE_LOOK_PATH):
+    from backend import create_app
+    from exts import db
+    from models import Clothing, Combination
+    from utils.catalog_index import get_catalog_index
+
+    app = create_app()
+    with app.app_context():
+        index = get_catalog_index(db.session)
+        if index is None:
+            raise RuntimeError("Embedding index could not be loaded")
+        categories = dict(db.session.query(Clothing.cid, Clothing.category).all())
+        pair_counts = count_pairs(db.session.query(Combination.top_id, Combination.bottom_id))
+
+    cids, neighbours, scores = build_complete_look(index, categories, pair_counts, list_size)
+
+    # Write next to the target and rename, so workers never read a half-written file
+    tmp_path = output_path + ".tmp.npz"
+    np.savez(tmp_path, cids=cids, neighbours=neighbours, scores=scores)
+    os.replace(tmp_path, output_path)
+    print(f"Complete-the-look lists saved: {len(cids)} items, "
+          f"{len(pair_counts) // 2} distinct saved pairs -> {output_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute complete-the-look recommendation lists")
+    parser.add_argument("--list-size", type=int, default=LIST_SIZE)
+    args = parser.parse_args()
+    precompute_complete_look(args.list_size)
@@ -1,12 +1,16 @@
 # Author:Jinghao Liu, Zihan Zhou
 
 import os
+import sys
 import numpy as np
 import torch
 from transformers import CLIPProcessor, CLIPModel
 from PIL import Image
 from concurrent.futures import ThreadPoolExecutor
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.catalog_index import CatalogIndex, publish_catalog_index
+
 # Setup Device
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
@@ -84,7 +88,8 @@ def precompute_similarity():
     with ThreadPoolExecutor() as executor:
         image_embeddings = list(executor.map(get_image_embedding, image_paths))
 
-    # Filter None value (images can not load correctly)
+    # Filter None value (images can not load correctly), keeping the file name of each row
+    image_names = [os.path.basename(path) for path, emb in zip(image_paths, image_embeddings) if emb is not None]
     image_embeddings = [emb for emb in image_embeddings if emb is not None]
     image_embeddings = np.array(image_embeddings, dtype=np.float32)
 
@@ -103,6 +108,11 @@ def precompute_similarity():
     np.save("similarity_matrix.npy", similarity_matrix)
     print(f"Similarity matrix saved successfully. Shape: {similarity_matrix.shape}")
 
+    # Publish as a new index version; running workers swap it in without a restart
+    index = CatalogIndex(image_embeddings, similarity_matrix, image_names, normalized=normalized_embeddings)
+    version = publish_catalog_index(index)
+    print(f"Published index version {version}")
+
 
 if __name__ == "__main__":
     precompute_similarity()
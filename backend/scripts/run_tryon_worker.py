@@ -0,0 +1,54 @@
+# Author: OVDR Team
+# Description: Start the persistent try-on worker (see utils/tryon_worker.py).
+#
+# The worker loads the model once and serves every try-on request from the Flask backend.
+# Point the backend at it with TRYON_WORKER_ADDRESS in .env (the same value as --address);
+# without that setting the backend keeps spawning app.py per request.
+#
+# Usage (from the project root):
+#   # Real model, inside the StableViton conda environment
+#   conda activate StableViton
+#   python backend/scripts/run_tryon_worker.py --backend stableviton
+#   # GPU-free stub for development and tests
+#   python backend/scripts/run_tryon_worker.py --backend stub --step-delay 0.05
+#
+# The worker does not import the Flask config, so it reads TRYON_WORKER_AUTHKEY from the
+# environment directly. It must be set to a secret shared with the backend: requests are
+# pickles, and anyone holding the key can run code in the worker. The worker only listens on
+# loopback addresses unless --allow-remote is given (then keep the port firewalled).
+
+import argparse
+import os
+import sys
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(BACKEND_DIR)
+
+from utils.tryon_backends import BACKENDS, create_backend
+from utils.tryon_worker import DEFAULT_ADDRESS, TryOnWorker, is_loopback, parse_address
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the persistent try-on worker")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="stableviton")
+    parser.add_argument("--address", default=os.getenv("TRYON_WORKER_ADDRESS") or DEFAULT_ADDRESS,
+                        help="host:port to listen on")
+    parser.add_argument("--allow-remote", action="store_true",
+                        help="Allow listening on a non-loopback address")
+    parser.add_argument("--checkpoint", default="eternal_1024.ckpt", help="StableVITON checkpoint file")
+    parser.add_argument("--step-delay", type=float, default=0.0,
+                        help="Seconds per sampling step for the stub backend")
+    args = parser.parse_args()
+
+    authkey = os.getenv("TRYON_WORKER_AUTHKEY", "").encode()
+    if not authkey:
+        sys.exit("TRYON_WORKER_AUTHKEY is not set; refusing to start the try-on worker")
+    if not args.allow_remote and not is_loopback(parse_address(args.address)[0]):
+        sys.exit(f"{args.address} is not a loopback address; pass --allow-remote to listen on it")
+
+    if args.backend == "stub":
+        backend = create_backend("stub", step_delay=args.step_delay)
+    else:
+        backend = create_backend("stableviton", checkpoint=args.checkpoint)
+
+    TryOnWorker(backend, args.address, authkey, allow_remote=args.allow_remote).serve_forever()
@@ -0,0 +1,30 @@
+# Author: OVDR Team
+# Description: Run one storage janitor sweep now and print what it reclaimed.
+#
+# The backend sweeps on its own every STORAGE_SWEEP_INTERVAL seconds (utils/storage_janitor.py);
+# this is for freeing space at once, e.g. after lowering a quota.
+#
+# Usage (from the project root, where data/combinations/ is resolved like the running backend):
+#   python backend/scripts/sweep_storage.py
+
+import json
+import os
+import sys
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(BACKEND_DIR)
+sys.path.append(os.path.dirname(BACKEND_DIR))
+
+
+def main():
+    from backend import create_app
+    from utils.storage_janitor import storage_janitor
+
+    app = create_app()
+    with app.app_context():
+        report = storage_janitor.sweep()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Tests import the backend modules the way the app does ("from utils.x import ...")
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BACKEND_DIR)
@@ -0,0 +1,88 @@
+"""
+Storage janitor sweeps against the outfit_path formats found in existing databases.
+"""
+
+import os
+import time
+
+import pytest
+from flask import Flask
+
+from exts import db
+from models import Combination, User
+import utils.storage_janitor as janitor_module
+from utils.storage_janitor import StorageJanitor, outfit_file
+
+OLD = time.time() - 30 * 86400
+RESULT = "ab/ab12cd34ef56ab78.jpg"
+
+
+def write(path, data=b"x" * 100):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    os.utime(path, (OLD, OLD))
+    return str(path)
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # data/combinations/ is resolved from the working directory, like in the backend
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(janitor_module, "LEGACY_DIRS", ())
+    monkeypatch.setattr(janitor_module, "SCRATCH_DIR", str(tmp_path / "scratch"))
+    monkeypatch.setattr(janitor_module, "ARTIFACT_DIR", str(tmp_path / "artifacts"))
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+def add_combination(user_id, outfit_path):
+    if db.session.get(User, user_id) is None:
+        db.session.add(User(user_id=user_id, username=f"user{user_id}", password=""))
+    db.session.add(Combination(user_id=user_id, outfit_path=outfit_path))
+    db.session.commit()
+
+
+def test_outfit_file_resolves_legacy_formats(app, tmp_path):
+    root = tmp_path / "data" / "combinations"
+    assert outfit_file("user_11/0.jpg") == str(root / "user_11" / "0.jpg")
+    assert outfit_file("user_5_0.jpg") == str(root / "user_5_0.jpg")
+    assert outfit_file(f"/show_image/3/{RESULT}") == str(root / "user_3" / RESULT)
+    assert outfit_file("http://host/show_image/3/../../x.jpg") is None
+    assert outfit_file("user_11/../../x.jpg") is None
+
+
+def test_sweep_keeps_legacy_outfits_and_deletes_only_orphaned_results(app, tmp_path):
+    root = tmp_path / "data" / "combinations"
+    saved_legacy = write(root / "user_11" / "0.jpg")
+    flat_legacy = write(root / "user_5_0.jpg")
+    demo = write(root / "user_1" / "1.png")
+    saved_result = write(root / "user_11" / RESULT)
+    orphan = write(root / "user_11" / "cd" / "cd12cd34ef56ab78.jpg")
+    add_combination(11, "user_11/0.jpg")
+    add_combination(11, f"/show_image/11/{RESULT}")
+    add_combination(5, "user_5_0.jpg")
+
+    report = StorageJanitor(orphan_ttl=60, temp_ttl=60).sweep()
+
+    assert report["deleted_files"] == 1
+    assert not os.path.exists(orphan)
+    for path in (saved_legacy, flat_legacy, demo, saved_result):
+        assert os.path.exists(path)
+
+
+def test_sweep_skips_user_with_unresolved_outfit_path(app, tmp_path):
+    root = tmp_path / "data" / "combinations"
+    result = write(root / "user_7" / RESULT)
+    add_combination(7, "somewhere/else/outfit.jpg")
+
+    report = StorageJanitor(orphan_ttl=60, temp_ttl=60).sweep()
+
+    assert report["deleted_files"] == 0
+    assert os.path.exists(result)
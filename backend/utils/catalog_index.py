@@ -0,0 +1,420 @@
+"""
+Catalog Embedding Index
+Author: OVDR Team
+
+This module loads the precomputed CLIP image embeddings once per worker and exposes them
+together with the row <-> clothing mapping used by the recommendation routes.
+
+Row order follows `image_names`: by default 300 tops, 300 bottoms, then 300 dresses,
+matching the legacy `image_embeddings.npy` and `similarity_matrix.npy`. The mapping from a
+row to a `Clothing.cid` is resolved from each item's `cloth_path` file name with a single
+query on first use.
+
+Versioned indexes:
+    backend/indexes/
+        CURRENT                 <- name of the live version, replaced atomically
+        v000001/
+            image_embeddings.npy
+            normalized_embeddings.npy
+            similarity_matrix.npy
+            image_names.json
+        v000002/
+            ...
+            similarity_matrix.npy           <- hard link to v000001's file
+            similarity_delta_0000900.npy    <- rows 900.. against columns 0..N, one per ingest
+
+Publishers (`precompute_similarity.py`, `ingest_clothing.py`) write a complete new version
+directory and then swap the CURRENT pointer. An ingest does not rewrite the N x N similarity
+matrix: it stores the similarity rows of the new items as a delta file and hard-links the
+matrix and earlier deltas from the previous version, so it costs O(N * k) instead of O(N^2).
+The columns of older rows against the new items are read from the delta by symmetry. After
+MAX_SIMILARITY_DELTAS ingests the next publish writes one compacted matrix again. Workers stat CURRENT at most every
+RELOAD_CHECK_INTERVAL seconds and, when it changes, memory-map the new arrays and swap them
+in between requests; in-flight requests keep the index object they already hold.
+Without an `indexes/` directory the legacy files in `backend/` are loaded instead.
+
+Usage:
+    from utils.catalog_index import get_catalog_index
+    index = get_catalog_index(session)
+    row = index.row_for_cid(clothing_id)
+    scores = index.normalized @ index.normalized[row]
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+INDEX_ROOT = os.path.join(BASE_DIR, "indexes")
+CURRENT_FILE = "CURRENT"
+EMBEDDINGS_FILE = "image_embeddings.npy"
+NORMALIZED_FILE = "normalized_embeddings.npy"
+SIMILARITY_FILE = "similarity_matrix.npy"
+NAMES_FILE = "image_names.json"
+DELTA_PREFIX = "similarity_delta_"
+RELOAD_CHECK_INTERVAL = 5  # seconds between checks of the CURRENT pointer
+KEEP_VERSIONS = 3          # published versions kept on disk, including the live one
+MAX_SIMILARITY_DELTAS = 16 # ingests stored as delta files before a publish compacts the matrix
+
+
+def default_image_names():
+    """
+    Return the file names of the precomputed embedding rows, in row order.
+    """
+    return [f"{i:06d}_top.jpg" for i in range(1, 301)] + \
+           [f"{i:06d}_bottom.jpg" for i in range(1, 301)] + \
+           [f"{i:06d}_dress.jpg" for i in range(1, 301)]
+
+
+class CatalogIndex:
+    """
+    Embedding matrix of the clothing catalog plus lookups between rows, file names and cids.
+    """
+
+    def __init__(self, embeddings, similarity=None, image_names=None, normalized=None, version=None,
+                 similarity_deltas=(), similarity_files=None):
+        self.embeddings = np.asarray(embeddings, dtype=np.float32)
+        if normalized is None:
+            norms = np.linalg.norm(self.embeddings, axis=1, keepdims=True)
+            norms[norms == 0] = 1  # Avoid dividing by zero
+            normalized = self.embeddings / norms
+        self.normalized = normalized
+        # Square matrix of the first rows, then per ingest the new rows against all columns so far
+        self.similarity = similarity
+        self.similarity_deltas = list(similarity_deltas)
+        # Files the blocks were loaded from (None for computed ones), so publish can link them
+        self.similarity_files = similarity_files or [None] * (1 + len(self.similarity_deltas))
+        self.version = version
+        self.image_names = list(image_names or default_image_names())[:len(self.embeddings)]
+        self.row_of_name = {name: row for row, name in enumerate(self.image_names)}
+        self.cid_of_row = None
+        self._row_of_cid = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.image_names)
+
+    @property
+    def dim(self):
+        return self.embeddings.shape[1]
+
+    @property
+    def is_bound(self):
+        return self.cid_of_row is not None
+
+    def row_for_path(self, cloth_path):
+        if not cloth_path:
+            return None
+        return self.row_of_name.get(os.path.basename(cloth_path.replace("\\", "/")))
+
+    def bind_catalog(self, rows):
+        """
+        Resolve the row -> cid mapping from (cid, cloth_path) rows of the Clothing table.
+        """
+        cid_of_row = np.full(len(self), -1, dtype=np.int64)
+        row_of_cid = {}
+        for cid, cloth_path in rows:
+            row = self.row_for_path(cloth_path)
+            if row is not None:
+                cid_of_row[row] = cid
+                row_of_cid[int(cid)] = row
+        with self._lock:
+            self.cid_of_row = cid_of_row
+            self._row_of_cid = row_of_cid
+
+    def row_for_cid(self, cid):
+        return self._row_of_cid.get(int(cid))
+
+    def rows_for_cids(self, cids):
+        """
+        Map cids to rows, dropping any cid that has no embedding.
+        """
+        rows = (self._row_of_cid.get(int(cid)) for cid in cids)
+        return np.fromiter((r for r in rows if r is not None), dtype=np.int64)
+
+    def top_rows(self, scores, top_n, exclude_rows=()):
+        """
+        Return the rows of the `top_n` highest scores, best first, skipping `exclude_rows`
+        and rows that are not linked to a catalog item.
+        """
+        scores = np.array(scores, dtype=np.float32, copy=True)
+        if self.cid_of_row is not None:
+            scores[self.cid_of_row < 0] = -np.inf
+        if len(exclude_rows):
+            scores[np.asarray(exclude_rows, dtype=np.int64)] = -np.inf
+        top_n = min(top_n, int(np.isfinite(scores).sum()))
+        if top_n <= 0:
+            return np.empty(0, dtype=np.int64)
+        top = np.argpartition(-scores, top_n - 1)[:top_n]
+        return top[np.argsort(-scores[top], kind="stable")]
+
+    def append(self, names, embeddings):
+        """
+        Return a new index with extra rows appended (the current index is left untouched).
+
+        Only the similarity rows of the new items are computed, in O(N * k * d); they are
+        kept as a delta block next to the existing matrix instead of copying it.
+
+        Args:
+            names (list[str]): File names of the new items (basename of `cloth_path`).
+            embeddings (np.ndarray): Raw CLIP embeddings of the new items, shape (k, d).
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(names), self.dim)
+        duplicates = sorted({name for name in names if name in self.row_of_name or names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"Items already in the index or given twice: {duplicates}")
+
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        new_normalized = embeddings / norms
+        normalized = np.vstack([self.normalized, new_normalized])
+
+        similarity, deltas, files = None, [], None
+        if self.similarity is not None:
+            similarity, deltas, files = self.similarity, self.similarity_deltas, self.similarity_files
+            deltas = deltas + [new_normalized @ normalized.T]
+            files = files + [None]
+        return CatalogIndex(np.vstack([self.embeddings, embeddings]), similarity,
+                            self.image_names + list(names), normalized=normalized,
+                            similarity_deltas=deltas, similarity_files=files)
+
+    def similarity_blocks(self):
+        """
+        Yield (first_row, block) for the square matrix and every delta; a block holds the
+        similarities of rows first_row..first_row + len(block) against columns 0..its width.
+        """
+        start = 0
+        for block in [self.similarity] + self.similarity_deltas:
+            yield start, block
+            start += len(block)
+
+    def similarity_rows(self, rows):
+        """
+        Return the similarity rows of `rows` against the whole catalog as a dense (k, N) array.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if self.similarity is None:
+            return self.normalized[rows] @ self.normalized.T
+        if not self.similarity_deltas:
+            return np.array(self.similarity[rows], dtype=np.float32)
+
+        scores = np.empty((len(rows), len(self)), dtype=np.float32)
+        for start, block in self.similarity_blocks():
+            stop = start + len(block)
+            inside = (rows >= start) & (rows < stop)
+            if inside.any():
+                scores[inside, :stop] = block[rows[inside] - start]
+            before = rows < start
+            if before.any():
+                # Older rows against this block's items: the block's columns, by symmetry
+                scores[before, start:stop] = block[:, rows[before]].T
+        return scores
+
+    def nearest_rows(self, rows, top_n, exclude_rows=()):
+        """
+        Find the `top_n` nearest neighbours of every row in `rows` with one vectorized lookup.
+
+        Each seed is excluded from its own neighbours, as are `exclude_rows` and rows
+        not linked to a catalog item.
+
+        Returns:
+            tuple: (neighbours, scores), both shaped (len(rows), top_n), best first.
+                   Missing neighbours are padded with row -1 and score -inf.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        scores = self.similarity_rows(rows)
+        scores[np.arange(len(rows)), rows] = -np.inf
+        if self.cid_of_row is not None:
+            scores[:, self.cid_of_row < 0] = -np.inf
+        if len(exclude_rows):
+            scores[:, np.asarray(exclude_rows, dtype=np.int64)] = -np.inf
+
+        top_n = min(top_n, scores.shape[1])
+        if top_n <= 0 or len(rows) == 0:
+            empty = np.empty((len(rows), 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+        top = np.argpartition(-scores, top_n - 1, axis=1)[:, :top_n]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        neighbours = np.take_along_axis(top, order, axis=1)
+        neighbour_scores = np.take_along_axis(top_scores, order, axis=1)
+        neighbours[~np.isfinite(neighbour_scores)] = -1
+        return neighbours, neighbour_scores
+
+
+def _load_arrays(directory, mmap_mode=None, version=None):
+    embeddings = np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode=mmap_mode)
+    similarity_path = os.path.join(directory, SIMILARITY_FILE)
+    similarity = np.load(similarity_path, mmap_mode="r")
+    delta_paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                         if name.startswith(DELTA_PREFIX) and name.endswith(".npy"))
+    deltas = [np.load(path, mmap_mode="r") for path in delta_paths]
+    normalized_path = os.path.join(directory, NORMALIZED_FILE)
+    normalized = np.load(normalized_path, mmap_mode="r") if os.path.exists(normalized_path) else None
+    image_names = None
+    names_path = os.path.join(directory, NAMES_FILE)
+    if os.path.exists(names_path):
+        with open(names_path, "r", encoding="utf-8") as f:
+            image_names = json.load(f)
+
+    rows = similarity.shape[0]
+    for delta in deltas:
+        rows += len(delta)
+        if delta.shape[1] != rows:
+            raise ValueError("similarity delta files do not line up with the matrix")
+    if rows != len(embeddings) or (image_names and len(image_names) != len(embeddings)):
+        raise ValueError("embedding, similarity and name files have different lengths")
+    return CatalogIndex(embeddings, similarity, image_names, normalized=normalized, version=version,
+                        similarity_deltas=deltas, similarity_files=[similarity_path] + delta_paths)
+
+
+def current_version(index_root=INDEX_ROOT):
+    """
+    Return the name of the live index version, or None if no version has been published.
+    """
+    try:
+        with open(os.path.join(index_root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def load_catalog_index(index_root=INDEX_ROOT, legacy_dir=BASE_DIR):
+    """
+    Load the live index version (memory-mapped), falling back to the legacy files in
+    `backend/`. Returns None if nothing can be loaded.
+    """
+    try:
+        version = current_version(index_root)
+        if version is not None:
+            return _load_arrays(os.path.join(index_root, version), mmap_mode="r", version=version)
+        return _load_arrays(legacy_dir)
+    except Exception as e:
+        print(f"[CatalogIndex] Error loading embeddings: {str(e)}")
+        return None
+
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _link_or_copy(source, target):
+    # A hard link shares the data with the previous version, which may be pruned later
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def publish_catalog_index(index, index_root=INDEX_ROOT):
+    """
+    Publish an index as a new version and atomically point CURRENT at it.
+
+    The version directory is fully written under a temporary name and renamed into place
+    before the pointer moves, so a worker never sees a partially written version.
+    Similarity blocks loaded from an earlier version are linked rather than rewritten;
+    see the module docstring.
+
+    Returns:
+        str: Name of the published version (e.g. "v000004").
+    """
+    os.makedirs(index_root, exist_ok=True)
+    existing = sorted(d for d in os.listdir(index_root) if d.startswith("v") and d[1:].isdigit())
+    version = f"v{int(existing[-1][1:]) + 1 if existing else 1:06d}"
+
+    tmp_dir = os.path.join(index_root, f".{version}.{os.getpid()}.tmp")
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, EMBEDDINGS_FILE), np.asarray(index.embeddings, dtype=np.float32))
+    np.save(os.path.join(tmp_dir, NORMALIZED_FILE), np.asarray(index.normalized, dtype=np.float32))
+    with open(os.path.join(tmp_dir, NAMES_FILE), "w", encoding="utf-8") as f:
+        json.dump(index.image_names, f)
+
+    if index.similarity is None or len(index.similarity_deltas) > MAX_SIMILARITY_DELTAS:
+        # Compact into one matrix
+        if index.similarity is None:
+            similarity = index.normalized @ index.normalized.T
+        else:
+            similarity = index.similarity_rows(np.arange(len(index)))
+        np.save(os.path.join(tmp_dir, SIMILARITY_FILE), np.asarray(similarity, dtype=np.float32))
+    else:
+        for (start, block), source in zip(index.similarity_blocks(), index.similarity_files):
+            name = SIMILARITY_FILE if start == 0 else f"{DELTA_PREFIX}{start:07d}.npy"
+            if source is not None and os.path.exists(source):
+                _link_or_copy(source, os.path.join(tmp_dir, name))
+            else:
+                np.save(os.path.join(tmp_dir, name), np.asarray(block, dtype=np.float32))
+    os.rename(tmp_dir, os.path.join(index_root, version))
+
+    _write_atomic(os.path.join(index_root, CURRENT_FILE), version)
+    _prune_versions(index_root, keep=existing[-(KEEP_VERSIONS - 1):] if KEEP_VERSIONS > 1 else [])
+    return version
+
+
+def _prune_versions(index_root, keep):
+    """
+    Delete old versions beyond KEEP_VERSIONS. Workers still mapping a deleted version keep
+    their view on POSIX; where the OS refuses (open mmaps on Windows) the next publish retries.
+    """
+    live = current_version(index_root)
+    for name in os.listdir(index_root):
+        if name.startswith("v") and name[1:].isdigit() and name != live and name not in keep:
+            shutil.rmtree(os.path.join(index_root, name), ignore_errors=True)
+
+
+_catalog_index = load_catalog_index()
+_loaded_version = _catalog_index.version if _catalog_index is not None else None
+_checked_at = time.monotonic()
+_reload_lock = threading.Lock()
+_reload_listeners = []
+
+
+def add_reload_listener(callback):
+    """
+    Register a callback run after a newly published index is swapped in (e.g. cache clears).
+    """
+    _reload_listeners.append(callback)
+
+
+def _maybe_reload():
+    global _catalog_index, _loaded_version, _checked_at
+    if time.monotonic() - _checked_at < RELOAD_CHECK_INTERVAL:
+        return
+    with _reload_lock:
+        if time.monotonic() - _checked_at < RELOAD_CHECK_INTERVAL:
+            return
+        _checked_at = time.monotonic()
+        version = current_version()
+        if version is None or version == _loaded_version:
+            return
+        index = load_catalog_index()
+        if index is None or index.version != version:
+            return  # The pointer moved again or the load failed; retry on the next check
+        _catalog_index, _loaded_version = index, version
+        print(f"[CatalogIndex] Swapped in index {version} with {len(index)} items")
+    for callback in _reload_listeners:
+        callback()
+
+
+def get_catalog_index(session=None):
+    """
+    Return the live catalog index, binding it to the Clothing table on first use.
+
+    Args:
+        session: Optional SQLAlchemy session used to resolve the row -> cid mapping.
+
+    Returns:
+        CatalogIndex or None: None if the embedding files could not be loaded.
+    """
+    _maybe_reload()
+    index = _catalog_index
+    if index is not None and not index.is_bound and session is not None:
+        from models import Clothing
+        index.bind_catalog(session.query(Clothing.cid, Clothing.cloth_path))
+    return index
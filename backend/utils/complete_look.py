@@ -0,0 +1,79 @@
+"""
+"Complete the Look" Lookup
+Author: OVDR Team
+
+Serves the cross-category compatibility lists produced by `scripts/precompute_complete_look.py`:
+for every top the best-matching bottoms, and for every bottom the best-matching tops.
+
+The lists are stored in `complete_look.npz`:
+    - cids:       (M,) clothing IDs that have a list
+    - neighbours: (M, L) compatible clothing IDs, best first, padded with -1
+    - scores:     (M, L) compatibility scores (co-occurrence count + embedding similarity in [0, 1])
+
+The file is loaded once and reloaded when its modification time changes, so re-running the
+precompute script takes effect without restarting the workers.
+
+Usage:
+    from utils.complete_look import complete_look_lists
+    ids, scores = complete_look_lists.get(clothing_id, top_n)
+"""
+
+import os
+import threading
+
+import numpy as np
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+COMPLETE_LOOK_PATH = os.path.join(BASE_DIR, "complete_look.npz")
+
+# Category whose items complete an outfit for the given category
+COMPLEMENTARY_CATEGORY = {"tops": "bottoms", "bottoms": "tops"}
+
+
+class CompleteLookLists:
+    """
+    Precomputed per-item compatibility lists, reloaded when the file on disk changes.
+    """
+
+    def __init__(self, path=COMPLETE_LOOK_PATH):
+        self.path = path
+        self._mtime = None
+        self._data = ({}, None, None)  # (row_of_cid, neighbours, scores), swapped as one
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            with np.load(self.path) as data:
+                cids, neighbours, scores = data["cids"], data["neighbours"], data["scores"]
+            self._data = ({int(cid): row for row, cid in enumerate(cids)}, neighbours, scores)
+            self._mtime = mtime
+
+    def get(self, clothing_id, top_n):
+        """
+        Return up to `top_n` compatible clothing IDs and their scores for `clothing_id`.
+
+        Returns:
+            tuple or None: (ids, scores) lists, or None if the item has no precomputed list.
+        """
+        self._refresh()
+        row_of_cid, neighbours, scores = self._data
+        row = row_of_cid.get(int(clothing_id))
+        if row is None:
+            return None
+        valid = neighbours[row] >= 0
+        return (
+            neighbours[row][valid][:top_n].tolist(),
+            scores[row][valid][:top_n].tolist(),
+        )
+
+
+# Shared per-process lookup used by the recommendation routes
+complete_look_lists = CompleteLookLists()
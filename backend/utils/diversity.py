@@ -0,0 +1,78 @@
+"""
+Diversity Re-ranking Utilities
+Author: OVDR Team
+
+Nearest neighbours in CLIP space are often near-duplicates (five white tees in a row).
+This module re-ranks a candidate pool with maximal marginal relevance (MMR):
+
+    mmr(i) = lambda * relevance(i) - (1 - lambda) * max_{j in selected} sim(i, j)
+
+The pool's pairwise similarities are computed with one matrix product, and each greedy step
+only updates a running max vector, so a diverse top-k costs about the same as a plain top-k.
+
+Usage:
+    lambda_ = parse_mmr_lambda(request.args.get("mmr_lambda", MMR_LAMBDA))
+    order = mmr_rerank(relevance, index.normalized[pool_rows], k=10, lambda_=lambda_)
+    diverse_rows = pool_rows[order]
+"""
+
+import numpy as np
+
+MMR_LAMBDA = 0.7       # 1.0 = pure relevance, 0.0 = pure diversity
+MMR_POOL_FACTOR = 4    # candidate pool size as a multiple of the requested k
+MMR_MIN_POOL = 20
+
+
+def parse_mmr_lambda(value):
+    """
+    Parse a client-supplied MMR lambda, clamped to [0, 1] and rounded to two decimals so
+    request values cannot create unboundedly many distinct cache keys.
+
+    Raises:
+        ValueError: If `value` is not a finite number.
+    """
+    lambda_ = float(value)
+    if not np.isfinite(lambda_):
+        raise ValueError("mmr_lambda must be a finite number")
+    return round(min(max(lambda_, 0.0), 1.0), 2)
+
+
+def mmr_pool_size(k):
+    """
+    Number of plain top-k candidates to fetch before MMR re-ranking.
+    """
+    return max(k * MMR_POOL_FACTOR, MMR_MIN_POOL)
+
+
+def mmr_rerank(relevance, vectors, k, lambda_=MMR_LAMBDA):
+    """
+    Select `k` candidates balancing relevance against similarity to already selected ones.
+
+    Args:
+        relevance (np.ndarray): Relevance score per candidate, shape (p,).
+        vectors (np.ndarray): L2-normalized candidate embeddings, shape (p, d).
+        k (int): Number of candidates to select.
+        lambda_ (float): Trade-off between relevance (1.0) and diversity (0.0).
+
+    Returns:
+        np.ndarray: Indices into the candidate pool, in selection order.
+    """
+    relevance = np.asarray(relevance, dtype=np.float32)
+    k = min(k, len(relevance))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    pairwise = vectors @ vectors.T
+    max_sim = np.zeros(len(relevance), dtype=np.float32)
+    available = np.isfinite(relevance)
+    selected = []
+    for _ in range(k):
+        scores = lambda_ * relevance - (1.0 - lambda_) * max_sim
+        scores[~available] = -np.inf
+        pick = int(np.argmax(scores))
+        if not np.isfinite(scores[pick]):
+            break
+        selected.append(pick)
+        available[pick] = False
+        np.maximum(max_sim, pairwise[pick], out=max_sim)
+    return np.asarray(selected, dtype=np.int64)
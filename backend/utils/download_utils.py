@@ -1,12 +1,205 @@
+"""
+Garment Image Resolution and Downloads
+Author: Zhihao Cao
+Modifier: OVDR Team
+
+Turns the garment reference of a try-on request into a local image file for StableVITON.
+
+Catalog garments never go over HTTP: a `cloth_path` from the database ("data/clothes/...") or a
+URL served by this backend ("http://localhost:5000/data/clothes/...") is mapped straight to the
+file under data/clothes/, without copying it. Only truly external URLs are downloaded, through
+one pooled `requests.Session`, into a size-bounded cache keyed by URL. Concurrent requests for
+the same URL share a single download.
+
+Functions:
+    - catalog_relative_path(ref): "data/clothes/..." path for a catalog garment reference, or None.
+    - resolve_garment_path(ref): Local path of the garment image (downloading external URLs).
+    - download_cloth_image(url, save_path): Download an image to `save_path`.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from urllib.parse import unquote, urlparse
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import Config
+from utils.helpers import BASE_URL
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+CLOTHES_DIR = os.path.join(BASE_DIR, "data", "clothes")
+GARMENT_CACHE_DIR = os.path.join(BASE_DIR, "store_data", "garment_cache")
+
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1", urlparse(BASE_URL).hostname}
+DOWNLOAD_TIMEOUT = (5, 30)              # (connect, read) seconds
+MAX_DOWNLOAD_BYTES = 20 * 1024 * 1024   # refuse garment images larger than this
+
+
+def _make_session():
+    session = requests.Session()
+    retry = Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 503, 504), allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# Shared connection pool for external garment downloads
+http_session = _make_session()
+
 
 def download_cloth_image(url, save_path):
-    response = requests.get(url, stream=True)
-    if response.status_code == 200:
-        with open(save_path, 'wb') as f:
-            for chunk in response.iter_content(1024):
-                f.write(chunk)
+    """
+    Download an image to `save_path` through the shared session.
+
+    Returns:
+        bool: True on success, False if the server answered with an error or the file is too large.
+    """
+    try:
+        with http_session.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+            if response.status_code != 200:
+                print("Failed to download the image from:", url)
+                return False
+            written = 0
+            with open(save_path, 'wb') as f:
+                for chunk in response.iter_content(64 * 1024):
+                    written += len(chunk)
+                    if written > MAX_DOWNLOAD_BYTES:
+                        break
+                    f.write(chunk)
+        if written > MAX_DOWNLOAD_BYTES:
+            os.remove(save_path)
+            print("Image too large, download aborted:", url)
+            return False
         return True
+    except requests.RequestException as e:
+        print(f"Failed to download the image from: {url} ({str(e)})")
+        return False
+
+
+def catalog_relative_path(ref):
+    """
+    Return the "data/clothes/..." path if `ref` refers to a catalog image, otherwise None.
+
+    Accepts a database `cloth_path` or a URL served by this backend's /data/clothes/ route.
+    """
+    if not ref:
+        return None
+    parsed = urlparse(ref)
+    if parsed.scheme in ("http", "https"):
+        if parsed.hostname not in LOCAL_HOSTS:
+            return None
+        path = unquote(parsed.path).lstrip("/")
     else:
-        print("Failed to download the image from:", url)
-        return False
\ No newline at end of file
+        path = ref.replace("\\", "/").lstrip("./")
+    path = os.path.normpath(path).replace(os.sep, "/")
+    return path if path.startswith("data/clothes/") else None
+
+
+class GarmentDownloadCache:
+    """
+    Downloaded external garment images, keyed by URL and bounded by total size (LRU).
+    """
+
+    def __init__(self, cache_dir=GARMENT_CACHE_DIR, max_bytes=256 * 1024 ** 2):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._entries = None  # key -> size in bytes, least recently used first
+        self._total = 0
+        self._lock = threading.Lock()
+        self._in_flight = {}  # key -> lock held while that URL downloads
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.jpg")
+
+    def _load_index(self):
+        # Called with the lock held
+        files = []
+        if os.path.isdir(self.cache_dir):
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(".jpg"):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        files.sort()
+        self._entries = OrderedDict((key, size) for _, key, size in files)
+        self._total = sum(self._entries.values())
+
+    def _register(self, key, size):
+        # Called with the lock held; returns keys to delete
+        self._total += size - self._entries.pop(key, 0)
+        self._entries[key] = size
+        evicted = []
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            old_key, old_size = self._entries.popitem(last=False)
+            self._total -= old_size
+            evicted.append(old_key)
+        return evicted
+
+    def fetch(self, url):
+        """
+        Return a local copy of `url`, downloading it once if needed.
+
+        Returns:
+            str or None: Path of the cached image, or None if the download failed.
+        """
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        path = self._path(key)
+        with self._lock:
+            if self._entries is None:
+                self._load_index()
+            if key in self._entries and os.path.exists(path):
+                self._entries.move_to_end(key)
+                return path
+            download_lock = self._in_flight.setdefault(key, threading.Lock())
+
+        with download_lock:
+            # Another request may have finished the same download while we waited
+            if not os.path.exists(path):
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                if not download_cloth_image(url, tmp_path):
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    with self._lock:
+                        self._in_flight.pop(key, None)
+                    return None
+                os.replace(tmp_path, path)
+            with self._lock:
+                evicted = self._register(key, os.path.getsize(path))
+                self._in_flight.pop(key, None)
+
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+        return path
+
+
+garment_download_cache = GarmentDownloadCache(max_bytes=Config.GARMENT_CACHE_MAX_BYTES)
+
+
+def resolve_garment_path(ref):
+    """
+    Return the local path of a garment image reference.
+
+    Args:
+        ref (str): Catalog `cloth_path`, a URL served by this backend, or an external URL.
+
+    Returns:
+        str or None: Absolute path of the image, or None if it cannot be found or downloaded.
+    """
+    relative = catalog_relative_path(ref)
+    if relative is not None:
+        path = os.path.abspath(os.path.join(BASE_DIR, relative))
+        # normpath above cannot climb out of data/clothes, but check the final path anyway
+        if path.startswith(CLOTHES_DIR + os.sep) and os.path.isfile(path):
+            return path
+        return None
+    if urlparse(ref).scheme in ("http", "https"):
+        return garment_download_cache.fetch(ref)
+    return None
@@ -11,11 +11,16 @@ Functions:
     - save_user_image(file, user_id): Save uploaded image and return both absolute and relative paths.
     - delete_user_image_if_exists(image_path): Delete an existing user image from disk if it exists.
     - rename_output_image(dir_path): Auto-generate the next image filename in sequence (e.g., 0000001.jpg).
+    - publish_tryon_image(source_path, user_id): Atomically store a try-on result under a content-hash name.
 """
 
+import hashlib
 import os
+import threading
 from flask import current_app
 
+COMBINATIONS_DIR = "./data/combinations"  # served by /show_image/<userid>/<filename>
+
 def get_user_image_path(user):
     """
     Get the absolute file path of a user's uploaded image.
@@ -80,3 +85,36 @@ def rename_output_image(dir_path):
     numbers = [int(f[:7]) for f in filenames]  # get the 7-bit digit
     next_number = max(numbers) + 1 # search the max number
     return f"{next_number:07d}.jpg" # ensure 7-bit digits
+
+
+def publish_tryon_image(source_path, user_id):
+    """
+    Store a generated try-on image in the user's combinations folder.
+
+    The file is named after its content hash and sharded by the first two hex digits
+    (user_<id>/ab/ab12cd34ef56ab78.jpg), so no directory listing is needed to pick a name
+    and concurrent publishes can never collide. It is written to a temporary file and
+    renamed into place, so readers never see a partial image.
+
+    Args:
+        source_path (str): Generated image (job scratch file or try-on cache entry).
+        user_id (int): Owner of the result.
+
+    Returns:
+        str: Path relative to the user's folder, e.g. "ab/ab12cd34ef56ab78.jpg".
+    """
+    user_dir = os.path.join(COMBINATIONS_DIR, f"user_{user_id}")
+    os.makedirs(user_dir, exist_ok=True)
+    tmp_path = os.path.join(user_dir, f".{os.getpid()}.{threading.get_ident()}.tmp")
+
+    digest = hashlib.sha256()
+    with open(source_path, "rb") as src, open(tmp_path, "wb") as dst:
+        for chunk in iter(lambda: src.read(1 << 20), b""):
+            digest.update(chunk)
+            dst.write(chunk)
+
+    name = digest.hexdigest()[:16]
+    relative_path = f"{name[:2]}/{name}.jpg"
+    os.makedirs(os.path.join(user_dir, name[:2]), exist_ok=True)
+    os.replace(tmp_path, os.path.join(user_dir, relative_path))
+    return relative_path
@@ -0,0 +1,229 @@
+"""
+MinHash LSH Index for Similar-User Lookup
+Author: OVDR Team
+
+This module keeps an in-memory MinHash/LSH index over every user's browsing history set,
+so the "similar users" step of collaborative filtering no longer needs an exact
+`DISTINCT user_id WHERE clothing_id IN (...)` scan over the whole History table.
+
+How it works:
+    - Each history set is summarised by a MinHash signature (NUM_PERM universal hashes).
+    - The signature is cut into BANDS bands; users sharing any band bucket are candidates.
+    - Candidates are ranked by their estimated Jaccard similarity.
+
+The index is built lazily from one History scan and then kept current by `/add-history`.
+Each Flask worker holds its own copy, so it is also rebuilt every REBUILD_INTERVAL seconds
+to pick up writes served by other workers.
+
+Usage:
+    from utils.minhash_lsh import user_history_index
+    user_history_index.refresh(lambda: session.query(History.user_id, History.clothing_id))
+    neighbours = user_history_index.similar_users(user_id)
+"""
+
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+NUM_PERM = 64           # signature length
+BANDS = 32              # 32 bands x 2 rows: candidates from roughly 0.18 Jaccard upwards
+MAX_NEIGHBOURS = 200    # cap on neighbours handed to the candidate-item query
+REBUILD_INTERVAL = 600  # seconds before a worker re-reads History from the database
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+class MinHashLSH:
+    """
+    Banded MinHash index mapping arbitrary keys to integer item sets.
+    """
+
+    def __init__(self, num_perm=NUM_PERM, bands=BANDS, seed=1):
+        if num_perm % bands != 0:
+            raise ValueError("num_perm must be divisible by bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.RandomState(seed)
+        # h(x) = (a * x + b) mod p, with a, b < 2^32 so the product stays inside uint64
+        self._a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._buckets = [defaultdict(set) for _ in range(bands)]
+        self._signatures = {}
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def __contains__(self, key):
+        return key in self._signatures
+
+    def signature(self, items):
+        """
+        Compute the MinHash signature of an iterable of non-negative integers.
+
+        Returns:
+            np.ndarray: uint64 array of length num_perm (all max values for an empty set).
+        """
+        values = np.fromiter((int(i) & 0xFFFFFFFF for i in items), dtype=np.uint64)
+        if values.size == 0:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        hashed = (np.outer(self._a, values) + self._b[:, None]) % _MERSENNE_PRIME
+        return (hashed & _MAX_HASH).min(axis=1)
+
+    def _band_keys(self, signature):
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def insert(self, key, items):
+        """
+        Insert or replace the set stored under `key`.
+        """
+        self.remove(key)
+        signature = self.signature(items)
+        self._signatures[key] = signature
+        for band, band_key in enumerate(self._band_keys(signature)):
+            self._buckets[band][band_key].add(key)
+
+    def remove(self, key):
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        for band, band_key in enumerate(self._band_keys(signature)):
+            bucket = self._buckets[band].get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band][band_key]
+
+    def query(self, key, limit=None):
+        """
+        Find keys whose sets are likely similar to the set stored under `key`.
+
+        Returns:
+            list[tuple]: (other_key, estimated_jaccard) pairs, most similar first.
+        """
+        signature = self._signatures.get(key)
+        if signature is None:
+            return []
+        candidates = set()
+        for band, band_key in enumerate(self._band_keys(signature)):
+            candidates.update(self._buckets[band].get(band_key, ()))
+        candidates.discard(key)
+        if not candidates:
+            return []
+
+        candidates = list(candidates)
+        others = np.stack([self._signatures[c] for c in candidates])
+        estimates = (others == signature).mean(axis=1)
+        order = np.argsort(-estimates, kind="stable")
+        if limit is not None:
+            order = order[:limit]
+        return [(candidates[i], float(estimates[i])) for i in order]
+
+
+class UserHistoryIndex:
+    """
+    Thread-safe wrapper holding each user's history set alongside its MinHash LSH entry.
+    """
+
+    def __init__(self, rebuild_interval=REBUILD_INTERVAL, **lsh_kwargs):
+        self.rebuild_interval = rebuild_interval
+        self._lsh_kwargs = lsh_kwargs
+        self._lsh = MinHashLSH(**lsh_kwargs)
+        self._items = {}
+        self._built_at = None
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()  # held by the one thread rebuilding, see refresh()
+
+    def needs_rebuild(self):
+        built_at = self._built_at
+        return built_at is None or time.monotonic() - built_at > self.rebuild_interval
+
+    def refresh(self, load_rows):
+        """
+        Rebuild the index if it is due, with at most one rebuild running at a time.
+
+        `load_rows` is only called by the thread that does the rebuild. While a periodic
+        rebuild is running, other requests keep using the current index; before the first
+        build they wait for it instead of each scanning History.
+
+        Args:
+            load_rows (callable): Returns the (user_id, clothing_id) rows, e.g. a History query.
+        """
+        if not self.needs_rebuild():
+            return
+        if not self._rebuild_lock.acquire(blocking=self._built_at is None):
+            return
+        try:
+            if self.needs_rebuild():  # another thread may have rebuilt while we waited
+                self.rebuild(load_rows())
+        finally:
+            self._rebuild_lock.release()
+
+    def rebuild(self, rows):
+        """
+        Rebuild the whole index from (user_id, clothing_id) rows, e.g. a History query.
+        """
+        items = defaultdict(set)
+        for user_id, clothing_id in rows:
+            items[int(user_id)].add(int(clothing_id))
+
+        lsh = MinHashLSH(**self._lsh_kwargs)
+        for user_id, clothing_ids in items.items():
+            lsh.insert(user_id, clothing_ids)
+
+        with self._lock:
+            self._lsh = lsh
+            self._items = dict(items)
+            self._built_at = time.monotonic()
+
+    def record_view(self, user_id, clothing_id, evicted=()):
+        """
+        Apply one `/add-history` write: add the viewed item and drop any trimmed records.
+        Ignored until the index has been built, since the first build reads the full table.
+        """
+        if self._built_at is None:
+            return
+        user_id = int(user_id)
+        with self._lock:
+            clothing_ids = self._items.setdefault(user_id, set())
+            clothing_ids.difference_update(int(c) for c in evicted)
+            clothing_ids.add(int(clothing_id))
+            self._lsh.insert(user_id, clothing_ids)
+
+    def update_user(self, user_id, clothing_ids):
+        """
+        Replace one user's history set, e.g. after a write served by another worker.
+        """
+        user_id = int(user_id)
+        clothing_ids = {int(c) for c in clothing_ids}
+        with self._lock:
+            self._items[user_id] = clothing_ids
+            self._lsh.insert(user_id, clothing_ids)
+
+    def items_of(self, user_id):
+        with self._lock:
+            return set(self._items.get(int(user_id), ()))
+
+    def similar_users(self, user_id, limit=MAX_NEIGHBOURS):
+        """
+        Return up to `limit` user IDs whose histories likely overlap with `user_id`'s.
+        """
+        with self._lock:
+            return [other for other, _ in self._lsh.query(int(user_id), limit=limit)]
+
+    def neighbour_histories(self, user_id, limit=MAX_NEIGHBOURS):
+        """
+        Return (history_set, estimated_jaccard) for up to `limit` likely neighbours of `user_id`.
+        """
+        with self._lock:
+            return [
+                (set(self._items.get(other, ())), similarity)
+                for other, similarity in self._lsh.query(int(user_id), limit=limit)
+            ]
+
+
+# Shared per-process index used by the history and recommendation routes
+user_history_index = UserHistoryIndex()
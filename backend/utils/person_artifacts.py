@@ -0,0 +1,140 @@
+"""
+Person Preprocessing Artifacts
+Author: OVDR Team
+
+On-disk store of the garment-independent preprocessing of a user's photo (resized person image,
+pose keypoints, human parsing, DensePose) and of the per-category agnostic maps and masks.
+With these stored, a try-on only does the garment-dependent work.
+
+Artifacts are keyed by the SHA-256 of the photo, so a new upload never reuses the previous
+photo's artifacts; the old set is removed (`invalidate`) when the photo changes, unless another
+user's photo has the same bytes (see tryon_pipeline.refresh_person_artifacts).
+
+Layout:
+    store_data/person_artifacts/<digest>/person.png, parse.png, densepose.png, keypoints.json,
+                                        agnostic_<category>.png, mask_<category>.png
+
+This module must not import the Flask config: the try-on worker uses it from the
+StableViton environment.
+
+Usage:
+    from utils.person_artifacts import person_artifacts, file_digest
+    digest = file_digest(photo_path)
+    parse = person_artifacts.load_image(digest, "parse")   # None if not stored yet
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from PIL import Image
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+ARTIFACT_DIR = os.path.join(BASE_DIR, "store_data", "person_artifacts")
+
+_digest_cache = {}  # path -> ((mtime_ns, size), sha256 hex)
+_digest_lock = threading.Lock()
+
+
+def file_digest(path):
+    """
+    SHA-256 of a file's contents, memoised until the file's mtime or size changes.
+    """
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _digest_lock:
+        cached = _digest_cache.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    with _digest_lock:
+        _digest_cache[path] = (signature, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def _to_json(value):
+    # Pose estimators return numpy arrays and scalars
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Cannot store {type(value).__name__} as JSON")
+
+
+class PersonArtifactStore:
+    """
+    Preprocessing artifacts of user photos, one directory per photo digest.
+    """
+
+    def __init__(self, root=ARTIFACT_DIR):
+        self.root = root
+
+    def directory(self, digest):
+        return os.path.join(self.root, digest)
+
+    def _path(self, digest, name, ext):
+        return os.path.join(self.root, digest, f"{name}.{ext}")
+
+    def _write_atomic(self, path, write):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)  # readers never see a partial file
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def has(self, digest, names):
+        """
+        True if every artifact in `names` is stored for this photo.
+        """
+        directory = self.directory(digest)
+        if not os.path.isdir(directory):
+            return False
+        stored = {os.path.splitext(name)[0] for name in os.listdir(directory)}
+        return all(name in stored for name in names)
+
+    def load_image(self, digest, name):
+        """
+        Return a stored image artifact (fully loaded), or None if it is missing.
+        """
+        try:
+            with Image.open(self._path(digest, name, "png")) as image:
+                image.load()
+                return image
+        except (OSError, ValueError):
+            return None
+
+    def save_image(self, digest, name, image):
+        # PNG is lossless and keeps the mode ("P" parse maps, "L" masks)
+        self._write_atomic(self._path(digest, name, "png"), lambda path: image.save(path, format="PNG"))
+
+    def load_json(self, digest, name):
+        try:
+            with open(self._path(digest, name, "json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_json(self, digest, name, data):
+        def write(path):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(data, f, default=_to_json)
+        self._write_atomic(self._path(digest, name, "json"), write)
+
+    def invalidate(self, digest):
+        """
+        Delete every artifact of a photo. The caller checks that no other user's photo has
+        this digest (tryon_pipeline.refresh_person_artifacts).
+        """
+        if digest:
+            shutil.rmtree(self.directory(digest), ignore_errors=True)
+
+
+# Shared store used by the try-on backends and the upload route
+person_artifacts = PersonArtifactStore()
@@ -0,0 +1,107 @@
+"""
+Recommendation Result Cache
+Author: OVDR Team
+
+A small in-process cache for recommendation responses, keyed by (endpoint, user or item, top_n).
+
+Entries are bounded both by age (TTL) and by count (least recently used entries are evicted
+first). Entries computed for a user are tagged with that user's ID so that `/add-history`,
+`/add-to-closet` and `/remove-from-closet` can drop them as soon as the user's state changes.
+Each worker keeps its own cache, so writes served by another worker are picked up once the
+TTL expires.
+
+Usage:
+    from utils.recommend_cache import recommendation_cache
+    payload = recommendation_cache.get(("user", user_id, top_n))
+    recommendation_cache.set(("user", user_id, top_n), payload, user_id=user_id)
+    recommendation_cache.invalidate_user(user_id)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+
+
+class RecommendationCache:
+    """
+    Thread-safe TTL + LRU cache with per-user invalidation.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, user_id, value)
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Return the cached value for `key`, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def set(self, key, value, user_id=None):
+        """
+        Store `value` under `key`; pass `user_id` for results that depend on a user's state.
+        """
+        if self.maxsize <= 0:
+            return
+        if user_id is not None:
+            user_id = _user_key(user_id)
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (time.monotonic() + self.ttl, user_id, value)
+            if user_id is not None:
+                self._keys_by_user.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id):
+        """
+        Drop every entry computed for `user_id`.
+        """
+        with self._lock:
+            for key in self._keys_by_user.pop(_user_key(user_id), ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry[1] is not None:
+            keys = self._keys_by_user.get(entry[1])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_user[entry[1]]
+
+
+def _user_key(user_id):
+    # Route parameters are ints while JSON bodies may carry strings
+    try:
+        return int(user_id)
+    except (TypeError, ValueError):
+        return user_id
+
+
+# Shared per-process cache used by the recommendation routes
+recommendation_cache = RecommendationCache(
+    maxsize=Config.RECOMMEND_CACHE_SIZE,
+    ttl=Config.RECOMMEND_CACHE_TTL,
+)
@@ -4,37 +4,66 @@ Author: Zhihao Cao
 Maintainer: Zixin Ding and Zhihao Cao
 
 This utility module is responsible for invoking the StableVITON model
-to generate virtual try-on images using subprocess from within the Flask backend.
+to generate virtual try-on images from within the Flask backend.
 
-It spawns a new console and executes `app.py` inside the StableVITON model folder,
+If `TRYON_WORKER_ADDRESS` and `TRYON_WORKER_AUTHKEY` are configured, the request is sent to
+the persistent try-on worker (`scripts/run_tryon_worker.py`), which keeps the model loaded
+between requests.
+Otherwise it spawns a new console and executes `app.py` inside the StableVITON model folder,
 passing the necessary image paths and clothing category as arguments.
 
 Usage:
     run_stableviton(input_image_path, cloth_path, category)
+    run_stableviton_batch(input_image_path, [(cloth_path, category), ...], output_dir)
+    prepare_person(input_image_path)
 """
 
 import os
 import subprocess
 import sys
+import time
+import uuid
 from pathlib import Path
 
+from config import Config
+from utils.tryon_backends import QUALITY_TIERS
+from utils.tryon_metrics import timed
+from utils.tryon_worker import TryOnWorkerClient
+
 # Get stableviton path relative to this utils file
 stableviton_path = Path(__file__).resolve().parent.parent / "models" / "StableVITON"
 
 #current_file_path = Path(__file__).absolute()
 #stableviton_path = current_file_path.parent.parent / "models" / "StableVITON"
 
+
+def _make_worker_client():
+    if not Config.TRYON_WORKER_ADDRESS:
+        return None
+    if not Config.TRYON_WORKER_AUTHKEY:
+        # The worker protocol unpickles what it receives; never talk to it with a guessable key
+        print("[TryOn] TRYON_WORKER_ADDRESS is set but TRYON_WORKER_AUTHKEY is not: "
+              "the try-on worker is disabled, app.py is spawned per request")
+        return None
+    return TryOnWorkerClient(Config.TRYON_WORKER_ADDRESS, Config.TRYON_WORKER_AUTHKEY,
+                             Config.TRYON_WORKER_TIMEOUT)
+
+
+# Client for the persistent try-on worker, if one is configured (None otherwise)
+worker_client = _make_worker_client()
+
 ENV_NAMES = {
     "main": "OVDR",         
     "model": "StableViton"   
 }
 
-def run_in_conda(env_name, command_args):
+def run_in_conda(env_name, command_args, stdout=None):
     """change the virtual environment and run the python file in the same virtual environment
     
     Args:
         env_name (str): environment name
         command_args (list): python file name and arguments
+        stdout: optional stdout of the subprocess, e.g. subprocess.PIPE to read what it prints
     Returns:
         subprocess.Popen: subprocess object
     """
@@ -54,34 +83,141 @@ def run_in_conda(env_name, command_args):
         cwd=str(stableviton_path),
         env=os.environ.copy(),
         creationflags=subprocess.CREATE_NEW_CONSOLE,
+        stdout=stdout,
         )
 
-def run_stableviton(input_image_path, cloth_path, category):
+def run_stableviton(input_image_path, cloth_path, category, output_dir=None, on_progress=None,
+                    priority="interactive", quality="full"):
     """
-    Launch StableVITON's app.py to process try-on generation.
+    Generate a try-on image with StableVITON, via the persistent worker when configured.
 
     Args:
         input_image_path (str): Absolute path to the user's full-body image.
         cloth_path (str): Absolute path to the selected clothing image.
         category (str): Clothing type (e.g. "tops", "bottoms", "dresses").
+        output_dir (str): Directory the result is written to; give each job its own so
+                          concurrent runs never see each other's files.
+                          Defaults to a new directory under StableVITON/output_images.
+        on_progress (callable): Optional progress(stage, step, total) callback, worker mode only.
+        priority (str): "interactive", or "speculative" for background work that the worker
+                        aborts (RenderPreempted) in favour of interactive requests.
+        quality (str): Quality tier, "full" or "preview" (QUALITY_TIERS). The spawned app.py
+                       always renders at full quality.
+
+    Returns:
+        str: Path of the generated image.
 
     Raises:
-        RuntimeError: If StableVITON script exits with a non-zero code.
+        RuntimeError: If StableVITON fails or produces no image (neither in `output_dir`
+                      nor at the path it prints).
     """
+    output_dir = os.path.abspath(output_dir or stableviton_path / "output_images" / uuid.uuid4().hex)
+    os.makedirs(output_dir, exist_ok=True)
 
-    result = run_in_conda(
-            env_name="model",
-            command_args=[
-                "app.py",
-                os.path.abspath(input_image_path),
-                os.path.abspath(cloth_path),
-                category
-            ]
+    if worker_client is not None:
+        return worker_client.generate(
+            os.path.abspath(input_image_path),
+            os.path.abspath(cloth_path),
+            category,
+            os.path.join(output_dir, f"{time.time():.0f}.jpg"),
+            quality=QUALITY_TIERS[quality],
+            on_progress=on_progress,
+            priority=priority,
         )
-    # the env,cwd and sys.executable ensure that execute the python file in the same virtual environment
-    result.wait()
+
+    with timed("model"):  # the spawned run loads the model, preprocesses and samples
+        result = run_in_conda(
+                env_name="model",
+                command_args=[
+                    "app.py",
+                    os.path.abspath(input_image_path),
+                    os.path.abspath(cloth_path),
+                    category,
+                    output_dir
+                ],
+                stdout=subprocess.PIPE,
+            )
+        # the env,cwd and sys.executable ensure that execute the python file in the same virtual environment
+        printed, _ = result.communicate()
 
     if result.returncode != 0:
         raise RuntimeError("StableVITON execution failed")
-    
-    return True
+
+    # Only this job writes into output_dir, so its image cannot be another job's
+    files = [f for f in os.listdir(output_dir) if f.endswith('.jpg')]
+    if files:
+        return os.path.join(output_dir, max(files))
+    return _adopt_printed_output(printed, output_dir)
+
+
+def _adopt_printed_output(printed, output_dir):
+    """
+    Find the result of an app.py that ignores the output directory argument (the original
+    README version saves into StableVITON/output_images/). Such a script prints the path it
+    saved as its last line; that path belongs to this run, unlike the newest file in the
+    shared folder. The image is moved into `output_dir`.
+    """
+    lines = (printed or b"").decode(errors="replace").strip().splitlines()
+    saved_path = lines[-1].strip() if lines else ""
+    if not saved_path.endswith(".jpg") or not os.path.isfile(saved_path):
+        raise RuntimeError(f"StableVITON wrote no image to {output_dir} and printed no image path")
+    output_path = os.path.join(output_dir, os.path.basename(saved_path))
+    os.replace(saved_path, output_path)
+    return output_path
+
+
+def run_stableviton_batch(input_image_path, garments, output_dir, on_progress=None, quality="full"):
+    """
+    Generate try-ons of several garments on the same person.
+
+    With the persistent worker this is one request: the person is preprocessed once and the
+    garments are rendered back-to-back. Without it, app.py is spawned once per garment.
+
+    Args:
+        input_image_path (str): Absolute path to the user's full-body image.
+        garments (list[tuple]): (cloth_path, category) per garment.
+        output_dir (str): Scratch directory owned by this batch.
+        on_progress (callable): Optional progress(stage, step, total) callback, worker mode only.
+        quality (str): Quality tier, "full" or "preview" (worker mode only).
+
+    Returns:
+        list[dict]: {"ok": True, "output_path": ...} or {"ok": False, "error": ...} per garment.
+    """
+    output_dir = os.path.abspath(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+
+    if worker_client is not None:
+        items = [
+            {"cloth_path": os.path.abspath(cloth_path), "category": category,
+             "output_path": os.path.join(output_dir, f"{index}.jpg")}
+            for index, (cloth_path, category) in enumerate(garments)
+        ]
+        return worker_client.generate_batch(os.path.abspath(input_image_path), items,
+                                            quality=QUALITY_TIERS[quality], on_progress=on_progress)
+
+    results = []
+    for index, (cloth_path, category) in enumerate(garments):
+        try:
+            output_path = run_stableviton(input_image_path, cloth_path, category,
+                                          os.path.join(output_dir, str(index)))
+            results.append({"ok": True, "output_path": output_path})
+        except RuntimeError as e:
+            results.append({"ok": False, "error": str(e)})
+    return results
+
+
+def prepare_person(input_image_path):
+    """
+    Precompute the person preprocessing of a photo on the persistent worker.
+
+    The spawned app.py cannot reuse anything between runs, so without a worker this does nothing.
+
+    Returns:
+        bool: True if the worker computed new artifacts.
+
+    Raises:
+        RuntimeError: If the worker fails to process the photo.
+    """
+    if worker_client is None:
+        return False
+    return worker_client.prepare(os.path.abspath(input_image_path))
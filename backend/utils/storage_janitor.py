@@ -0,0 +1,383 @@
+"""
+Storage Janitor
+Author: OVDR Team
+
+Background clean-up of the try-on files that nothing else ever deletes:
+
+    combinations      data/combinations/user_<id>/ results. Files no saved Combination points at
+                      (Combination.outfit_path) are deleted once older than STORAGE_ORPHAN_TTL.
+                      A user over STORAGE_USER_QUOTA_BYTES loses their oldest unsaved results,
+                      and if all areas together exceed STORAGE_MAX_BYTES the oldest unsaved
+                      results of any user go. Saved outfits are never deleted by the janitor.
+                      Only content-named results from publish_tryon_image are candidates, and a
+                      user whose outfit paths cannot all be resolved is skipped entirely.
+    scratch           store_data/tryon_scratch/ job directories left behind by a crash.
+    legacy            StableVITON/output_images/ and store_data/input_clothes/, written by the
+                      old per-request pipeline; their files expire after STORAGE_TEMP_TTL.
+    person_artifacts  store_data/person_artifacts/ sets (utils/person_artifacts.py) unused for
+                      STORAGE_ORPHAN_TTL that do not belong to a current user photo (e.g. the
+                      intermediate images of outfit try-ons).
+
+Results younger than RECENT_SECONDS are never touched: the user may still be looking at one
+they have not saved yet. The try-on result and garment caches bound themselves and are left alone.
+
+Deletions run in batches of STORAGE_DELETE_BATCH files with a short pause in between, so a
+large sweep does not monopolise the disk. Every sweep reports the bytes it reclaimed.
+
+Usage:
+    from utils.storage_janitor import storage_janitor
+    storage_janitor.start(app)      # sweeps every STORAGE_SWEEP_INTERVAL seconds
+    storage_janitor.sweep()         # one sweep now (inside the app context)
+    storage_janitor.remove_outfit(combination)
+"""
+
+import os
+import re
+import shutil
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import unquote, urlparse
+
+from config import Config
+from models import Combination, User
+from utils.image_utils import COMBINATIONS_DIR, get_user_image_path
+from utils.person_artifacts import ARTIFACT_DIR, file_digest
+from utils.stableviton_runner import stableviton_path
+from utils.tryon_pipeline import BASE_DIR, SCRATCH_DIR
+
+LEGACY_DIRS = (
+    str(stableviton_path / "output_images"),
+    os.path.join(BASE_DIR, "store_data", "input_clothes"),
+)
+# Legacy outfit_path values relative to data/combinations/: "user_11/0.jpg" or "user_5_0.jpg"
+LEGACY_OUTFIT_PATH = re.compile(r"^user_\d+(/|_[^/]+$)")
+PUBLISHED_RESULT = re.compile(r"^([0-9a-f]{2})/\1[0-9a-f]{14}\.jpg$")
+RECENT_SECONDS = 600   # results younger than this are kept whatever the quotas say
+BATCH_PAUSE = 0.05     # seconds between two deletion batches
+
+
+def _combinations_root():
+    # COMBINATIONS_DIR is relative to the working directory, like publish_tryon_image
+    return os.path.abspath(COMBINATIONS_DIR)
+
+
+def outfit_file(outfit_path):
+    """
+    Absolute path of the image a Combination.outfit_path refers to, or None if it does not
+    point into data/combinations/.
+
+    Accepts the "/show_image/<user_id>/<path>" URL the frontend saves (with or without host),
+    "data/combinations/user_<id>/<path>" paths, and the legacy forms stored relative to
+    data/combinations/: "user_<id>/<path>" and flat names such as "user_5_0.jpg".
+    """
+    path = unquote(urlparse(outfit_path or "").path).replace("\\", "/")
+    root = _combinations_root()
+    if "/show_image/" in path:
+        user_id, _, relative = path.split("/show_image/", 1)[1].partition("/")
+        candidate = os.path.join(root, f"user_{user_id}", relative)
+    elif "data/combinations/" in path:
+        candidate = os.path.join(root, path.split("data/combinations/", 1)[1])
+    elif LEGACY_OUTFIT_PATH.match(path):
+        candidate = os.path.join(root, path)
+    else:
+        return None
+    candidate = os.path.normpath(candidate)
+    # Never follow a path out of the combinations folder
+    if os.path.commonpath([root, candidate]) != root or candidate == root:
+        return None
+    return candidate
+
+
+def is_published_result(relative_path):
+    """
+    True for files written by publish_tryon_image ("ab/ab12cd34ef56ab78.jpg" in a user folder).
+    Anything else predates the janitor (e.g. numbered results and demo images) and is never
+    deleted by it.
+    """
+    return PUBLISHED_RESULT.match(relative_path.replace("\\", "/")) is not None
+
+
+def _walk_files(directory):
+    """
+    Yield (path, size, mtime) of every file under `directory`.
+    """
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk_files(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                stat = entry.stat(follow_symlinks=False)
+                yield entry.path, stat.st_size, stat.st_mtime
+        except OSError:
+            continue
+
+
+def _tree_size(directory):
+    """
+    (total bytes, newest mtime) of a directory tree.
+    """
+    size, newest = 0, 0.0
+    for _, file_size, mtime in _walk_files(directory):
+        size += file_size
+        newest = max(newest, mtime)
+    return size, newest
+
+
+class StorageJanitor:
+    """
+    Periodic sweeper enforcing the storage quotas; see the module docstring for the rules.
+    """
+
+    def __init__(self, user_quota=500 * 1024 ** 2, max_bytes=20 * 1024 ** 3, orphan_ttl=86400,
+                 temp_ttl=3600, batch_size=200, interval=3600):
+        self.user_quota = user_quota
+        self.max_bytes = max_bytes
+        self.orphan_ttl = orphan_ttl
+        self.temp_ttl = temp_ttl
+        self.batch_size = batch_size
+        self.interval = interval
+        self._sweep_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._reclaimed_total = 0
+        self._last_report = None
+
+    def start(self, app):
+        """
+        Sweep every `interval` seconds on a daemon thread (no-op if the interval is 0).
+        """
+        with self._lock:
+            if self.interval <= 0 or self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, args=(app,), name="storage-janitor", daemon=True)
+            self._thread.start()
+
+    def _loop(self, app):
+        while True:
+            time.sleep(self.interval)
+            try:
+                with app.app_context():
+                    self.sweep()
+            except Exception as e:
+                print(f"[StorageJanitor] Sweep failed: {str(e)}")
+
+    def sweep(self):
+        """
+        Run one sweep over every area. Must run in the app context (reads Combination and User).
+
+        Returns:
+            dict: {"reclaimed_bytes", "deleted_files", "areas": {area: {"files", "bytes"}},
+                   "remaining_bytes", "duration", "finished_at"}
+        """
+        with self._sweep_lock:
+            started = time.monotonic()
+            now = time.time()
+            deleted = defaultdict(lambda: {"files": 0, "bytes": 0})
+
+            remaining = self._sweep_temporary(now, deleted)
+            remaining += self._sweep_person_artifacts(now, deleted)
+            remaining += self._sweep_combinations(now, remaining, deleted)
+
+            report = {
+                "reclaimed_bytes": sum(area["bytes"] for area in deleted.values()),
+                "deleted_files": sum(area["files"] for area in deleted.values()),
+                "areas": dict(deleted),
+                "remaining_bytes": remaining,
+                "duration": round(time.monotonic() - started, 3),
+                "finished_at": now,
+            }
+            with self._lock:
+                self._reclaimed_total += report["reclaimed_bytes"]
+                self._last_report = report
+            print(f"[StorageJanitor] Reclaimed {report['reclaimed_bytes']} bytes "
+                  f"({report['deleted_files']} files), {remaining} bytes in use")
+            return report
+
+    def stats(self):
+        with self._lock:
+            return {
+                "reclaimed_total": self._reclaimed_total,
+                "last_sweep": self._last_report,
+                "user_quota": self.user_quota,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _delete(self, items, area, deleted, remove=os.remove):
+        """
+        Delete (path, size) items in batches, recording what was reclaimed under `area`.
+        """
+        for start in range(0, len(items), self.batch_size):
+            if start:
+                time.sleep(BATCH_PAUSE)
+            for path, size in items[start:start + self.batch_size]:
+                try:
+                    remove(path)
+                except FileNotFoundError:
+                    continue  # Already gone (e.g. a job cleaned up its scratch directory)
+                except OSError as e:
+                    print(f"[StorageJanitor] Could not delete {path}: {str(e)}")
+                    continue
+                deleted[area]["files"] += 1
+                deleted[area]["bytes"] += size
+
+    def _sweep_temporary(self, now, deleted):
+        """
+        Expire leftover scratch directories and legacy output files. Returns the bytes kept.
+        """
+        kept = 0
+        scratch = []
+        if os.path.isdir(SCRATCH_DIR):
+            for entry in os.scandir(SCRATCH_DIR):
+                size, newest = _tree_size(entry.path)
+                try:
+                    newest = max(newest, entry.stat(follow_symlinks=False).st_mtime)
+                except OSError:
+                    continue  # Removed by its job meanwhile
+                if now - newest > self.temp_ttl:
+                    scratch.append((entry.path, size))
+                else:
+                    kept += size
+        self._delete(scratch, "scratch", deleted,
+                     remove=lambda path: shutil.rmtree(path) if os.path.isdir(path) else os.remove(path))
+
+        legacy = []
+        for directory in LEGACY_DIRS:
+            for path, size, mtime in _walk_files(directory):
+                if now - mtime > self.temp_ttl:
+                    legacy.append((path, size))
+                else:
+                    kept += size
+        self._delete(legacy, "legacy", deleted)
+        return kept
+
+    def _sweep_person_artifacts(self, now, deleted):
+        """
+        Drop artifact sets that are stale and not for a current user photo. Returns the bytes kept.
+        """
+        if not os.path.isdir(ARTIFACT_DIR):
+            return 0
+        current = set()
+        for user in User.query.filter(User.image_path.isnot(None)).all():
+            image_path = get_user_image_path(user)
+            if image_path and os.path.exists(image_path):
+                current.add(file_digest(image_path))
+
+        kept, stale = 0, []
+        for entry in os.scandir(ARTIFACT_DIR):
+            size, newest = _tree_size(entry.path)
+            if entry.name not in current and now - newest > self.orphan_ttl:
+                stale.append((entry.path, size))
+            else:
+                kept += size
+        self._delete(stale, "person_artifacts", deleted, remove=shutil.rmtree)
+        return kept
+
+    def _sweep_combinations(self, now, other_bytes, deleted):
+        """
+        Delete orphaned results, then enforce the per-user and global quotas. Returns the bytes kept.
+        """
+        root = _combinations_root()
+        if not os.path.isdir(root):
+            return 0
+        saved, unresolved_users = set(), set()
+        for user_id, outfit_path in Combination.query.with_entities(Combination.user_id, Combination.outfit_path):
+            path = outfit_file(outfit_path)
+            if path is None:
+                unresolved_users.add(f"user_{user_id}")
+            else:
+                saved.add(path)
+
+        orphans, candidates, kept_by_user = [], [], defaultdict(int)
+        for user_entry in os.scandir(root):
+            if not user_entry.is_dir(follow_symlinks=False):
+                continue
+            if user_entry.name in unresolved_users:
+                # Some saved outfit of this user could be anywhere: leave the whole folder alone
+                print(f"[StorageJanitor] Skipping {user_entry.name}: unrecognised outfit_path")
+                kept_by_user[user_entry.name] += _tree_size(user_entry.path)[0]
+                continue
+            user_candidates = []
+            for path, size, mtime in _walk_files(user_entry.path):
+                age = now - mtime
+                if os.path.basename(path).startswith("."):
+                    # Publish temp file: only stale ones, left by a crash
+                    if age > self.temp_ttl:
+                        orphans.append((path, size))
+                    else:
+                        kept_by_user[user_entry.name] += size
+                elif not is_published_result(os.path.relpath(path, user_entry.path)):
+                    kept_by_user[user_entry.name] += size
+                elif path not in saved and age > self.orphan_ttl:
+                    orphans.append((path, size))
+                else:
+                    kept_by_user[user_entry.name] += size
+                    if path not in saved and age > RECENT_SECONDS:
+                        user_candidates.append((mtime, path, size))
+            user_candidates.sort()  # oldest first
+
+            # Per-user quota: drop the user's oldest unsaved results until under it
+            over = kept_by_user[user_entry.name] - self.user_quota
+            while over > 0 and user_candidates:
+                _, path, size = user_candidates.pop(0)
+                orphans.append((path, size))
+                kept_by_user[user_entry.name] -= size
+                over -= size
+            candidates.extend(user_candidates)
+        self._delete(orphans, "combinations", deleted)
+
+        # Global quota: oldest unsaved results of any user
+        kept = sum(kept_by_user.values())
+        over = other_bytes + kept - self.max_bytes
+        if over > 0:
+            evict = []
+            for _, path, size in sorted(candidates):
+                if over <= 0:
+                    break
+                evict.append((path, size))
+                over -= size
+                kept -= size
+            self._delete(evict, "combinations", deleted)
+        return kept
+
+    def remove_outfit(self, combination):
+        """
+        Delete the image of a Combination being deleted, unless another saved combination
+        still uses it (results are named by content, so two outfits can share one file) or
+        it is not a published result.
+        Call before the row is deleted. Returns the bytes reclaimed.
+        """
+        path = outfit_file(combination.outfit_path)
+        if path is None or not os.path.isfile(path):
+            return 0
+        _, _, relative = os.path.relpath(path, _combinations_root()).partition(os.sep)
+        if not is_published_result(relative):
+            return 0  # Legacy or demo image: kept, like in the sweep
+        others = Combination.query.filter(Combination.user_id == combination.user_id,
+                                          Combination.id != combination.id)
+        if any(outfit_file(other.outfit_path) == path for other in others):
+            return 0
+        size = os.path.getsize(path)
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"[StorageJanitor] Could not delete {path}: {str(e)}")
+            return 0
+        with self._lock:
+            self._reclaimed_total += size
+        return size
+
+
+# Shared per-process janitor
+storage_janitor = StorageJanitor(
+    user_quota=Config.STORAGE_USER_QUOTA_BYTES,
+    max_bytes=Config.STORAGE_MAX_BYTES,
+    orphan_ttl=Config.STORAGE_ORPHAN_TTL,
+    temp_ttl=Config.STORAGE_TEMP_TTL,
+    batch_size=Config.STORAGE_DELETE_BATCH,
+    interval=Config.STORAGE_SWEEP_INTERVAL,
+)
@@ -0,0 +1,50 @@
+"""
+Per-User Taste Vectors
+Author: OVDR Team
+
+A user's taste vector is a decayed running mean of the normalized CLIP embeddings of the
+items they viewed. Every `/add-history` event moves it towards the viewed item in O(d),
+so content-based personalization never has to scan history at request time.
+
+Vectors are persisted as float16 bytes (1.5 KB for 768 dimensions) in the `user_taste` table.
+
+Update rule:
+    alpha = max(1 - TASTE_DECAY, 1 / (event_count + 1))
+    taste = taste + alpha * (embedding - taste)
+
+The 1 / (n + 1) term makes the first few events a plain mean, so a new profile is not
+dominated by its zero initialisation; afterwards older views fade by TASTE_DECAY per event.
+"""
+
+import numpy as np
+
+TASTE_DECAY = 0.9
+TASTE_DTYPE = np.float16
+
+
+def pack_vector(vector):
+    return np.asarray(vector, dtype=TASTE_DTYPE).tobytes()
+
+
+def unpack_vector(blob):
+    return np.frombuffer(blob, dtype=TASTE_DTYPE).astype(np.float32)
+
+
+def update_taste(vector, event_count, embedding, decay=TASTE_DECAY):
+    """
+    Fold one viewed-item embedding into a taste vector.
+
+    Args:
+        vector (np.ndarray or None): Current taste vector (None for a new profile).
+        event_count (int): Number of events already folded into `vector`.
+        embedding (np.ndarray): Normalized embedding of the viewed item.
+        decay (float): Weight kept by the old vector once the profile is warm.
+
+    Returns:
+        np.ndarray: The updated float32 taste vector.
+    """
+    embedding = np.asarray(embedding, dtype=np.float32)
+    if vector is None or vector.shape != embedding.shape:
+        return embedding.copy()
+    alpha = max(1.0 - decay, 1.0 / (event_count + 1))
+    return vector + alpha * (embedding - vector)
@@ -0,0 +1,403 @@
+"""
+Try-On Model Backends
+Author: OVDR Team
+
+Model backends served by the persistent try-on worker (`utils/tryon_worker.py`).
+A backend loads its weights once in `load()` and then renders any number of try-ons
+through `generate()`, so the per-request cost is inference only.
+
+Person preprocessing is kept in the artifact store (`utils/person_artifacts.py`), keyed by the
+photo's hash. `prepare()` fills it ahead of time (right after an upload), so a try-on of an
+already prepared photo only does the garment-dependent work.
+
+Backends:
+    - StableVitonBackend: StableVITON with OpenPose / human parsing / DensePose preprocessing,
+      following `process_hd` in the StableVITON `app.py` (see README, setup step 6).
+      Must run inside the StableViton conda environment with a CUDA device.
+    - StubTryOnBackend: Pastes the garment over the matching body region with PIL.
+      Needs no GPU or model weights, so the worker, the job API and the scheduling logic
+      can be exercised on any Linux box.
+
+Usage:
+    from utils.tryon_backends import create_backend
+    backend = create_backend("stub")
+    backend.load()
+    backend.generate(person_path, cloth_path, "tops", output_path)
+    backend.generate(person_path, cloth_path, "tops", output_path, quality=QUALITY_TIERS["preview"])
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from utils.person_artifacts import file_digest, person_artifacts
+
+STABLEVITON_PATH = Path(__file__).resolve().parent.parent / "models" / "StableVITON"
+
+IMG_H = 1024
+IMG_W = 768
+DEFAULT_STEPS = 20
+
+# Quality tiers: output size and sampling steps. "preview" is a quick draft of the same try-on;
+# a "full" render can follow on request.
+QUALITY_TIERS = {
+    "full": {"height": IMG_H, "width": IMG_W, "n_steps": DEFAULT_STEPS},
+    "preview": {"height": 512, "width": 384, "n_steps": 8},
+}
+FULL_QUALITY = QUALITY_TIERS["full"]
+
+# 0: upperbody; 1: lowerbody; 2: dress (as in app.py)
+CATEGORY_INDEX = {"tops": 0, "bottoms": 1, "dresses": 2}
+CATEGORY_UTILS = ['upper_body', 'lower_body', 'dresses']
+
+# Garment-independent artifacts of a photo; the agnostic map and mask are stored per category
+PERSON_ARTIFACTS = ("person", "keypoints", "parse", "densepose")
+
+
+class RenderPreempted(Exception):
+    """
+    Raised from a progress callback to abort a speculative render in favour of a user's request.
+    """
+
+
+def _no_progress(stage, step=None, total=None):
+    pass
+
+
+class TryOnBackend:
+    """
+    Base class for try-on model backends.
+
+    Subclasses load their models in `load()` and implement `generate()`.
+    """
+
+    name = "base"
+    artifacts = person_artifacts
+
+    def load(self):
+        """
+        Load model weights. Called once when the worker starts.
+        """
+
+    def prepare(self, person_path):
+        """
+        Precompute and store the person preprocessing of a photo.
+
+        Returns:
+            bool: True if anything was computed, False if the photo was already prepared.
+        """
+        return False
+
+    def generate(self, person_path, cloth_path, category, output_path,
+                 quality=FULL_QUALITY, progress=_no_progress):
+        """
+        Render one try-on image and save it to `output_path`.
+
+        Args:
+            person_path (str): Absolute path to the user's full-body image.
+            cloth_path (str): Absolute path to the garment image.
+            category (str): "tops", "bottoms" or "dresses".
+            output_path (str): Where to write the JPEG result.
+            quality (dict): {"height", "width", "n_steps"}, usually one of QUALITY_TIERS.
+            progress (callable): Called as progress(stage, step, total) while rendering.
+
+        Returns:
+            str: `output_path`.
+        """
+        raise NotImplementedError
+
+    def generate_batch(self, person_path, items, quality=FULL_QUALITY, progress=_no_progress):
+        """
+        Render several garments on the same person, in order.
+
+        Backends that can share person preprocessing between garments override this;
+        the default simply calls `generate()` for each item.
+
+        Args:
+            items (list[dict]): One {"cloth_path", "category", "output_path"} per garment.
+            progress (callable): Also called as progress("item", index, count) before each garment.
+
+        Returns:
+            list[dict]: {"ok": True, "output_path": ...} or {"ok": False, "error": ...} per item.
+        """
+        results = []
+        for index, item in enumerate(items):
+            progress("item", index + 1, len(items))
+            try:
+                self.generate(person_path, item["cloth_path"], item["category"], item["output_path"],
+                              quality=quality, progress=progress)
+                results.append({"ok": True, "output_path": item["output_path"]})
+            except RenderPreempted:
+                raise
+            except Exception as e:
+                results.append({"ok": False, "error": str(e)})
+        return results
+
+
+class StubTryOnBackend(TryOnBackend):
+    """
+    GPU-free stand-in: composites the garment onto the body region of its category.
+
+    `step_delay` seconds are spent per sampling step so the worker behaves like a slow model.
+    """
+
+    name = "stub"
+
+    # (top, bottom) of the garment region as a fraction of the image height
+    REGIONS = {"tops": (0.18, 0.55), "bottoms": (0.48, 0.92), "dresses": (0.18, 0.88)}
+
+    def __init__(self, step_delay=0.0):
+        self.step_delay = step_delay
+
+    def _person_image(self, person_path, progress=_no_progress):
+        # The resized photo stands in for the real model's preprocessing artifacts
+        digest = file_digest(person_path)
+        person = self.artifacts.load_image(digest, "person")
+        if person is None:
+            progress("preprocess")
+            person = Image.open(person_path).convert("RGB").resize((IMG_W, IMG_H))
+            self.artifacts.save_image(digest, "person", person)
+        return person
+
+    def prepare(self, person_path):
+        if self.artifacts.has(file_digest(person_path), ("person",)):
+            return False
+        self._person_image(person_path)
+        return True
+
+    def generate(self, person_path, cloth_path, category, output_path,
+                 quality=FULL_QUALITY, progress=_no_progress):
+        height, width, n_steps = quality["height"], quality["width"], quality["n_steps"]
+        person = self._person_image(person_path, progress).resize((width, height))
+        garment = Image.open(cloth_path).convert("RGB")
+
+        top, bottom = self.REGIONS.get(category, self.REGIONS["tops"])
+        box_h = int(height * (bottom - top))
+        box_w = int(width * 0.5)
+        garment = garment.resize((box_w, box_h))
+        person.paste(garment, ((width - box_w) // 2, int(height * top)))
+
+        for step in range(n_steps):
+            if self.step_delay:
+                time.sleep(self.step_delay)
+            progress("diffusion", step + 1, n_steps)
+
+        person.save(output_path)
+        return output_path
+
+
+class StableVitonBackend(TryOnBackend):
+    """
+    StableVITON HD try-on, with every model loaded once and kept on the GPU.
+
+    The StableVITON modules are imported in `load()`, so this file can be imported
+    from the Flask environment, which does not have them installed.
+    """
+
+    name = "stableviton"
+
+    def __init__(self, checkpoint="eternal_1024.ckpt", model_dir=STABLEVITON_PATH):
+        # app.py builds a second model from VITONHD_1024.ckpt but then aliases it to the first
+        # (`model2 = model.cuda()`), so its output comes from this checkpoint alone.
+        self.checkpoint = checkpoint
+        self.model_dir = Path(model_dir)
+
+    def load(self):
+        # StableVITON resolves its configs and preprocessors relative to its own folder
+        os.chdir(self.model_dir)
+        sys.path.insert(0, str(self.model_dir))
+
+        import torch
+        from omegaconf import OmegaConf
+        from cldm.model import create_model
+        from cldm.plms_hacked import PLMSSampler
+        from preprocess.detectron2.projects.DensePose.apply_net_gradio import DensePose4Gradio
+        from preprocess.humanparsing.run_parsing import Parsing
+        from preprocess.openpose.run_openpose import OpenPose
+        import utils_stableviton
+
+        self.torch = torch
+        self.utils = utils_stableviton
+
+        self.openpose = OpenPose(0)
+        self.openpose.preprocessor.body_estimation.model.to('cuda')
+        self.parsing = Parsing(0)
+        self.densepose = DensePose4Gradio(
+            cfg='preprocess/detectron2/projects/DensePose/configs/densepose_rcnn_R_50_FPN_s1x.yaml',
+            model='https://dl.fbaipublicfiles.com/densepose/densepose_rcnn_R_50_FPN_s1x/165712039/model_final_162be9.pkl',
+        )
+
+        config = OmegaConf.load("./configs/VITON.yaml")
+        config.model.params.img_H = IMG_H
+        config.model.params.img_W = IMG_W
+        self.params = config.model.params
+
+        model = create_model(config_path=None, config=config)
+        model.load_state_dict(torch.load(f"./checkpoints/{self.checkpoint}", map_location="cpu")["state_dict"])
+        self.model = model.cuda()
+        self.model.eval()
+        self.sampler = PLMSSampler(self.model)
+
+    def _load_person(self, digest):
+        if not self.artifacts.has(digest, PERSON_ARTIFACTS):
+            return None
+        person = {
+            "digest": digest,
+            "vton_img": self.artifacts.load_image(digest, "person"),
+            "keypoints": self.artifacts.load_json(digest, "keypoints"),
+            "model_parse": self.artifacts.load_image(digest, "parse"),
+            "densepose": self.artifacts.load_image(digest, "densepose"),
+        }
+        if any(value is None for value in person.values()):
+            return None  # Partly written or damaged set: recompute it
+        person["agnostic"] = {}
+        return person
+
+    def _analyse_person(self, person_path, progress=_no_progress):
+        """
+        Garment-independent person preprocessing: pose keypoints, human parsing and DensePose.
+        Loaded from the artifact store when the photo was prepared before.
+        The agnostic map and mask depend on the category and are added per category on demand.
+        """
+        digest = file_digest(person_path)
+        person = self._load_person(digest)
+        if person is not None:
+            return person
+
+        progress("preprocess")
+        vton_img = Image.open(person_path).convert('RGB')
+        vton_img = self.utils.center_crop(vton_img).resize((IMG_W, IMG_H))
+        keypoints = self.openpose(vton_img)
+        model_parse, _ = self.parsing(vton_img)
+        densepose = self.densepose.execute(vton_img)
+
+        self.artifacts.save_image(digest, "person", vton_img)
+        self.artifacts.save_json(digest, "keypoints", keypoints)
+        self.artifacts.save_image(digest, "parse", model_parse)
+        self.artifacts.save_image(digest, "densepose", densepose)
+        return {"digest": digest, "vton_img": vton_img, "keypoints": keypoints, "model_parse": model_parse,
+                "densepose": densepose, "agnostic": {}}
+
+    def _agnostic(self, person, category):
+        """
+        Agnostic map and mask of `person` for a category index, computed once per photo and category.
+        """
+        if category not in person["agnostic"]:
+            digest, name = person["digest"], CATEGORY_UTILS[category]
+            masked_vton_img = self.artifacts.load_image(digest, f"agnostic_{name}")
+            mask = self.artifacts.load_image(digest, f"mask_{name}")
+            if masked_vton_img is None or mask is None:
+                mask, mask_gray = self.utils.get_mask_location(
+                    'hd', name, person["model_parse"], person["keypoints"], radius=5)
+                mask = mask.resize((IMG_W, IMG_H), Image.NEAREST)
+                mask_gray = mask_gray.resize((IMG_W, IMG_H), Image.NEAREST)
+                masked_vton_img = Image.composite(mask_gray, person["vton_img"], mask)  # agnostic map
+                self.artifacts.save_image(digest, f"agnostic_{name}", masked_vton_img)
+                self.artifacts.save_image(digest, f"mask_{name}", mask)
+            person["agnostic"][category] = (masked_vton_img, mask)
+        return person["agnostic"][category]
+
+    def prepare(self, person_path):
+        # Everything but the garment: person analysis plus the agnostic map of every category
+        names = PERSON_ARTIFACTS + tuple(
+            f"{kind}_{name}" for name in CATEGORY_UTILS for kind in ("agnostic", "mask"))
+        if self.artifacts.has(file_digest(person_path), names):
+            return False
+        person = self._analyse_person(person_path)
+        for category in range(len(CATEGORY_UTILS)):
+            self._agnostic(person, category)
+        return True
+
+    def _sample(self, batch, quality, progress=_no_progress):
+        n_steps = quality["n_steps"]
+        torch, model = self.torch, self.model
+        with torch.no_grad(), torch.autocast("cuda"):
+            z, cond = model.get_input(batch, self.params.first_stage_key)
+            bs = z.shape[0]
+            c_crossattn = cond["c_crossattn"][0][:bs]
+            if c_crossattn.ndim == 4:
+                c_crossattn = model.get_learned_conditioning(c_crossattn)
+                cond["c_crossattn"] = [c_crossattn]
+            uc_cross = model.get_unconditional_conditioning(bs)
+            uc_full = {"c_concat": cond["c_concat"], "c_crossattn": [uc_cross]}
+            uc_full["first_stage_cond"] = cond["first_stage_cond"]
+            for k, v in batch.items():
+                if isinstance(v, torch.Tensor):
+                    batch[k] = v.cuda()
+            self.sampler.model.batch = batch
+
+            ts = torch.full((1,), 999, device=z.device, dtype=torch.long)
+            start_code = model.q_sample(z, ts)
+            torch.cuda.empty_cache()
+            output, _, _ = self.sampler.sample(
+                n_steps,
+                bs,
+                (4, quality["height"] // 8, quality["width"] // 8),
+                cond,
+                x_T=start_code,
+                verbose=False,
+                eta=0.0,
+                unconditional_conditioning=uc_full,
+                callback=lambda i: progress("diffusion", i + 1, n_steps),
+            )
+            output = model.decode_first_stage(output)
+        return Image.fromarray(self.utils.tensor2img(output))
+
+    def _render(self, person, cloth_path, category, output_path, quality, progress):
+        category = CATEGORY_INDEX.get(category, 0)
+        masked_vton_img, mask = self._agnostic(person, category)
+        vton_img, densepose = person["vton_img"], person["densepose"]
+        height, width = quality["height"], quality["width"]
+        if (height, width) != (IMG_H, IMG_W):
+            # Reduced tiers run the same model on a smaller latent, from the full-size artifacts
+            vton_img = vton_img.resize((width, height), Image.BILINEAR)
+            masked_vton_img = masked_vton_img.resize((width, height), Image.BILINEAR)
+            densepose = densepose.resize((width, height), Image.NEAREST)
+            mask = mask.resize((width, height), Image.NEAREST)
+        garm_img = Image.open(cloth_path).convert('RGB').resize((width, height))
+        batch = self.utils.get_batch(vton_img, garm_img, densepose, masked_vton_img, mask, height, width)
+
+        progress("diffusion", 0, quality["n_steps"])
+        sample = self._sample(batch, quality, progress)
+        sample.save(output_path)
+        return output_path
+
+    def generate(self, person_path, cloth_path, category, output_path,
+                 quality=FULL_QUALITY, progress=_no_progress):
+        person = self._analyse_person(person_path, progress)
+        return self._render(person, cloth_path, category, output_path, quality, progress)
+
+    def generate_batch(self, person_path, items, quality=FULL_QUALITY, progress=_no_progress):
+        # Pose, parsing and DensePose run once for the whole batch; only the garment-dependent
+        # work (agnostic mask per category, diffusion) is repeated per item.
+        person = self._analyse_person(person_path, progress)
+        results = []
+        for index, item in enumerate(items):
+            progress("item", index + 1, len(items))
+            try:
+                self._render(person, item["cloth_path"], item["category"], item["output_path"],
+                             quality, progress)
+                results.append({"ok": True, "output_path": item["output_path"]})
+            except RenderPreempted:
+                raise
+            except Exception as e:
+                results.append({"ok": False, "error": str(e)})
+        return results
+
+
+BACKENDS = {
+    StableVitonBackend.name: StableVitonBackend,
+    StubTryOnBackend.name: StubTryOnBackend,
+}
+
+
+def create_backend(name, **kwargs):
+    """
+    Instantiate a backend by name ("stableviton" or "stub").
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown try-on backend: {name} (expected one of {sorted(BACKENDS)})")
+    return BACKENDS[name](**kwargs)
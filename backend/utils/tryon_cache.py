@@ -0,0 +1,141 @@
+"""
+Try-On Result Cache
+Author: OVDR Team
+
+Content-addressed cache of generated try-on images, so re-trying the same garment on the same
+photo is a file copy instead of a full diffusion run.
+
+A result is keyed by:
+    - the SHA-256 of the user's photo (a new upload changes the key),
+    - the garment: "cid:<clothing id>" for catalog items, or the SHA-256 of the image file,
+    - the clothing category,
+    - the model version (Config.TRYON_MODEL_VERSION), bumped when the model or its settings change,
+    - the quality tier ("full" or "preview", see QUALITY_TIERS in utils/tryon_backends.py).
+
+Files are stored as <cache dir>/<key[:2]>/<key>.jpg. Total size is bounded by least-recently-used
+eviction. Recency is kept in memory and mirrored to the file mtime, so it survives restarts.
+Each Flask process keeps its own index over the shared directory: files cached by another
+process are adopted on first hit, and files evicted by another process are treated as misses.
+
+Usage:
+    from utils.tryon_cache import tryon_result_cache, file_digest
+    key = tryon_result_cache.make_key(file_digest(photo), "cid:15", "tops")
+    path = tryon_result_cache.get(key)        # None on a miss
+    tryon_result_cache.put(key, generated_image_path)
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+from config import Config
+from utils.person_artifacts import file_digest  # shared with the try-on worker, re-exported here
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+CACHE_DIR = os.path.join(BASE_DIR, "store_data", "tryon_cache")
+
+
+class TryOnResultCache:
+    """
+    Size-bounded, LRU-evicted on-disk cache of try-on images.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=2 * 1024 ** 3, model_version="v1"):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.model_version = model_version
+        self._entries = None  # key -> size in bytes, least recently used first
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def make_key(self, user_image_digest, garment_key, category, quality="full"):
+        parts = [user_image_digest, str(garment_key), str(category), self.model_version]
+        if quality != "full":
+            parts.append(quality)  # Full-quality keys stay as they were before tiers existed
+        raw = "|".join(parts)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.jpg")
+
+    def _load_index(self):
+        # Called with the lock held: scan the directory once, oldest mtime first
+        files = []
+        if os.path.isdir(self.cache_dir):
+            for shard in os.scandir(self.cache_dir):
+                if shard.is_dir():
+                    for entry in os.scandir(shard.path):
+                        if entry.name.endswith(".jpg"):
+                            stat = entry.stat()
+                            files.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        files.sort()
+        self._entries = OrderedDict((key, size) for _, key, size in files)
+        self._total = sum(self._entries.values())
+
+    def get(self, key):
+        """
+        Return the cached image path for `key` and mark it recently used, or None.
+        """
+        path = self._path(key)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = None
+        with self._lock:
+            if self._entries is None:
+                self._load_index()
+            if size is None:
+                # Evicted by another process (or never cached)
+                self._total -= self._entries.pop(key, 0)
+                return None
+            # Results cached by another process are adopted into this index
+            self._total += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def put(self, key, source_path):
+        """
+        Copy a generated image into the cache and evict least recently used entries over budget.
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, path)  # readers never see a partial file
+        size = os.path.getsize(path)
+
+        with self._lock:
+            if self._entries is None:
+                self._load_index()
+            self._total += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            evicted = []
+            while self._total > self.max_bytes and len(self._entries) > 1:
+                old_key, old_size = self._entries.popitem(last=False)
+                self._total -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+        return path
+
+    def stats(self):
+        with self._lock:
+            if self._entries is None:
+                self._load_index()
+            return {"entries": len(self._entries), "bytes": self._total, "max_bytes": self.max_bytes}
+
+
+# Shared per-process cache used by the try-on pipeline
+tryon_result_cache = TryOnResultCache(
+    max_bytes=Config.TRYON_CACHE_MAX_BYTES,
+    model_version=Config.TRYON_MODEL_VERSION,
+)
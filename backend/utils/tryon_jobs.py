@@ -0,0 +1,354 @@
+"""
+Try-On Job Store and Scheduler
+Author: OVDR Team
+
+Background execution for the asynchronous try-on API (`routes/tryon.py`).
+
+    - TryOnJob:       One try-on request and its state (queued -> running -> done | failed).
+    - JobStore:       Thread-safe registry of jobs. Finished jobs expire after a TTL.
+                      Every update notifies a condition variable, so readers (the SSE stream)
+                      can block until one of their jobs changes instead of polling.
+    - TryOnScheduler: A fixed pool of threads running the model, in front of a bounded priority
+                      queue. Interactive jobs run ahead of speculative ones. Submissions beyond
+                      the queue or per-user limit are refused at once with `QueueFullError`
+                      (the routes answer 429 with a Retry-After estimate) instead of piling up
+                      behind the GPU. Each job records how long it spent in every pipeline
+                      stage (utils/tryon_metrics.py); interactive jobs slower than
+                      TRYON_SLOW_JOB_SECONDS are logged with that breakdown.
+
+The store and the scheduler live in the Flask process, so a job can only be polled on the
+worker that accepted it (the default single-process server, or sticky routing).
+
+Usage:
+    from utils.tryon_jobs import tryon_scheduler, job_store
+    job = tryon_scheduler.submit(user_id, run)   # run(job) -> job fields, e.g. {"image_path": ...}
+    job_store.get(job.job_id).to_dict()
+    job_store.wait_finished(job)                 # synchronous callers (/process_image)
+"""
+
+import heapq
+import itertools
+import math
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter
+
+from config import Config
+from utils.tryon_metrics import StageTimings, record, recording
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED_STATES = (DONE, FAILED)
+
+# Priority classes, lowest value first
+INTERACTIVE = 0   # a user is waiting for the result
+SPECULATIVE = 1   # background pre-generation (utils/tryon_speculation.py)
+
+INITIAL_JOB_ESTIMATE = 30.0   # seconds per job assumed until real durations are measured
+DURATION_SMOOTHING = 0.2      # weight of the latest job in the moving average duration
+
+
+class QueueFullError(Exception):
+    """
+    The scheduler refused a job (queue full or per-user limit); retry after `retry_after` seconds.
+    """
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TryOnJob:
+    """
+    State of one try-on job. Mutated only through `JobStore.update`.
+    """
+
+    def __init__(self, user_id):
+        self.job_id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.status = QUEUED
+        self.stage = None
+        self.step = None
+        self.total_steps = None
+        self.image_path = None
+        self.preview_url = None    # catalog model-tryon image shown until image_path is ready
+        self.quality = "full"      # quality tier: "full" or "preview"
+        self.cached = False
+        self.results = None        # per-garment results of a batch job, per-stage of an outfit
+        self.current_item = None   # batch progress: garment being rendered (1-based)
+        self.total_items = None
+        self.error = None
+        self.error_status = None   # HTTP status of the failure, for synchronous callers
+        self.timings = StageTimings()  # seconds per pipeline stage
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.version = 0  # bumped on every update
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "user_id": self.user_id,
+            "status": self.status,
+            "stage": self.stage,
+            "step": self.step,
+            "total_steps": self.total_steps,
+            "image_path": self.image_path,
+            "preview_url": self.preview_url,
+            "quality": self.quality,
+            "cached": self.cached,
+            "results": self.results,
+            "current_item": self.current_item,
+            "total_items": self.total_items,
+            "error": self.error,
+            "timings": self.timings.to_dict(),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobStore:
+    """
+    In-memory job registry with expiry of finished jobs.
+    """
+
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self._jobs = {}
+        self.changed = threading.Condition()
+
+    def add(self, job):
+        with self.changed:
+            self._expire()
+            self._jobs[job.job_id] = job
+
+    def add_done(self, user_id, **fields):
+        """
+        Register a job that finished without being queued (e.g. a result cache hit).
+        """
+        job = TryOnJob(user_id)
+        now = time.time()
+        job.status, job.started_at, job.finished_at = DONE, now, now
+        for name, value in fields.items():
+            setattr(job, name, value)
+        self.add(job)
+        return job
+
+    def get(self, job_id):
+        with self.changed:
+            return self._jobs.get(job_id)
+
+    def update(self, job, **fields):
+        """
+        Set job attributes and wake everyone waiting on `changed`.
+        """
+        with self.changed:
+            for name, value in fields.items():
+                setattr(job, name, value)
+            job.version += 1
+            self.changed.notify_all()
+
+    def wait_for_changes(self, job_ids, seen, timeout):
+        """
+        Block until any of `job_ids` changes, or `timeout` seconds pass.
+
+        Args:
+            job_ids (list[str]): Jobs to watch.
+            seen (dict): job_id -> last version already reported; updated in place.
+                         Unknown IDs are reported once with status "not_found".
+            timeout (float): Maximum seconds to wait.
+
+        Returns:
+            list[dict]: Snapshots of the jobs that changed (empty on timeout).
+        """
+        deadline = time.monotonic() + timeout
+        with self.changed:
+            changed = self._collect_changes(job_ids, seen)
+            # Updates to other jobs wake us too; keep waiting until one of ours changes
+            while not changed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.changed.wait(remaining)
+                changed = self._collect_changes(job_ids, seen)
+            return changed
+
+    def wait_finished(self, job, timeout=None):
+        """
+        Block until `job` is finished or `timeout` seconds pass. Returns True if it finished.
+        """
+        with self.changed:
+            return self.changed.wait_for(lambda: job.finished, timeout)
+
+    def all_finished(self, job_ids):
+        """
+        True if every job in `job_ids` is finished (or unknown).
+        """
+        with self.changed:
+            return all(job_id not in self._jobs or self._jobs[job_id].finished for job_id in job_ids)
+
+    def _collect_changes(self, job_ids, seen):
+        changed = []
+        for job_id in job_ids:
+            job = self._jobs.get(job_id)
+            version = job.version if job else -1
+            if seen.get(job_id) != version:
+                seen[job_id] = version
+                changed.append(job.to_dict() if job else {"job_id": job_id, "status": "not_found"})
+        return changed
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+class TryOnScheduler:
+    """
+    Runs try-on jobs on `max_workers` threads, highest priority class first (FIFO within a class).
+
+    Admission control applies to interactive jobs only (speculative work is paced by its
+    producer): at most `max_workers + max_queue` queued or running, and at most
+    `max_per_user` per user.
+    """
+
+    def __init__(self, store, max_workers=1, max_queue=16, max_per_user=2, slow_job_seconds=60):
+        self.store = store
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        self.slow_job_seconds = slow_job_seconds
+        self._queue = []               # heap of (priority, sequence, job, run)
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._interactive = 0          # interactive jobs queued or running
+        self._per_user = Counter()     # user_id -> interactive jobs queued or running
+        self._avg_duration = INITIAL_JOB_ESTIMATE
+        self._last_active = time.monotonic()
+
+    def _retry_after(self, jobs_ahead):
+        # Called with the lock held: time until `jobs_ahead` jobs have drained
+        return max(1, math.ceil(self._avg_duration * jobs_ahead / self.max_workers))
+
+    def submit(self, user_id, run, priority=INTERACTIVE, **fields):
+        """
+        Queue `run(job)` for a new job and return the job immediately.
+        `run` returns the result fields to set on the job (e.g. image_path and cached).
+
+        Args:
+            priority (int): INTERACTIVE (a user is waiting) or SPECULATIVE (background work,
+                            only started when no interactive job is queued).
+            fields: Initial job attributes (e.g. preview_url, or the timings of the
+                    stages the request already ran).
+
+        Raises:
+            QueueFullError: If the queue is full or the user already has `max_per_user`
+                            jobs in flight; `retry_after` estimates when to try again.
+        """
+        job = TryOnJob(user_id)
+        for name, value in fields.items():
+            setattr(job, name, value)
+        with self._cond:
+            if priority == INTERACTIVE:
+                if self._interactive >= self.max_workers + self.max_queue:
+                    raise QueueFullError("Try-on queue is full, please retry later",
+                                         self._retry_after(self._interactive - self.max_workers + 1))
+                if user_id is not None and self._per_user[user_id] >= self.max_per_user:
+                    raise QueueFullError("Too many try-ons in progress for this user, please wait",
+                                         self._retry_after(1))
+                self._interactive += 1
+                self._per_user[user_id] += 1
+                self._last_active = time.monotonic()
+            self.store.add(job)
+            heapq.heappush(self._queue, (priority, next(self._sequence), job, run))
+            self._start_threads()
+            self._cond.notify()
+        return job
+
+    def _start_threads(self):
+        # Called with the lock held; threads are started on first use, not at import
+        while len(self._threads) < self.max_workers:
+            thread = threading.Thread(target=self._work, name=f"tryon-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                priority, _, job, run = heapq.heappop(self._queue)
+            self._run(job, run, priority)
+
+    def _run(self, job, run, priority):
+        started = time.monotonic()
+        self.store.update(job, status=RUNNING, started_at=time.time())
+        try:
+            # Stages timed while the job runs are added to its timings
+            with recording(job.timings):
+                record("queue", job.started_at - job.created_at)
+                result = run(job)
+            self.store.update(job, status=DONE, stage=None, finished_at=time.time(), **result)
+        except Exception as e:
+            # Expected pipeline failures (TryOnError) carry a status; log anything else in full
+            if not hasattr(e, "status"):
+                traceback.print_exc()
+            self.store.update(job, status=FAILED, error=str(e), error_status=getattr(e, "status", 500),
+                              finished_at=time.time())
+        finally:
+            if priority == INTERACTIVE:
+                with self._cond:
+                    self._interactive -= 1
+                    self._per_user[job.user_id] -= 1
+                    if not self._per_user[job.user_id]:
+                        del self._per_user[job.user_id]
+                    self._avg_duration += DURATION_SMOOTHING * (time.monotonic() - started - self._avg_duration)
+                    self._last_active = time.monotonic()
+                self._log_if_slow(job)
+
+    def _log_if_slow(self, job):
+        elapsed = job.finished_at - job.created_at
+        if self.slow_job_seconds and elapsed >= self.slow_job_seconds:
+            print(f"[TryOn] Slow job {job.job_id} for user {job.user_id} ({job.status}): "
+                  f"{elapsed:.1f}s - {job.timings.summary()}")
+
+    def interactive_waiting(self):
+        """
+        True if an interactive job is queued behind the running ones.
+        """
+        with self._cond:
+            return any(priority == INTERACTIVE for priority, _, _, _ in self._queue)
+
+    def idle_seconds(self):
+        """
+        Seconds since the scheduler last had an interactive job queued or running (0 while busy).
+        """
+        with self._cond:
+            return 0 if self._interactive else time.monotonic() - self._last_active
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queued": len(self._queue),
+                "interactive": self._interactive,
+                "max_interactive": self.max_workers + self.max_queue,
+                "avg_duration": round(self._avg_duration, 1),
+            }
+
+
+# Shared per-process job store and scheduler
+job_store = JobStore(ttl=Config.TRYON_JOB_TTL)
+tryon_scheduler = TryOnScheduler(job_store, Config.TRYON_MAX_CONCURRENT, Config.TRYON_MAX_QUEUE,
+                                 Config.TRYON_MAX_PER_USER, Config.TRYON_SLOW_JOB_SECONDS)
@@ -0,0 +1,214 @@
+"""
+Try-On Stage Timings
+Author: OVDR Team
+
+Where the time of a try-on goes, stage by stage:
+
+    queue           waiting for a scheduler slot (utils/tryon_jobs.py)
+    user_lookup     finding the user's photo
+    garment_lookup  resolving the closet item / catalog garment
+    cache_lookup    hashing the photo and checking the try-on result cache
+    download        fetching an external garment image
+    worker_wait     waiting for the try-on worker to be free
+    preprocess      person and garment preprocessing on the worker
+    model           the diffusion sampling (the whole app.py run without a worker)
+    postprocess     decoding and writing the generated image on the worker
+    cache_store     copying a rendered result into the try-on result cache
+    output_copy     publishing the result into the user's folder (once per result)
+
+Every stage duration goes into a per-process histogram (`tryon_metrics`, served by
+GET /tryon/metrics) and into the `StageTimings` of the job being processed, if one is bound
+to the current thread with `recording()`. The scheduler binds each job's timings while the
+job runs, so pipeline code only wraps its work in `timed(stage)`.
+
+This module must not import the Flask config: the try-on worker uses `StageClock`.
+
+Usage:
+    from utils.tryon_metrics import StageTimings, recording, timed
+    timings = StageTimings()
+    with recording(timings):
+        with timed("download"):
+            ...
+    timings.to_dict()   # {"download": 0.412}
+"""
+
+import threading
+import time
+from contextlib import ContextDecorator, contextmanager
+
+# Upper bounds (seconds) of the histogram buckets, from cache lookups to full model runs
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+_local = threading.local()
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram of durations, in the Prometheus layout.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)  # observations <= bucket bound, not cumulated yet
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        for index, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[index] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+
+    def snapshot(self):
+        cumulative, total = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            cumulative.append([bound, total])
+        return {"count": self.count, "sum": round(self.sum, 3), "buckets": cumulative}
+
+
+class TryOnMetrics:
+    """
+    One duration histogram per pipeline stage.
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {stage: histogram.snapshot() for stage, histogram in sorted(self._histograms.items())}
+
+    def prometheus_text(self):
+        """
+        The histograms in the Prometheus text exposition format.
+        """
+        lines = [
+            "# HELP tryon_stage_seconds Duration of each try-on pipeline stage.",
+            "# TYPE tryon_stage_seconds histogram",
+        ]
+        for stage, histogram in self.snapshot().items():
+            for bound, count in histogram["buckets"]:
+                lines.append(f'tryon_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'tryon_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram["count"]}')
+            lines.append(f'tryon_stage_seconds_sum{{stage="{stage}"}} {histogram["sum"]}')
+            lines.append(f'tryon_stage_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+        return "\n".join(lines) + "\n"
+
+
+class StageTimings:
+    """
+    Seconds spent per stage by one job; a stage entered several times adds up.
+    """
+
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self._stages[stage] = self._stages.get(stage, 0.0) + seconds
+
+    def total(self):
+        with self._lock:
+            return sum(self._stages.values())
+
+    def to_dict(self):
+        with self._lock:
+            return {stage: round(seconds, 3) for stage, seconds in self._stages.items()}
+
+    def summary(self):
+        """
+        Stages sorted by time spent, for log lines: "model 41.20s, preprocess 6.05s".
+        """
+        with self._lock:
+            stages = sorted(self._stages.items(), key=lambda item: item[1], reverse=True)
+        return ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in stages)
+
+
+@contextmanager
+def recording(timings):
+    """
+    Bind `timings` to the current thread: stages timed inside the block are added to it.
+    """
+    previous = getattr(_local, "timings", None)
+    _local.timings = timings
+    try:
+        yield timings
+    finally:
+        _local.timings = previous
+
+
+def record(stage, seconds):
+    """
+    Add a measured stage duration to the histograms and to the bound job timings.
+    """
+    tryon_metrics.observe(stage, seconds)
+    timings = getattr(_local, "timings", None)
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+def record_all(stages):
+    """
+    Record durations measured elsewhere, e.g. the {stage: seconds} the try-on worker reports.
+    """
+    for stage, seconds in (stages or {}).items():
+        record(stage, seconds)
+
+
+class timed(ContextDecorator):
+    """
+    Time a block (or, as a decorator, a function call) as `stage`, also when it raises.
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        # Kept on the thread so the same decorator instance can run on several threads
+        stack = getattr(_local, "started", None)
+        if stack is None:
+            stack = _local.started = []
+        stack.append(time.perf_counter())
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.stage, time.perf_counter() - _local.started.pop())
+        return False
+
+
+class StageClock:
+    """
+    Splits the elapsed time of a worker request into stages: each `switch(stage)` closes the
+    current stage and starts the next one.
+    """
+
+    def __init__(self, stage=None):
+        self.timings = {}
+        self.stage = stage
+        self._since = time.perf_counter()
+
+    def switch(self, stage):
+        now = time.perf_counter()
+        if self.stage is not None:
+            self.timings[self.stage] = self.timings.get(self.stage, 0.0) + now - self._since
+        self.stage, self._since = stage, now
+
+    def stop(self):
+        self.switch(None)
+        return self.timings
+
+
+# Shared per-process stage histograms
+tryon_metrics = TryOnMetrics()
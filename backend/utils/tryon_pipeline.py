@@ -0,0 +1,482 @@
+"""
+Try-On Pipeline
+Author: OVDR Team
+
+The steps of a virtual try-on, shared by the synchronous `/process_image` endpoint and the
+asynchronous job API in `routes/tryon.py`:
+
+    1. resolve_user_image(user_id)          -> absolute path of the user's full-body photo
+    2. resolve_garment_url(item_id, url)    -> (garment URL, clothing ID or None)
+       catalog_preview_url(clothing_id)     -> the catalog's model-tryon image, shown while rendering
+    3. run_tryon(user_id, ...)              -> (path under data/combinations/user_<id>/, cached?)
+         - cached_tryon(): serve a previous result for the same photo + garment (utils/tryon_cache.py)
+           (find_cached_tryon() only looks it up, without publishing)
+         - fetch_garment(): local path of the garment image (catalog files are used in place)
+         - generate_tryon(): run StableVITON into a per-job scratch directory
+         - publish_result(): move the result into the user's sharded folder under a content-hash name
+    3b. run_tryon_batch(user_id, ...)       -> one result per garment, person preprocessed once
+    3c. run_outfit(user_id, ...)            -> several garments worn together (e.g. top, then bottom)
+
+refresh_person_artifacts() runs after a photo upload: it drops the old photo's preprocessing
+artifacts and precomputes the new photo's in the background, so try-ons skip that work.
+pregenerate_tryon() renders into the result cache only, for utils/tryon_speculation.py.
+
+Steps 1 and 2 query the database and must run inside the request (app context).
+Step 3 only touches files and the model, so it can run on a background thread.
+
+Failures are raised as `TryOnError` carrying the HTTP status the routes should return.
+Each step is timed as a pipeline stage (utils/tryon_metrics.py).
+"""
+
+import os
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from models import Clothing, Closet, User
+from utils.download_utils import catalog_relative_path, resolve_garment_path
+from utils.helpers import format_image_url
+from utils.image_utils import get_user_image_path, publish_tryon_image
+from utils.person_artifacts import person_artifacts
+from utils.stableviton_runner import prepare_person, run_stableviton, run_stableviton_batch
+from utils.tryon_backends import RenderPreempted
+from utils.tryon_cache import file_digest, tryon_result_cache
+from utils.tryon_metrics import timed
+
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+SCRATCH_DIR = os.path.join(BASE_DIR, "store_data", "tryon_scratch")
+
+# Background preprocessing of freshly uploaded photos, one at a time
+_prepare_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tryon-prepare")
+
+
+class TryOnError(Exception):
+    """
+    A try-on step failed; `status` is the HTTP status code to report.
+    """
+
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.status = status
+
+
+@timed("user_lookup")
+def resolve_user_image(user_id):
+    """
+    Return the absolute path of the user's uploaded full-body image.
+
+    Raises:
+        TryOnError: 404 if the user has no image or the file is missing on disk.
+    """
+    user = User.query.get(user_id)
+    if not user or not user.image_path:
+        raise TryOnError("User image not found", 404)
+
+    image_url = get_user_image_path(user)
+    if not os.path.exists(image_url):
+        raise TryOnError("Image file not found on disk", 404)
+
+    print(f"Using image for processing: {image_url}")
+    return image_url
+
+
+@timed("garment_lookup")
+def resolve_garment_url(item_id, cloth_url):
+    """
+    Use the clothing image of closet item `item_id` if it exists, otherwise `cloth_url`.
+
+    Returns:
+        tuple: (cloth_url, clothing_id), where clothing_id is None unless the garment
+               is a catalog item (a closet item, or a URL of a catalog image).
+    """
+    clothing_id = None
+    closet = Closet.query.get(item_id) if item_id is not None else None
+    if closet:
+        cloth = Clothing.query.get(closet.clothing_id)
+        if cloth:
+            cloth_url = cloth.cloth_path
+            clothing_id = cloth.cid
+            print(f"clothing from closet: {cloth_url}")
+    if not cloth_url:
+        raise TryOnError("No clothing image given", 400)
+
+    if clothing_id is None:
+        relative = catalog_relative_path(cloth_url)
+        if relative is not None:
+            cloth = Clothing.query.filter_by(cloth_path=relative).first()
+            clothing_id = cloth.cid if cloth else None
+    return cloth_url, clothing_id
+
+
+def catalog_preview_url(clothing_id):
+    """
+    URL of the catalog's precomputed model try-on image of a garment, or None if it has none.
+
+    It is returned with a queued try-on job so the page can show an image at once and swap in
+    the personalized result when the job is done.
+    """
+    cloth = Clothing.query.get(clothing_id) if clothing_id is not None else None
+    if not cloth or not cloth.model_tryon_path:
+        return None
+    if not os.path.isfile(os.path.join(BASE_DIR, cloth.model_tryon_path)):
+        return None
+    return format_image_url(cloth.model_tryon_path)
+
+
+@timed("download")
+def fetch_garment(cloth_url):
+    """
+    Return the local path of the garment image.
+
+    Catalog images are used where they are; only external URLs are downloaded
+    (into the shared garment download cache).
+    """
+    cloth_path = resolve_garment_path(cloth_url)
+    if cloth_path is None:
+        if catalog_relative_path(cloth_url) is not None:
+            raise TryOnError("Clothing image not found on disk", 404)
+        raise TryOnError("Failed to download the clothing image", 502)
+    print(f"Using cloth image: {cloth_path}")
+    return cloth_path
+
+
+def generate_tryon(image_path, cloth_path, category, output_dir, on_progress=None, quality="full"):
+    """
+    Run StableVITON into `output_dir` and return the path of the generated image.
+
+    Args:
+        output_dir (str): Scratch directory owned by this job.
+        on_progress (callable): Optional progress(stage, step, total) callback
+                                (only reported by the persistent worker).
+        quality (str): "full" or "preview" (a quick, smaller draft).
+    """
+    try:
+        return run_stableviton(image_path, cloth_path, category, output_dir, on_progress=on_progress,
+                               quality=quality)
+    except (RuntimeError, OSError, TimeoutError) as e:
+        raise TryOnError(str(e), 500)
+
+
+@timed("output_copy")
+def publish_result(user_id, source_path):
+    """
+    Publish an image into the user's combinations folder (see image_utils.publish_tryon_image).
+
+    Returns:
+        str: Path of the result, served by /show_image/<user_id>/<path>.
+    """
+    relative_path = publish_tryon_image(source_path, user_id)
+    print(f"Final output path: data/combinations/user_{user_id}/{relative_path}")
+    return relative_path
+
+
+def garment_cache_key(clothing_id, cloth_path=None):
+    """
+    Identify a garment for the result cache: its catalog ID, or the hash of its image file.
+    """
+    if clothing_id is not None:
+        return f"cid:{clothing_id}"
+    return f"sha256:{file_digest(cloth_path)}"
+
+
+@timed("cache_lookup")
+def find_cached_tryon(image_path, garment_key, category, quality="full"):
+    """
+    Path of the cached result for this photo + garment + category, without publishing it.
+    A preview request is also answered by a cached full-quality result.
+
+    Returns:
+        str or None: Path inside the try-on cache, or None on a cache miss.
+    """
+    photo_digest = file_digest(image_path)
+    for tier in dict.fromkeys(("full", quality)):
+        key = tryon_result_cache.make_key(photo_digest, garment_key, category, tier)
+        cached_path = tryon_result_cache.get(key)
+        if cached_path is not None:
+            return cached_path
+    return None
+
+
+def cached_tryon(user_id, image_path, garment_key, category, quality="full"):
+    """
+    Publish a cached result for this photo + garment + category, if there is one.
+
+    Returns:
+        str or None: Path of the published result, or None on a cache miss.
+    """
+    cached_path = find_cached_tryon(image_path, garment_key, category, quality)
+    if cached_path is None:
+        return None
+    print(f"Try-on cache hit: {cached_path}")
+    return publish_result(user_id, cached_path)
+
+
+def run_tryon(user_id, image_path, cloth_url, clothing_id, category, on_progress=None, quality="full"):
+    """
+    Produce a try-on result: from the result cache when possible, otherwise with StableVITON.
+
+    Catalog garments are looked up before downloading anything; other garments are
+    identified by the hash of the downloaded image. `quality` is "full" or "preview".
+
+    Returns:
+        tuple: (path of the result under the user's folder, True if it came from the cache)
+    """
+    if clothing_id is not None:
+        new_name = cached_tryon(user_id, image_path, garment_cache_key(clothing_id), category, quality)
+        if new_name:
+            return new_name, True
+
+    cloth_path = fetch_garment(cloth_url)
+    garment_key = garment_cache_key(clothing_id, cloth_path)
+    if clothing_id is None:
+        new_name = cached_tryon(user_id, image_path, garment_key, category, quality)
+        if new_name:
+            return new_name, True
+
+    # Each run writes into its own scratch directory, removed once the result is published
+    scratch_dir = os.path.join(SCRATCH_DIR, uuid.uuid4().hex)
+    try:
+        output_path = generate_tryon(image_path, cloth_path, category, scratch_dir, on_progress, quality)
+        with timed("cache_store"):
+            key = tryon_result_cache.make_key(file_digest(image_path), garment_key, category, quality)
+            tryon_result_cache.put(key, output_path)
+        return publish_result(user_id, output_path), False
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+def run_tryon_batch(user_id, image_path, garments, on_progress=None, quality="full"):
+    """
+    Try several garments on the same photo.
+
+    Cached results are served directly; the remaining garments are rendered in a single
+    model request, so the person preprocessing (pose, parsing, DensePose) runs only once.
+
+    Args:
+        garments (list[dict]): {"clothing_id", "cloth_url", "category"} per garment.
+
+    Returns:
+        list[dict]: {"clothing_id", "category", "image_path", "cached", "error"} per garment, in order.
+    """
+    results = [None] * len(garments)
+    to_render = []  # (index, cloth_path, category, garment_key)
+
+    def result(garment, image_path=None, cached=False, error=None):
+        return {"clothing_id": garment.get("clothing_id"), "category": garment["category"],
+                "image_path": image_path, "cached": cached, "error": error}
+
+    for index, garment in enumerate(garments):
+        clothing_id = garment.get("clothing_id")
+        if clothing_id is not None:
+            new_name = cached_tryon(user_id, image_path, garment_cache_key(clothing_id), garment["category"],
+                                    quality)
+            if new_name:
+                results[index] = result(garment, new_name, cached=True)
+                continue
+        try:
+            cloth_path = fetch_garment(garment["cloth_url"])
+        except TryOnError as e:
+            results[index] = result(garment, error=str(e))
+            continue
+        garment_key = garment_cache_key(clothing_id, cloth_path)
+        if clothing_id is None:
+            new_name = cached_tryon(user_id, image_path, garment_key, garment["category"], quality)
+            if new_name:
+                results[index] = result(garment, new_name, cached=True)
+                continue
+        to_render.append((index, cloth_path, garment["category"], garment_key))
+
+    if not to_render:
+        return results
+
+    scratch_dir = os.path.join(SCRATCH_DIR, uuid.uuid4().hex)
+    try:
+        try:
+            outputs = run_stableviton_batch(
+                image_path, [(cloth_path, category) for _, cloth_path, category, _ in to_render],
+                scratch_dir, on_progress=on_progress, quality=quality)
+        except (RuntimeError, OSError, TimeoutError) as e:
+            raise TryOnError(str(e), 500)
+
+        photo_digest = file_digest(image_path)
+        for (index, _, category, garment_key), output in zip(to_render, outputs):
+            if not output["ok"]:
+                results[index] = result(garments[index], error=output["error"])
+                continue
+            with timed("cache_store"):
+                key = tryon_result_cache.make_key(photo_digest, garment_key, category, quality)
+                tryon_result_cache.put(key, output["output_path"])
+            results[index] = result(garments[index], publish_result(user_id, output["output_path"]))
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    return results
+
+
+def user_image_digest(image_path):
+    """
+    Content hash of a user photo, or None if there is no photo on disk.
+    """
+    if not image_path or not os.path.exists(image_path):
+        return None
+    return file_digest(image_path)
+
+
+def _prepare(image_path):
+    try:
+        if prepare_person(image_path):
+            print(f"Preprocessed user image: {image_path}")
+    except (RuntimeError, OSError, TimeoutError, EOFError) as e:
+        # Not fatal: the first try-on preprocesses the photo itself
+        print(f"Preprocessing of {image_path} failed: {str(e)}")
+
+
+def photo_in_use(digest, except_user_id=None):
+    """
+    True if the current photo of any user other than `except_user_id` has this digest.
+    Must run in the app context.
+    """
+    users = User.query.filter(User.image_path.isnot(None), User.user_id != except_user_id)
+    return any(user_image_digest(get_user_image_path(user)) == digest for user in users)
+
+
+def refresh_person_artifacts(user_id, old_digest, image_path):
+    """
+    Called after a user replaces their photo. Must run in the app context.
+
+    Deletes the preprocessing artifacts of the previous photo, unless another user's current
+    photo has identical bytes (artifacts are shared by digest), and queues the preprocessing
+    of the new one, so it is ready before the user's first try-on.
+
+    Args:
+        user_id (int): The user who replaced their photo.
+        old_digest (str): user_image_digest() of the previous photo, or None.
+        image_path (str): Absolute path of the new photo.
+    """
+    if old_digest and old_digest != user_image_digest(image_path) and not photo_in_use(old_digest, user_id):
+        person_artifacts.invalidate(old_digest)
+    _prepare_executor.submit(_prepare, image_path)
+
+
+def pregenerate_tryon(image_path, cloth_url, clothing_id, category, on_progress=None):
+    """
+    Render a catalog garment on a photo into the result cache only, at speculative priority.
+    Nothing is published to the user's folder until they actually try the garment on.
+    `on_progress` may raise RenderPreempted to abort the render.
+
+    Returns:
+        bool: True if a result was rendered, False if it was already cached.
+
+    Raises:
+        RenderPreempted: If the worker aborted the render for an interactive request.
+        TryOnError: If the garment or the model run failed.
+    """
+    key = tryon_result_cache.make_key(file_digest(image_path), garment_cache_key(clothing_id), category)
+    if tryon_result_cache.get(key) is not None:
+        return False
+
+    cloth_path = fetch_garment(cloth_url)
+    scratch_dir = os.path.join(SCRATCH_DIR, uuid.uuid4().hex)
+    try:
+        try:
+            output_path = run_stableviton(image_path, cloth_path, category, scratch_dir,
+                                          on_progress=on_progress, priority="speculative")
+        except RenderPreempted:
+            raise
+        except (RuntimeError, OSError, TimeoutError) as e:
+            raise TryOnError(str(e), 500)
+        with timed("cache_store"):
+            tryon_result_cache.put(key, output_path)
+        return True
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+def _outfit_stage_key(person_path, garment, quality):
+    # The same key as a single try-on of the garment on `person_path`, so the first stage of
+    # an outfit and a plain try-on of its top share one cache entry
+    return tryon_result_cache.make_key(file_digest(person_path), garment_cache_key(garment["clothing_id"]),
+                                       garment["category"], quality)
+
+
+def _take_cached_stage(key, scratch_dir, index):
+    """
+    Copy a cached outfit stage into the job's scratch directory and return the copy, or None on
+    a miss. The chain reads the copy, so the cache may evict the entry before the next stage
+    or the publish without breaking the job.
+    """
+    cached_path = tryon_result_cache.get(key)
+    if cached_path is None:
+        return None
+    os.makedirs(scratch_dir, exist_ok=True)
+    stage_path = os.path.join(scratch_dir, f"stage_{index}.jpg")
+    try:
+        shutil.copyfile(cached_path, stage_path)
+    except FileNotFoundError:
+        return None  # Evicted between the lookup and the copy
+    return stage_path
+
+
+def cached_outfit(user_id, image_path, garments, quality="full"):
+    """
+    Publish the cached result of a whole outfit, if every stage of it is cached.
+
+    Returns:
+        str or None: Path of the published result, or None if any stage is missing.
+    """
+    current = image_path
+    scratch_dir = os.path.join(SCRATCH_DIR, uuid.uuid4().hex)
+    try:
+        for index, garment in enumerate(garments):
+            current = _take_cached_stage(_outfit_stage_key(current, garment, quality), scratch_dir, index)
+            if current is None:
+                return None
+        return publish_result(user_id, current)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+def run_outfit(user_id, image_path, garments, on_progress=None, quality="full"):
+    """
+    Dress the photo in several catalog garments by chaining try-ons: the first garment is
+    applied to the photo, the next one to that result, and so on (e.g. top, then bottom).
+
+    Every intermediate image goes into the result cache, keyed by the hash of the image it
+    was rendered from. Changing only the last garment (another bottom with the same top)
+    therefore reuses the earlier stages, and the person preprocessing of a cached
+    intermediate is reused too (utils/person_artifacts.py). The chain itself only reads
+    images in the job's scratch directory (cached stages are copied there), so LRU eviction
+    of a stage mid-chain cannot break it.
+
+    Args:
+        garments (list[dict]): {"clothing_id", "cloth_url", "category"} per garment, in the
+                               order they are put on.
+
+    Returns:
+        tuple: (path of the result under the user's folder,
+                [{"clothing_id", "category", "cached"} per stage])
+    """
+    stages = []
+    current = image_path
+    scratch_dir = os.path.join(SCRATCH_DIR, uuid.uuid4().hex)
+    try:
+        for index, garment in enumerate(garments):
+            if on_progress:
+                on_progress("item", index + 1, len(garments))
+            with timed("cache_lookup"):
+                key = _outfit_stage_key(current, garment, quality)
+                cached_path = _take_cached_stage(key, scratch_dir, index)
+            if cached_path is None:
+                cloth_path = fetch_garment(garment["cloth_url"])
+                output_path = generate_tryon(current, cloth_path, garment["category"],
+                                             os.path.join(scratch_dir, str(index)), on_progress, quality)
+                with timed("cache_store"):
+                    tryon_result_cache.put(key, output_path)
+                current = output_path
+            else:
+                current = cached_path
+            stages.append({"clothing_id": garment["clothing_id"], "category": garment["category"],
+                           "cached": cached_path is not None})
+        return publish_result(user_id, current), stages
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
@@ -0,0 +1,230 @@
+"""
+Speculative Try-On Pre-Generation
+Author: OVDR Team
+
+After a user uploads a photo, the garments they are most likely to try on next are rendered in
+the background into the try-on result cache (utils/tryon_cache.py), so their first try-ons of
+those garments are a cache read instead of a model run.
+
+Candidates (`likely_garments`), most likely first:
+    1. the user's closet, newest first,
+    2. catalog items closest to the user's taste vector,
+    3. trending items (most viewed overall).
+
+Budget and preemption rules:
+    - Only with the persistent try-on worker; spawning app.py per garment is far too expensive.
+    - At most TRYON_SPECULATIVE_ITEMS garments per upload, and TRYON_SPECULATIVE_PER_HOUR renders
+      per hour over all users (preempted renders count too).
+    - A garment is only started once the try-on scheduler has had no interactive job for
+      TRYON_SPECULATIVE_IDLE_SECONDS, and then runs as a SPECULATIVE scheduler job.
+    - Preemption: the render is aborted as soon as an interactive job is queued in the scheduler
+      (checked at every progress report) or is waiting at the worker (which aborts "speculative"
+      renders itself). A preempted garment is retried later, up to MAX_PREEMPTIONS times.
+    - A new upload replaces the user's pending plan; a plan whose photo has changed is dropped.
+    - Users' plans are served round-robin, one garment at a time.
+
+Usage:
+    from utils.tryon_speculation import likely_garments, speculative_tryons
+    speculative_tryons.plan(user_id, image_path, likely_garments(user_id, 6))
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+from sqlalchemy import func
+
+from config import Config
+from exts import db
+from models import Closet, Clothing, History, UserTaste
+from utils.catalog_index import get_catalog_index
+from utils.taste_vectors import unpack_vector
+from utils.stableviton_runner import worker_client
+from utils.tryon_backends import RenderPreempted
+from utils.tryon_jobs import SPECULATIVE, tryon_scheduler
+from utils.tryon_pipeline import TryOnError, pregenerate_tryon, user_image_digest
+
+IDLE_POLL_INTERVAL = 1.0   # seconds between checks while the scheduler is busy or the budget is spent
+MAX_PREEMPTIONS = 3        # times a garment may be preempted before it is dropped
+BUDGET_WINDOW = 3600       # seconds covered by TRYON_SPECULATIVE_PER_HOUR
+
+
+def likely_garments(user_id, limit):
+    """
+    Catalog garments the user is likely to try on next. Must run in the app context.
+
+    Returns:
+        list[dict]: Up to `limit` {"clothing_id", "cloth_url", "category"}, most likely first.
+    """
+    if limit <= 0:
+        return []
+    cids = [row.clothing_id for row in
+            Closet.query.filter_by(user_id=user_id).order_by(Closet.added_at.desc(), Closet.id.desc()).limit(limit)]
+
+    if len(cids) < limit:
+        taste = UserTaste.query.get(user_id)
+        index = get_catalog_index(db.session) if taste else None
+        if index is not None:
+            vector = unpack_vector(taste.vector)
+            if vector.shape[0] == index.dim:
+                scores = index.normalized @ vector
+                rows = index.top_rows(scores, limit, exclude_rows=index.rows_for_cids(cids))
+                cids += [int(index.cid_of_row[row]) for row in rows]
+
+    if len(cids) < limit:
+        trending = (
+            db.session.query(History.clothing_id)
+            .group_by(History.clothing_id)
+            .order_by(func.count(History.clothing_id).desc())
+            .limit(limit * 2)
+        )
+        cids += [row.clothing_id for row in trending]
+
+    cids = list(dict.fromkeys(cids))[:limit]
+    clothes = {c.cid: c for c in Clothing.query.filter(Clothing.cid.in_(cids)).all()}
+    return [{"clothing_id": cid, "cloth_url": clothes[cid].cloth_path, "category": clothes[cid].category}
+            for cid in cids if cid in clothes and clothes[cid].cloth_path]
+
+
+class SpeculativeTryOns:
+    """
+    Background thread feeding planned garments to the scheduler, one at a time, while it is idle.
+    """
+
+    def __init__(self, scheduler, max_items=6, per_hour=30, idle_seconds=5.0):
+        self.scheduler = scheduler
+        self.max_items = max_items
+        self.per_hour = per_hour
+        self.idle_seconds = idle_seconds
+        self._plans = OrderedDict()  # user_id -> {"image_path", "digest", "garments": deque}
+        self._started = deque()      # monotonic start times of renders inside BUDGET_WINDOW
+        self._cond = threading.Condition()
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return worker_client is not None and self.max_items > 0 and self.per_hour > 0
+
+    def plan(self, user_id, image_path, garments):
+        """
+        Replace the user's pending speculative try-ons with `garments` (at most `max_items`).
+        """
+        if not self.enabled:
+            return
+        digest = user_image_digest(image_path)
+        with self._cond:
+            self._plans.pop(user_id, None)
+            if digest and garments:
+                self._plans[user_id] = {
+                    "image_path": image_path,
+                    "digest": digest,
+                    "garments": deque(dict(garment, preempted=0) for garment in garments[:self.max_items]),
+                }
+                print(f"[Speculative] Planned {len(self._plans[user_id]['garments'])} try-ons for user {user_id}")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="tryon-speculative", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def cancel(self, user_id):
+        with self._cond:
+            self._plans.pop(user_id, None)
+
+    def pending(self):
+        with self._cond:
+            return sum(len(plan["garments"]) for plan in self._plans.values())
+
+    def _budget_left(self):
+        # Called with the lock held
+        cutoff = time.monotonic() - BUDGET_WINDOW
+        while self._started and self._started[0] < cutoff:
+            self._started.popleft()
+        return self.per_hour - len(self._started)
+
+    def _next(self):
+        """
+        Block until a garment may start, then take it: (user_id, plan, garment).
+        """
+        with self._cond:
+            while True:
+                while not self._plans:
+                    self._cond.wait()
+                if self.scheduler.idle_seconds() >= self.idle_seconds and self._budget_left() > 0:
+                    user_id, plan = next(iter(self._plans.items()))
+                    garment = plan["garments"].popleft()
+                    if plan["garments"]:
+                        self._plans.move_to_end(user_id)  # round-robin between users
+                    else:
+                        del self._plans[user_id]
+                    self._started.append(time.monotonic())
+                    return user_id, plan, garment
+                self._cond.wait(IDLE_POLL_INTERVAL)
+
+    def _loop(self):
+        while True:
+            try:
+                self._run_next()
+            except Exception as e:
+                # One failing garment (queue full, unreadable photo, ...) must not stop speculation
+                print(f"[Speculative] Pre-generation failed: {str(e)}")
+                time.sleep(IDLE_POLL_INTERVAL)
+
+    def _run_next(self):
+        user_id, plan, garment = self._next()
+        if user_image_digest(plan["image_path"]) != plan["digest"]:
+            self._drop(user_id, plan)  # The photo changed since the plan was made
+            return
+        def run(job):
+            self._render(user_id, plan, garment)
+            return {}
+
+        # Runs as a SPECULATIVE job, so queued interactive jobs always go first
+        job = self.scheduler.submit(user_id, run, priority=SPECULATIVE)
+        self.scheduler.store.wait_finished(job)
+
+    def _yield_to_users(self, stage, step=None, total=None):
+        # Progress callback: give the worker slot back as soon as a user's job is queued
+        if self.scheduler.interactive_waiting():
+            raise RenderPreempted("Preempted by a queued interactive try-on")
+
+    def _render(self, user_id, plan, garment):
+        try:
+            if pregenerate_tryon(plan["image_path"], garment["cloth_url"], garment["clothing_id"],
+                                 garment["category"], on_progress=self._yield_to_users):
+                print(f"[Speculative] Cached try-on of {garment['clothing_id']} for user {user_id}")
+            else:
+                self._refund()  # Already cached: nothing was rendered
+        except RenderPreempted:
+            garment["preempted"] += 1
+            if garment["preempted"] < MAX_PREEMPTIONS:
+                self._requeue(user_id, plan, garment)
+        except TryOnError as e:
+            print(f"[Speculative] Try-on of {garment['clothing_id']} for user {user_id} failed: {str(e)}")
+
+    def _drop(self, user_id, plan):
+        with self._cond:
+            if self._plans.get(user_id) is plan:
+                del self._plans[user_id]
+
+    def _refund(self):
+        with self._cond:
+            if self._started:
+                self._started.pop()
+
+    def _requeue(self, user_id, plan, garment):
+        with self._cond:
+            current = self._plans.get(user_id)
+            if current is None and not plan["garments"]:
+                # It was the plan's last garment, not a cancellation: put the plan back
+                self._plans[user_id] = current = plan
+            if current is plan:
+                plan["garments"].appendleft(garment)
+
+
+# Shared per-process speculative renderer
+speculative_tryons = SpeculativeTryOns(
+    tryon_scheduler,
+    max_items=Config.TRYON_SPECULATIVE_ITEMS,
+    per_hour=Config.TRYON_SPECULATIVE_PER_HOUR,
+    idle_seconds=Config.TRYON_SPECULATIVE_IDLE_SECONDS,
+)
@@ -0,0 +1,290 @@
+"""
+Persistent Try-On Worker
+Author: OVDR Team
+
+A long-lived process that loads a try-on backend (`utils/tryon_backends.py`) once and then
+serves try-on requests over a local authenticated socket (`multiprocessing.connection`).
+This replaces spawning `cmd.exe` -> `conda activate` -> `python app.py` per request, which
+reloaded the whole diffusion model every time.
+
+Protocol (one request per connection, pickled dicts):
+    client -> worker   {"op": "tryon", "person_path", "cloth_path", "category", "output_path", "quality",
+                        "priority": "interactive" | "speculative"}
+                       {"op": "tryon_batch", "person_path", "items": [{"cloth_path", "category", "output_path"}],
+                        "quality"}
+                       quality = {"height", "width", "n_steps"} (see QUALITY_TIERS in utils/tryon_backends.py)
+                       {"op": "prepare", "person_path"}
+                       {"op": "ping"}
+    worker -> client   {"type": "progress", "stage": "preprocess" | "item" | "diffusion", "step", "total"}  (0..n)
+                       {"type": "result", "ok": True, "output_path": ...}
+                       {"type": "result", "ok": True, "results": [{"ok", "output_path" | "error"}, ...]}
+                       {"type": "result", "ok": True, "computed": bool}   (prepare)
+                       {"type": "result", "ok": False, "error": "..."}
+                       {"type": "result", "ok": False, "preempted": True, "error": "..."}
+                       Every result also carries "timings": {stage: seconds} of the request
+                       (worker_wait, preprocess, model, postprocess; see utils/tryon_metrics.py).
+
+A batch preprocesses the person once and renders its garments back-to-back.
+"prepare" stores a photo's person preprocessing ahead of its first try-on (see utils/person_artifacts.py).
+
+Connections are accepted concurrently but renders run one at a time (the model owns the GPU);
+waiting clients block on the render lock until the GPU is free.
+
+Speculative renders (background pre-generation, see utils/tryon_speculation.py) never delay a
+user: one is refused while an interactive request is waiting, and one that is running is
+aborted at its next progress report (each diffusion step) when an interactive request arrives
+or when its client disconnects (the Flask scheduler does that to make room for a user's job).
+
+Usage:
+    # Worker (StableViton conda env, or any env for the stub backend):
+    python backend/scripts/run_tryon_worker.py --backend stableviton
+    # Flask side:
+    client = TryOnWorkerClient("127.0.0.1:6001", b"secret")
+    client.generate(person_path, cloth_path, "tops", output_path)
+"""
+
+import ipaddress
+import threading
+import traceback
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from utils.tryon_backends import FULL_QUALITY, RenderPreempted
+from utils.tryon_metrics import StageClock, record_all
+
+DEFAULT_ADDRESS = "127.0.0.1:6001"
+LISTEN_BACKLOG = 64
+
+
+def parse_address(address):
+    """
+    Turn "host:port" into the (host, port) tuple expected by multiprocessing.connection.
+    """
+    host, _, port = address.rpartition(":")
+    return (host or "127.0.0.1", int(port))
+
+
+def is_loopback(host):
+    """
+    True if `host` only accepts connections from this machine.
+    """
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host.strip("[]")).is_loopback
+    except ValueError:
+        return False
+
+
+class TryOnWorker:
+    """
+    Serves a loaded backend to any number of clients, rendering one job at a time.
+
+    Requests are unpickled, so anyone who can connect with the authkey can run code in the
+    worker: an authkey is mandatory, and a non-loopback address needs `allow_remote=True`.
+    """
+
+    def __init__(self, backend, address=DEFAULT_ADDRESS, authkey=None, allow_remote=False):
+        if not authkey:
+            raise ValueError("The try-on worker needs a secret authkey (TRYON_WORKER_AUTHKEY)")
+        self.backend = backend
+        self.address = parse_address(address)
+        if not allow_remote and not is_loopback(self.address[0]):
+            raise ValueError(f"Refusing to listen on non-loopback address {self.address[0]} "
+                             "without allow_remote")
+        self.authkey = authkey
+        self._render_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._interactive_waiting = 0  # interactive requests queued on the render lock
+
+    def serve_forever(self):
+        print(f"[TryOnWorker] Loading backend '{self.backend.name}'...")
+        self.backend.load()
+        with Listener(self.address, authkey=self.authkey, backlog=LISTEN_BACKLOG) as listener:
+            print(f"[TryOnWorker] Ready on {self.address[0]}:{self.address[1]}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    # Failed handshakes (wrong authkey, dropped client) must not stop the worker
+                    print(f"[TryOnWorker] Rejected connection: {str(e)}")
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        with conn:
+            try:
+                request = conn.recv()
+            except EOFError:
+                return
+            try:
+                if request.get("op") == "ping":
+                    conn.send({"type": "result", "ok": True, "backend": self.backend.name})
+                elif request.get("op") in ("tryon", "tryon_batch", "prepare"):
+                    conn.send(self._render(conn, request))
+                else:
+                    conn.send({"type": "result", "ok": False, "error": f"Unknown op: {request.get('op')}"})
+            except (BrokenPipeError, ConnectionResetError, EOFError):
+                print("[TryOnWorker] Client went away before the result was sent")
+
+    def _render(self, conn, request):
+        clock = StageClock("worker_wait")
+        reply = self._run_op(conn, request, clock)
+        reply["timings"] = clock.stop()
+        return reply
+
+    def _run_op(self, conn, request, clock):
+        speculative = request.get("priority") == "speculative"
+
+        def progress(stage, step=None, total=None):
+            # Split the request time into stages from the progress the backend reports
+            if stage == "item":
+                clock.switch("preprocess")
+            elif stage == "diffusion":
+                clock.switch("postprocess" if step == total else "model")
+            if speculative and self._interactive_waiting:
+                raise RenderPreempted("Preempted by an interactive try-on")
+            try:
+                conn.send({"type": "progress", "stage": stage, "step": step, "total": total})
+            except OSError:
+                if speculative:
+                    raise RenderPreempted("Speculative client went away")
+                # An interactive client that stops listening still gets its file written
+
+        if not speculative:
+            with self._state_lock:
+                self._interactive_waiting += 1
+        with self._render_lock:
+            clock.switch("preprocess")
+            if not speculative:
+                with self._state_lock:
+                    self._interactive_waiting -= 1
+            try:
+                if speculative and self._interactive_waiting:
+                    raise RenderPreempted("Preempted by an interactive try-on")
+                if request["op"] == "prepare":
+                    return {"type": "result", "ok": True, "computed": self.backend.prepare(request["person_path"])}
+                if request["op"] == "tryon_batch":
+                    results = self.backend.generate_batch(
+                        request["person_path"],
+                        request["items"],
+                        quality=request.get("quality") or FULL_QUALITY,
+                        progress=progress,
+                    )
+                    return {"type": "result", "ok": True, "results": results}
+                output_path = self.backend.generate(
+                    request["person_path"],
+                    request["cloth_path"],
+                    request["category"],
+                    request["output_path"],
+                    quality=request.get("quality") or FULL_QUALITY,
+                    progress=progress,
+                )
+                return {"type": "result", "ok": True, "output_path": output_path}
+            except RenderPreempted as e:
+                print("[TryOnWorker] Speculative render preempted")
+                return {"type": "result", "ok": False, "preempted": True, "error": str(e)}
+            except Exception as e:
+                traceback.print_exc()
+                return {"type": "result", "ok": False, "error": str(e)}
+
+
+class TryOnWorkerClient:
+    """
+    Client side of the worker protocol, used by `utils/stableviton_runner.py`.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=None, timeout=600):
+        self.address = parse_address(address)
+        self.authkey = authkey
+        self.timeout = timeout
+
+    def _request(self, message, on_progress=None):
+        with Client(self.address, authkey=self.authkey) as conn:
+            conn.send(message)
+            while True:
+                if not conn.poll(self.timeout):
+                    raise TimeoutError(f"Try-on worker did not answer within {self.timeout}s")
+                reply = conn.recv()
+                if reply.get("type") == "progress":
+                    if on_progress:
+                        on_progress(reply["stage"], reply.get("step"), reply.get("total"))
+                    continue
+                record_all(reply.get("timings"))
+                return reply
+
+    def ping(self):
+        """
+        Return the backend name if the worker is up, otherwise None.
+        """
+        try:
+            return self._request({"op": "ping"}).get("backend")
+        except (OSError, EOFError, TimeoutError, AuthenticationError):
+            return None
+
+    def prepare(self, person_path):
+        """
+        Have the worker precompute and store the person preprocessing of a photo.
+
+        Returns:
+            bool: True if the worker computed it, False if it was already stored.
+
+        Raises:
+            RuntimeError: If the worker reports a failure.
+        """
+        reply = self._request({"op": "prepare", "person_path": person_path})
+        if not reply.get("ok"):
+            raise RuntimeError(f"Person preprocessing failed: {reply.get('error')}")
+        return reply["computed"]
+
+    def generate(self, person_path, cloth_path, category, output_path, quality=FULL_QUALITY,
+                 on_progress=None, priority="interactive"):
+        """
+        Render a try-on on the worker and wait for the result.
+
+        Args:
+            quality (dict): {"height", "width", "n_steps"} of the render (see QUALITY_TIERS).
+            priority (str): "interactive", or "speculative" for background work that yields
+                            to interactive requests.
+
+        Raises:
+            RenderPreempted: If a speculative render gave way to an interactive one.
+            RuntimeError: If the worker reports a failure.
+        """
+        reply = self._request({
+            "op": "tryon",
+            "person_path": person_path,
+            "cloth_path": cloth_path,
+            "category": category,
+            "output_path": output_path,
+            "quality": quality,
+            "priority": priority,
+        }, on_progress)
+        if reply.get("preempted"):
+            raise RenderPreempted(reply["error"])
+        if not reply.get("ok"):
+            raise RuntimeError(f"StableVITON execution failed: {reply.get('error')}")
+        return reply["output_path"]
+
+    def generate_batch(self, person_path, items, quality=FULL_QUALITY, on_progress=None):
+        """
+        Render several garments on one person in a single worker request.
+
+        Args:
+            items (list[dict]): {"cloth_path", "category", "output_path"} per garment.
+
+        Returns:
+            list[dict]: {"ok": True, "output_path"} or {"ok": False, "error"} per item, in order.
+
+        Raises:
+            RuntimeError: If the whole batch failed (e.g. the person image could not be processed).
+        """
+        reply = self._request({
+            "op": "tryon_batch",
+            "person_path": person_path,
+            "items": items,
+            "quality": quality,
+        }, on_progress)
+        if not reply.get("ok"):
+            raise RuntimeError(f"StableVITON execution failed: {reply.get('error')}")
+        return reply["results"]
@@ -22,6 +22,29 @@ import { useNavigate } from "react-router-dom";
 import { useState, useEffect, useRef } from "react";
 import "./TryOn.css";
 
+/**
+ * Follow a try-on job over server-sent events until it is finished.
+ *
+ * @param {string} jobId - ID returned by POST /tryon/jobs.
+ * @returns {Promise<Object>} The final job record (status "done", "failed" or "not_found").
+ */
+const waitForTryOnJob = (jobId) => new Promise((resolve, reject) => {
+    const source = new EventSource(`http://localhost:5000/tryon/jobs/stream?ids=${jobId}`);
+    source.addEventListener("job", (e) => {
+        const job = JSON.parse(e.data);
+        if (["done", "failed", "not_found"].includes(job.status)) {
+            source.close();
+            resolve(job);
+        }
+    });
+    source.onerror = () => {
+        // EventSource reconnects by itself unless the connection is closed for good
+        if (source.readyState === EventSource.CLOSED) {
+            reject(new Error("Lost connection to the try-on service"));
+        }
+    };
+});
+
 /**
  * TryOn component allows users to preview clothing on their own image, manage closet, and save looks.
  *
@@ -96,8 +119,12 @@ function TryOn({ username, userId, uploadedImage, setUploadedImage, resultImage,
         loadingMessage.style.color = '#fff';
         loadingMessage.style.zIndex = '9999'; // ensure the message is on top of other elements
         document.body.appendChild(loadingMessage);
+        const hideLoading = () => {
+            if (loadingMessage.parentNode) document.body.removeChild(loadingMessage);
+        };
         try {
-            const response = await fetch("http://localhost:5000/process_image", {
+            // Queue the try-on; the response comes back at once with a job ID
+            const response = await fetch("http://localhost:5000/tryon/jobs", {
                 method: "POST",
                 headers: {
                     "Content-Type": "application/json",
@@ -111,23 +138,40 @@ function TryOn({ username, userId, uploadedImage, setUploadedImage, resultImage,
                     item_category:itemCategory
                 }),
             });
-            document.body.removeChild(loadingMessage);
-            // After consideration: there is no waiting ui for the user to pick the clothes
             const result = await response.json();
 
             if(!response.ok) {
-                
-                window.alert("failed to generate"); // alert 
+                hideLoading();
+                if (response.status === 429) {
+                    window.alert(`The try-on service is busy, please retry in ${result.retry_after} seconds`);
+                } else {
+                    window.alert("failed to generate"); // alert
+                }
+                return;
+            }
+
+            // Not cached: show the catalog's model try-on image right away,
+            // then swap in the personalized result when the job is done
+            let job = result;
+            if (result.status !== "done") {
+                if (result.preview_url) {
+                    setResultImage(result.preview_url);
+                    loadingMessage.textContent = "Showing a catalog preview while your try-on is being generated...";
+                }
+                job = await waitForTryOnJob(result.job_id);
+            }
+            hideLoading();
+            if (job.status !== "done") {
+                window.alert("failed to generate"); // alert
                 return;
-            } 
-            
-            // TODO: change resultImage into stable-viton result
+            }
+
             //tips: use "`" to represent the result instead of '' or " "
-            const uploadedImager = `/show_image/${userId}/${result.image_path}`;
+            const uploadedImager = `/show_image/${userId}/${job.image_path}`;
             setResultImage(uploadedImager);
     
         } catch (error) {
-            document.body.removeChild(loadingMessage);
+            hideLoading();
             window.alert(error.message);
         } finally {
             setIsGenerating(false); // re-enable the button